@@ -9,18 +9,22 @@ from services import (
     create_packshot,
     enhance_prompt,
     generative_fill,
+    generative_fill_cropped,
+    tiled_generative_fill,
+    tiled_erase_foreground,
     generate_hd_image,
     erase_foreground
 )
 from PIL import Image, ImageFilter
-import io
-import requests
-import json
 import time
 import base64
 from streamlit_drawable_canvas import st_canvas
+from streamlit_image_coordinates import streamlit_image_coordinates
 import numpy as np
 from services.erase_foreground import erase_foreground
+from services.http_client import warm_up
+from services.crop_fill import CROP_TO_MASK
+from services.masks import check_mask
 
 # Import our custom components
 from components.auth import init_session_state, require_auth, show_login_page, show_user_profile, logout
@@ -31,7 +35,14 @@ from components.interactive_ui import (
     create_interactive_sidebar, show_welcome_dashboard
 )
 from components.dashboard import show_dashboard, show_feature_tour
-from components.activity_dashboard import track_current_activity
+from components.activity_dashboard import track_current_activity, track_activity, current_user_id
+from components.background_jobs import register_background_job, show_pending_jobs
+from components.result_downloader import get_result_downloader, keep_results
+from components.preview_cache import preview_image
+from components.brush_mask import get_brush_mask, get_brush_bytes
+from components.session_store import (
+    put_session_image, get_session_image, put_session_mask, get_session_mask, get_session_bytes
+)
 
 # Configure Streamlit page
 st.set_page_config(
@@ -88,6 +99,14 @@ print(f"API Key value: {api_key if api_key else 'Not found'}")
 print(f"Current working directory: {os.getcwd()}")
 print(f".env file exists: {os.path.exists('.env')}")
 
+@st.cache_resource
+def init_http_client():
+    """Open the shared Bria API connection pool once per server process."""
+    warm_up(connections=2)
+    return True
+
+init_http_client()
+
 def initialize_session_state():
     """Initialize session state variables."""
     if 'api_key' not in st.session_state:
@@ -105,15 +124,9 @@ def initialize_session_state():
     if 'enhanced_prompt' not in st.session_state:
         st.session_state.enhanced_prompt = None
 
-def download_image(url):
-    """Download image from URL and return as bytes."""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.content
-    except Exception as e:
-        st.error(f"Error downloading image: {str(e)}")
-        return None
+def keep_result(url, image_type, prompt="", settings=None):
+    """Mirror a result locally as soon as it lands and add it to the user's history; returns its local file."""
+    return keep_results([url], image_type, prompt, settings, user_id=current_user_id())[0]
 
 def main():
     # Initialize authentication
@@ -857,6 +870,7 @@ def main():
         if st.session_state.get('user_info'):
             st.metric("Account Type", "Premium" if st.session_state.get('username') != 'demo_user' else "Demo")
             st.metric("Images Generated", st.session_state.get('images_generated', 0))
+        st.metric("Session Memory", f"{(get_session_bytes() + get_brush_bytes()) / (1024 * 1024):.1f} MB")
         
         st.markdown("---")
         st.markdown("### 🔗 Quick Links")
@@ -896,6 +910,9 @@ def main():
         st.query_params.update(current_params)
         st.session_state.active_tab = None  # Reset after use
     
+    # Progress of sync=False jobs; refreshes on its own until results land
+    show_pending_jobs()
+    
     # Display content based on selected page
     if st.session_state.current_page == 0:  # Dashboard
         if st.session_state.get('tour_completed', True):
@@ -938,6 +955,8 @@ def main():
             num_images = st.slider("Number of images", 1, 4, 1)
             aspect_ratio = st.selectbox("Aspect ratio", ["1:1", "16:9", "9:16", "4:3", "3:4"])
             enhance_img = st.checkbox("Enhance image quality", value=True)
+            run_in_background = st.checkbox("Run in background", value=False, key="gen_background",
+                                            help="Keep using the app while the images are generated")
             
             # Style options
             st.subheader("Style Options")
@@ -952,8 +971,8 @@ def main():
                 st.error("Please enter your API key in the sidebar.")
                 return
             
-            # Track activity
-            track_current_activity(
+            # Track activity, with its outcome and duration
+            with track_activity(
                 "image_generation", 
                 f"Generated image with prompt: '{prompt[:50]}...'",
                 {
@@ -963,23 +982,30 @@ def main():
                     "style": style,
                     "enhance_image": enhance_img
                 }
-            )
-                
-            with st.spinner("🎨 Generating your masterpiece..."):
+            ) as activity, st.spinner("🎨 Generating your masterpiece..."):
                 try:
                     result = generate_hd_image(
                         prompt=st.session_state.enhanced_prompt or prompt,
                         api_key=st.session_state.api_key,
                         num_results=num_images,
                         aspect_ratio=aspect_ratio if aspect_ratio is not None else "1:1",
-                        sync=True,
+                        sync=not run_in_background,
                         enhance_image=enhance_img,
                         medium="art" if style != "Realistic" else "photography",
                         prompt_enhancement=False,
                         content_moderation=True
                     )
                     
-                    if result:
+                    if run_in_background:
+                        if register_background_job(
+                            result, 'generated_images', f"Generating {num_images} image(s)", multiple=True,
+                            image_type='generated', prompt=prompt
+                        ):
+                            st.rerun()  # Show the job's progress
+                        else:
+                            activity.fail()
+                            st.error("❌ No images found in API response.")
+                    elif result:
                         if isinstance(result, dict):
                             # Store multiple images in a list
                             generated_images = []
@@ -1007,22 +1033,34 @@ def main():
                                 generated_images.append(result["url"])
                             
                             if generated_images:
-                                st.session_state.generated_images = generated_images
+                                st.session_state.generated_images = keep_results(
+                                    generated_images, 'generated', prompt,
+                                    {"aspect_ratio": aspect_ratio, "style": style}, user_id=current_user_id()
+                                )
                                 st.session_state.edited_image = None  # Clear single image
                                 st.success(f"✨ {len(generated_images)} image(s) generated successfully!")
                                 st.rerun()  # Force rerun to display images
                             else:
+                                activity.fail()
                                 st.error("❌ No images found in API response.")
                         else:
+                            activity.fail()
                             st.error("❌ Invalid API response format.")
+                    else:
+                        activity.fail()
                             
                 except Exception as e:
+                    activity.fail()
                     st.error(f"Error generating images: {str(e)}")
         
         # Display generated images if available
         if st.session_state.get('generated_images') and len(st.session_state.generated_images) > 0:
             st.markdown("### 🖼️ Generated Images")
             
+            # Fetch all results in parallel; download buttons read them lazily on click
+            downloader = get_result_downloader()
+            downloader.prefetch(st.session_state.generated_images)
+            
             # Display images in a collage based on count
             num_imgs = len(st.session_state.generated_images)
             
@@ -1032,15 +1070,13 @@ def main():
                 with col1:
                     st.image(st.session_state.generated_images[0], caption="Generated Image 1", use_column_width=True)
                 with col2:
-                    image_data = download_image(st.session_state.generated_images[0])
-                    if image_data:
-                        st.download_button(
-                            "⬇️ Download",
-                            image_data,
-                            "generated_image_1.png",
-                            "image/png",
-                            use_container_width=True
-                        )
+                    st.download_button(
+                        "⬇️ Download",
+                        downloader.lazy(st.session_state.generated_images[0]),
+                        "generated_image_1.png",
+                        "image/png",
+                        use_container_width=True
+                    )
             
             elif num_imgs == 2:
                 # Two images side by side
@@ -1048,16 +1084,14 @@ def main():
                 for idx, img_url in enumerate(st.session_state.generated_images):
                     with cols[idx]:
                         st.image(img_url, caption=f"Generated Image {idx + 1}", use_column_width=True)
-                        image_data = download_image(img_url)
-                        if image_data:
-                            st.download_button(
-                                f"⬇️ Download {idx + 1}",
-                                image_data,
-                                f"generated_image_{idx + 1}.png",
-                                "image/png",
-                                use_container_width=True,
-                                key=f"download_{idx}"
-                            )
+                        st.download_button(
+                            f"⬇️ Download {idx + 1}",
+                            downloader.lazy(img_url),
+                            f"generated_image_{idx + 1}.png",
+                            "image/png",
+                            use_container_width=True,
+                            key=f"download_{idx}"
+                        )
             
             elif num_imgs == 3:
                 # Three images - 2 on top, 1 on bottom
@@ -1065,31 +1099,27 @@ def main():
                 for idx in range(2):
                     with cols_top[idx]:
                         st.image(st.session_state.generated_images[idx], caption=f"Generated Image {idx + 1}", use_column_width=True)
-                        image_data = download_image(st.session_state.generated_images[idx])
-                        if image_data:
-                            st.download_button(
-                                f"⬇️ Download {idx + 1}",
-                                image_data,
-                                f"generated_image_{idx + 1}.png",
-                                "image/png",
-                                use_container_width=True,
-                                key=f"download_{idx}"
-                            )
+                        st.download_button(
+                            f"⬇️ Download {idx + 1}",
+                            downloader.lazy(st.session_state.generated_images[idx]),
+                            f"generated_image_{idx + 1}.png",
+                            "image/png",
+                            use_container_width=True,
+                            key=f"download_{idx}"
+                        )
                 
                 # Bottom image centered
                 col_left, col_center, col_right = st.columns([1, 2, 1])
                 with col_center:
                     st.image(st.session_state.generated_images[2], caption="Generated Image 3", use_column_width=True)
-                    image_data = download_image(st.session_state.generated_images[2])
-                    if image_data:
-                        st.download_button(
-                            "⬇️ Download 3",
-                            image_data,
-                            "generated_image_3.png",
-                            "image/png",
-                            use_container_width=True,
-                            key="download_2"
-                        )
+                    st.download_button(
+                        "⬇️ Download 3",
+                        downloader.lazy(st.session_state.generated_images[2]),
+                        "generated_image_3.png",
+                        "image/png",
+                        use_container_width=True,
+                        key="download_2"
+                    )
             
             else:  # 4 images
                 # Four images in 2x2 grid
@@ -1097,31 +1127,27 @@ def main():
                 for idx in range(2):
                     with cols_top[idx]:
                         st.image(st.session_state.generated_images[idx], caption=f"Generated Image {idx + 1}", use_column_width=True)
-                        image_data = download_image(st.session_state.generated_images[idx])
-                        if image_data:
-                            st.download_button(
-                                f"⬇️ Download {idx + 1}",
-                                image_data,
-                                f"generated_image_{idx + 1}.png",
-                                "image/png",
-                                use_container_width=True,
-                                key=f"download_{idx}"
-                            )
+                        st.download_button(
+                            f"⬇️ Download {idx + 1}",
+                            downloader.lazy(st.session_state.generated_images[idx]),
+                            f"generated_image_{idx + 1}.png",
+                            "image/png",
+                            use_container_width=True,
+                            key=f"download_{idx}"
+                        )
                 
                 cols_bottom = st.columns(2)
                 for idx in range(2, 4):
                     with cols_bottom[idx - 2]:
                         st.image(st.session_state.generated_images[idx], caption=f"Generated Image {idx + 1}", use_column_width=True)
-                        image_data = download_image(st.session_state.generated_images[idx])
-                        if image_data:
-                            st.download_button(
-                                f"⬇️ Download {idx + 1}",
-                                image_data,
-                                f"generated_image_{idx + 1}.png",
-                                "image/png",
-                                use_container_width=True,
-                                key=f"download_{idx}"
-                            )
+                        st.download_button(
+                            f"⬇️ Download {idx + 1}",
+                            downloader.lazy(st.session_state.generated_images[idx]),
+                            f"generated_image_{idx + 1}.png",
+                            "image/png",
+                            use_container_width=True,
+                            key=f"download_{idx}"
+                        )
             
             # Clear all images button
             st.markdown("---")
@@ -1140,15 +1166,13 @@ def main():
             
             with col2:
                 # Download button
-                image_data = download_image(st.session_state.edited_image)
-                if image_data:
-                    st.download_button(
-                        "⬇️ Download Image",
-                        image_data,
-                        "generated_image.png",
-                        "image/png",
-                        use_container_width=True
-                    )
+                st.download_button(
+                    "⬇️ Download Image",
+                    get_result_downloader().lazy(st.session_state.edited_image),
+                    "generated_image.png",
+                    "image/png",
+                    use_container_width=True
+                )
                 
                 # Clear image button
                 if st.button("🗑️ Clear Image", use_container_width=True):
@@ -1169,9 +1193,10 @@ def main():
         if uploaded_file:
             # Store uploaded image in session state
             if 'editor_image' not in st.session_state or st.session_state.get('editor_image_name') != uploaded_file.name:
-                st.session_state.editor_image = uploaded_file.getvalue()
+                put_session_image('editor_image', uploaded_file.getvalue(), uploaded_file.name)
                 st.session_state.editor_image_name = uploaded_file.name
                 st.session_state.editor_result = None
+            editor_image = get_session_image('editor_image', uploaded_file)
             
             # Display original image
             st.markdown("---")
@@ -1179,8 +1204,7 @@ def main():
             
             with col_img:
                 st.markdown("#### 🖼️ Your Image")
-                img = Image.open(io.BytesIO(st.session_state.editor_image))
-                st.image(img, use_column_width=True)
+                st.image(preview_image(editor_image), use_column_width=True)
                 
                 # Show result if available
                 if st.session_state.get('editor_result'):
@@ -1188,15 +1212,13 @@ def main():
                     st.image(st.session_state.editor_result, use_column_width=True)
                     
                     # Download result
-                    result_data = download_image(st.session_state.editor_result)
-                    if result_data:
-                        st.download_button(
-                            "⬇️ Download Result",
-                            result_data,
-                            "edited_image.png",
-                            "image/png",
-                            use_container_width=True
-                        )
+                    st.download_button(
+                        "⬇️ Download Result",
+                        get_result_downloader().lazy(st.session_state.editor_result),
+                        "edited_image.png",
+                        "image/png",
+                        use_container_width=True
+                    )
             
             with col_tools:
                 st.markdown("#### 🛠️ Editing Tools")
@@ -1228,12 +1250,12 @@ def main():
                                 try:
                                     result = create_packshot(
                                         st.session_state.api_key,
-                                        st.session_state.editor_image,
+                                        editor_image,
                                         background_color=bg_color,
                                         force_rmbg=force_rmbg
                                     )
                                     if result and "result_url" in result:
-                                        st.session_state.editor_result = result["result_url"]
+                                        st.session_state.editor_result = keep_result(result["result_url"], 'packshot')
                                         st.success("✨ Packshot created!")
                                         st.rerun()
                                 except Exception as e:
@@ -1253,13 +1275,13 @@ def main():
                                 try:
                                     result = add_shadow(
                                         api_key=st.session_state.api_key,
-                                        image_data=st.session_state.editor_image,
+                                        image_data=editor_image,
                                         shadow_type=shadow_type.lower(),
                                         background_color=bg_color,
                                         shadow_intensity=shadow_intensity
                                     )
                                     if result and "result_url" in result:
-                                        st.session_state.editor_result = result["result_url"]
+                                        st.session_state.editor_result = keep_result(result["result_url"], 'shadow')
                                         st.success("✨ Shadow added!")
                                         st.rerun()
                                 except Exception as e:
@@ -1291,13 +1313,13 @@ def main():
                                 try:
                                     result = generative_fill(
                                         api_key=st.session_state.api_key,
-                                        image_data=st.session_state.editor_image,
+                                        image_data=editor_image,
                                         mask_data=mask_file.getvalue(),
                                         prompt=fill_prompt,
                                         sync=True
                                     )
                                     if result and "result_url" in result:
-                                        st.session_state.editor_result = result["result_url"]
+                                        st.session_state.editor_result = keep_result(result["result_url"], 'generative_fill', fill_prompt)
                                         st.success("✨ Fill generated!")
                                         st.rerun()
                                 except Exception as e:
@@ -1315,10 +1337,10 @@ def main():
                                 try:
                                     result = erase_foreground(
                                         api_key=st.session_state.api_key,
-                                        image_data=st.session_state.editor_image
+                                        image_data=editor_image
                                     )
                                     if result and "result_url" in result:
-                                        st.session_state.editor_result = result["result_url"]
+                                        st.session_state.editor_result = keep_result(result["result_url"], 'erase_foreground')
                                         st.success("✨ Foreground erased!")
                                         st.rerun()
                                 except Exception as e:
@@ -1337,12 +1359,12 @@ def main():
                                 try:
                                     result = create_packshot(
                                         st.session_state.api_key,
-                                        st.session_state.editor_image,
+                                        editor_image,
                                         background_color="transparent",
                                         force_rmbg=True
                                     )
                                     if result and "result_url" in result:
-                                        st.session_state.editor_result = result["result_url"]
+                                        st.session_state.editor_result = keep_result(result["result_url"], 'remove_background')
                                         st.success("✨ Background removed!")
                                         st.rerun()
                                 except Exception as e:
@@ -1413,16 +1435,18 @@ def main():
         )
         
         if uploaded_file:
-            # Track file upload activity
-            track_current_activity(
-                "feature_usage",
-                "Uploaded product image",
-                {
-                    "file_name": uploaded_file.name,
-                    "file_size": uploaded_file.size,
-                    "file_type": uploaded_file.type
-                }
-            )
+            # Track file upload activity, once per upload rather than on every rerun
+            if st.session_state.get('tracked_product_upload') != uploaded_file.file_id:
+                st.session_state.tracked_product_upload = uploaded_file.file_id
+                track_current_activity(
+                    "feature_usage",
+                    "Uploaded product image",
+                    {
+                        "file_name": uploaded_file.name,
+                        "file_size": uploaded_file.size,
+                        "file_type": uploaded_file.type
+                    }
+                )
             col1, col2 = st.columns(2)
             
             with col1:
@@ -1445,8 +1469,8 @@ def main():
                         content_moderation = st.checkbox("Enable Content Moderation", False)
                     
                     if st.button("🎯 Create Packshot", type="primary"):
-                        # Track activity
-                        track_current_activity(
+                        # Track activity, with its outcome and duration
+                        with track_activity(
                             "image_editing",
                             "Created packshot",
                             {
@@ -1454,9 +1478,7 @@ def main():
                                 "background_color": bg_color,
                                 "force_rmbg": force_rmbg
                             }
-                        )
-                        
-                        with st.spinner("Creating professional packshot..."):
+                        ) as activity, st.spinner("Creating professional packshot..."):
                             try:
                                 result = create_packshot(
                                     st.session_state.api_key,
@@ -1469,10 +1491,12 @@ def main():
                                 
                                 if result and "result_url" in result:
                                     st.success("✨ Packshot created successfully!")
-                                    st.session_state.edited_image = result["result_url"]
+                                    st.session_state.edited_image = keep_result(result["result_url"], 'packshot')
                                 else:
+                                    activity.fail()
                                     st.error("No result URL in the API response. Please try again.")
                             except Exception as e:
+                                activity.fail()
                                 st.error(f"Error creating packshot: {str(e)}")
                 
                 elif edit_option == "Add Shadow":
@@ -1487,8 +1511,8 @@ def main():
                         content_moderation = st.checkbox("Enable Content Moderation", False)
                     
                     if st.button("🌟 Add Shadow", type="primary"):
-                        # Track activity
-                        track_current_activity(
+                        # Track activity, with its outcome and duration
+                        with track_activity(
                             "image_editing",
                             "Added shadow effect",
                             {
@@ -1496,9 +1520,7 @@ def main():
                                 "shadow_type": shadow_type,
                                 "shadow_intensity": shadow_intensity
                             }
-                        )
-                        
-                        with st.spinner("Adding shadow effect..."):
+                        ) as activity, st.spinner("Adding shadow effect..."):
                             try:
                                 result = add_shadow(
                                     api_key=st.session_state.api_key,
@@ -1513,23 +1535,23 @@ def main():
                                 
                                 if result and "result_url" in result:
                                     st.success("✨ Shadow added successfully!")
-                                    st.session_state.edited_image = result["result_url"]
+                                    st.session_state.edited_image = keep_result(result["result_url"], 'shadow')
                                 else:
+                                    activity.fail()
                                     st.error("No result URL in the API response. Please try again.")
                             except Exception as e:
+                                activity.fail()
                                 st.error(f"Error adding shadow: {str(e)}")
             
             with col2:
                 if st.session_state.edited_image:
                     st.image(st.session_state.edited_image, caption="Edited Image", use_column_width=True)
-                    image_data = download_image(st.session_state.edited_image)
-                    if image_data:
-                        st.download_button(
-                            "⬇️ Download Result",
-                            image_data,
-                            "edited_product.png",
-                            "image/png"
-                        )
+                    st.download_button(
+                        "⬇️ Download Result",
+                        get_result_downloader().lazy(st.session_state.edited_image),
+                        "edited_product.png",
+                        "image/png"
+                    )
     
     elif st.session_state.current_page == 4:  # Generative Fill
         st.markdown("### 🎨 Generative Fill")
@@ -1545,11 +1567,12 @@ def main():
         if uploaded_file:
             # Store image in session state
             if 'gf_uploaded_image' not in st.session_state or st.session_state.get('gf_image_name') != uploaded_file.name:
-                st.session_state.gf_uploaded_image = uploaded_file.getvalue()
+                put_session_image('gf_uploaded_image', uploaded_file.getvalue(), uploaded_file.name)
                 st.session_state.gf_image_name = uploaded_file.name
                 st.session_state.generative_fill_result = None
-            # Open and display the image
-            img = Image.open(io.BytesIO(st.session_state.gf_uploaded_image))
+            gf_image = get_session_image('gf_uploaded_image', uploaded_file)
+            # Display-size preview, decoded and downscaled once per upload
+            img = preview_image(gf_image)
             
             st.markdown("---")
             
@@ -1563,7 +1586,7 @@ def main():
                 # Download button for creating mask externally
                 st.download_button(
                     "⬇️ Download Image (to create mask)",
-                    st.session_state.gf_uploaded_image,
+                    gf_image.data,
                     f"original_{st.session_state.gf_image_name}",
                     "image/png",
                     help="Download to create a mask in Paint/Photoshop"
@@ -1595,14 +1618,9 @@ def main():
                     # Show original image
                     st.image(img, caption="Original Image", use_column_width=True)
                     
-                    # Initialize empty mask
-                    if 'gf_mask_image' not in st.session_state:
-                        st.session_state.gf_mask_image = Image.new('L', img.size, 0)
-                    
-                    # Convert mask to file for API
-                    mask_buffer = io.BytesIO()
-                    st.session_state.gf_mask_image.save(mask_buffer, format='PNG')
-                    mask_file = mask_buffer.getvalue()
+                    # Bit-packed in session state; empty until one is drawn
+                    drawn_mask = get_session_mask('gf_mask_image', gf_image.size)
+                    mask_file = None if drawn_mask.is_empty else drawn_mask.payload
                     
                 else:  # Upload Mask
                     st.info("💡 Upload a mask: **white areas** = fill with AI, **black areas** = keep original")
@@ -1615,9 +1633,17 @@ def main():
                     )
                     
                     if mask_file_upload:
-                        mask_img = Image.open(mask_file_upload)
-                        st.image(mask_img, caption="Your Mask", use_column_width=True)
-                        mask_file = mask_file_upload.getvalue()
+                        st.image(preview_image(mask_file_upload.getvalue()), caption="Your Mask", use_column_width=True)
+                        try:
+                            # Catch unusable masks here instead of in an API round trip
+                            mask = put_session_mask(
+                                'gf_upload_mask', mask_file_upload.getvalue(), source=mask_file_upload.file_id
+                            )
+                            check_mask(mask)
+                            mask_file = mask.payload
+                        except ValueError as e:
+                            st.error(f"❌ {e}")
+                            mask_file = None
                     else:
                         st.markdown("""
                         **How to create a mask:**
@@ -1640,6 +1666,18 @@ def main():
                 )
                 
                 sync_mode = st.checkbox("Wait for result", value=True, key="gf_sync")
+                crop_mode = st.checkbox(
+                    "✂️ Send only the masked area",
+                    value=CROP_TO_MASK,
+                    key="gf_crop",
+                    help="Faster for small edits: only the masked region is generated and blended back in"
+                )
+                tiled_mode = st.checkbox(
+                    "🧩 Full resolution (tiled)",
+                    value=False,
+                    key="gf_tiled",
+                    help="Process large images tile by tile instead of downscaling them"
+                )
                 
                 st.markdown("---")
             
@@ -1655,15 +1693,13 @@ def main():
                     st.image(st.session_state.generative_fill_result, caption="Generated", use_column_width=True)
                 with result_cols[2]:
                     # Download button
-                    result_data = download_image(st.session_state.generative_fill_result)
-                    if result_data:
-                        st.download_button(
-                            "⬇️ Download Result",
-                            result_data,
-                            "generative_fill_result.png",
-                            "image/png",
-                            use_container_width=True
-                        )
+                    st.download_button(
+                        "⬇️ Download Result",
+                        get_result_downloader().lazy(st.session_state.generative_fill_result),
+                        "generative_fill_result.png",
+                        "image/png",
+                        use_container_width=True
+                    )
                     
                     if st.button("🔄 New Edit", use_container_width=True):
                         st.session_state.generative_fill_result = None
@@ -1677,7 +1713,7 @@ def main():
             mask_data = None
             
             if mask_method == "✏️ Draw on Page":
-                if 'gf_mask_image' in st.session_state:
+                if mask_file is not None:
                     has_mask = True
                     mask_data = mask_file
             else:  # Upload method
@@ -1694,9 +1730,13 @@ def main():
                     else:
                         with st.spinner("🎨 Generating fill content..."):
                             try:
-                                result = generative_fill(
+                                if tiled_mode:
+                                    fill = tiled_generative_fill
+                                else:
+                                    fill = generative_fill_cropped if crop_mode else generative_fill
+                                result = fill(
                                     api_key=st.session_state.api_key,
-                                    image_data=st.session_state.gf_uploaded_image,
+                                    image_data=gf_image,
                                     mask_data=mask_data,
                                     prompt=prompt,
                                     num_results=1,
@@ -1706,7 +1746,12 @@ def main():
                                 # Try multiple response formats
                                 result_url = None
                                 
-                                if result:
+                                if not sync_mode and register_background_job(
+                                    result, 'generative_fill_result', "Generative fill",
+                                    image_type='generative_fill', prompt=prompt
+                                ):
+                                    st.rerun()  # Show the job's progress
+                                elif result:
                                     # Format 1: Direct result_url
                                     if "result_url" in result:
                                         result_url = result["result_url"]
@@ -1724,7 +1769,7 @@ def main():
                                         result_url = result["urls"][0]
                                 
                                 if result_url:
-                                    st.session_state.generative_fill_result = result_url
+                                    st.session_state.generative_fill_result = keep_result(result_url, 'generative_fill', prompt)
                                     st.success("✨ Generative fill completed!")
                                     st.rerun()
                                 else:
@@ -1781,6 +1826,12 @@ def main():
             with col2:
                 st.markdown("#### ⚙️ Settings")
                 content_mod = st.checkbox("Enable content moderation", value=True, key="erase_content_mod")
+                tiled_mode = st.checkbox(
+                    "🧩 Full resolution (tiled)",
+                    value=False,
+                    key="erase_auto_tiled",
+                    help="Process large images tile by tile instead of downscaling them"
+                )
             
             if uploaded_file:
                 st.markdown("---")
@@ -1789,23 +1840,20 @@ def main():
                 col_a, col_b = st.columns(2)
                 
                 with col_a:
-                    img = Image.open(uploaded_file)
-                    st.image(img, caption="Original Image", use_column_width=True)
+                    st.image(preview_image(uploaded_file.getvalue()), caption="Original Image", use_column_width=True)
                 
                 with col_b:
                     if st.session_state.get('erase_result'):
                         st.image(st.session_state.erase_result, caption="Foreground Removed", use_column_width=True)
                         
                         # Download button
-                        image_data = download_image(st.session_state.erase_result)
-                        if image_data:
-                            st.download_button(
-                                "⬇️ Download Result",
-                                image_data,
-                                "erase_result.png",
-                                "image/png",
-                                use_container_width=True
-                            )
+                        st.download_button(
+                            "⬇️ Download Result",
+                            get_result_downloader().lazy(st.session_state.erase_result),
+                            "erase_result.png",
+                            "image/png",
+                            use_container_width=True
+                        )
                     else:
                         st.info("Result will appear here after processing")
                 
@@ -1817,7 +1865,8 @@ def main():
                     else:
                         with st.spinner("🗑️ Removing foreground objects..."):
                             try:
-                                result = erase_foreground(
+                                erase = tiled_erase_foreground if tiled_mode else erase_foreground
+                                result = erase(
                                     api_key=st.session_state.api_key,
                                     image_data=uploaded_file.getvalue(),
                                     content_moderation=content_mod
@@ -1840,7 +1889,7 @@ def main():
                                         result_url = result["urls"][0]
                                 
                                 if result_url:
-                                    st.session_state.erase_result = result_url
+                                    st.session_state.erase_result = keep_result(result_url, 'erase_foreground')
                                     st.success("✨ Foreground objects removed successfully!")
                                     st.rerun()
                                 else:
@@ -1864,12 +1913,13 @@ def main():
             if uploaded_file:
                 # Store image in session state
                 if 'erase_uploaded_image' not in st.session_state or st.session_state.get('erase_image_name') != uploaded_file.name:
-                    st.session_state.erase_uploaded_image = uploaded_file.getvalue()
+                    put_session_image('erase_uploaded_image', uploaded_file.getvalue(), uploaded_file.name)
                     st.session_state.erase_image_name = uploaded_file.name
                     st.session_state.erase_manual_result = None
+                erase_image = get_session_image('erase_uploaded_image', uploaded_file)
                 
-                # Open image
-                img = Image.open(io.BytesIO(st.session_state.erase_uploaded_image))
+                # Display-size preview, decoded and downscaled once per upload
+                img = preview_image(erase_image)
                 
                 st.markdown("---")
                 
@@ -1882,27 +1932,60 @@ def main():
                 
                 with col2:
                     st.markdown("#### 🎭 Draw Mask")
-                    st.warning("⚠️ Canvas drawing unavailable due to compatibility issues.")
-                    st.info("💡 Create mask in external tool and upload below:")
-                    
-                    # Mask upload
-                    mask_file = st.file_uploader(
-                        "📤 Upload Mask",
-                        type=["png", "jpg", "jpeg"],
-                        key="erase_mask_file",
-                        help="White = erase, Black = keep"
+                    mask_source = st.radio(
+                        "Mask source",
+                        ["🖌️ Brush", "📤 Upload Mask"],
+                        horizontal=True,
+                        key="erase_mask_source",
+                        label_visibility="collapsed"
                     )
+                    brush = get_brush_mask('erase_brush', erase_image) if mask_source == "🖌️ Brush" else None
+                    mask_file = None
                     
-                    if mask_file:
-                        mask_img = Image.open(mask_file).convert('L')
-                        if mask_img.size != img.size:
-                            mask_img = mask_img.resize(img.size, Image.Resampling.LANCZOS)
-                        st.session_state.erase_mask_image = mask_img
-                        st.image(mask_img, caption="Uploaded Mask", use_column_width=True)
+                    if brush is not None:
+                        brush_radius = st.slider("Brush size", 2, 100, 15, key="erase_brush_radius")
+                        # Clicks land on the preview; only the new stroke's box is redrawn
+                        click = streamlit_image_coordinates(
+                            brush.overlay(),
+                            key="erase_brush_canvas",
+                            use_column_width="always",
+                            image_format="JPEG"
+                        )
+                        if click and click.get('unix_time') != st.session_state.get('erase_brush_click'):
+                            st.session_state.erase_brush_click = click.get('unix_time')
+                            scale = brush.preview_size[0] / click['width']
+                            brush.add_from_preview(click['x'] * scale, click['y'] * scale, brush_radius)
+                            st.rerun()
+                        undo_col, clear_col = st.columns(2)
+                        if undo_col.button("↩️ Undo", use_container_width=True, disabled=not len(brush)):
+                            brush.undo()
+                            st.rerun()
+                        if clear_col.button("🧹 Clear", use_container_width=True, disabled=not len(brush)):
+                            brush.clear()
+                            st.rerun()
+                        st.caption(f"{len(brush)} stroke(s)")
                     else:
+                        # Mask upload
+                        mask_file = st.file_uploader(
+                            "📤 Upload Mask",
+                            type=["png", "jpg", "jpeg"],
+                            key="erase_mask_file",
+                            help="White = erase, Black = keep"
+                        )
+                    
+                    if mask_file:
+                        try:
+                            # Binarized, fitted to the image and bit-packed once per upload
+                            mask = put_session_mask(
+                                'erase_mask_image', mask_file.getvalue(), erase_image.size, source=mask_file.file_id
+                            )
+                            check_mask(mask)
+                        except ValueError as e:
+                            st.error(f"❌ {e}")
+                        else:
+                            st.image(preview_image(mask.payload), caption="Uploaded Mask", use_column_width=True)
+                    elif brush is None:
                         st.image(img, caption="Original (for reference)", use_column_width=True)
-                        if 'erase_mask_image' not in st.session_state:
-                            st.session_state.erase_mask_image = Image.new('L', img.size, 0)
                 
                 with col3:
                     st.markdown("#### ⚙️ Settings")
@@ -1914,6 +1997,18 @@ def main():
                     )
                     
                     sync_mode = st.checkbox("Wait for result", value=True, key="erase_sync")
+                    crop_mode = st.checkbox(
+                        "✂️ Send only the masked area",
+                        value=CROP_TO_MASK,
+                        key="erase_crop",
+                        help="Faster for small edits: only the masked region is generated and blended back in"
+                    )
+                    tiled_mode = st.checkbox(
+                        "🧩 Full resolution (tiled)",
+                        value=False,
+                        key="erase_tiled",
+                        help="Process large images tile by tile instead of downscaling them"
+                    )
                 
                 # Show result
                 if st.session_state.get('erase_manual_result'):
@@ -1926,15 +2021,13 @@ def main():
                     with result_cols[1]:
                         st.image(st.session_state.erase_manual_result, caption="Erased", use_column_width=True)
                     with result_cols[2]:
-                        result_data = download_image(st.session_state.erase_manual_result)
-                        if result_data:
-                            st.download_button(
-                                "⬇️ Download",
-                                result_data,
-                                "erase_result.png",
-                                "image/png",
-                                use_container_width=True
-                            )
+                        st.download_button(
+                            "⬇️ Download",
+                            get_result_downloader().lazy(st.session_state.erase_manual_result),
+                            "erase_result.png",
+                            "image/png",
+                            use_container_width=True
+                        )
                         if st.button("🔄 New Edit", use_container_width=True):
                             st.session_state.erase_manual_result = None
                             st.rerun()
@@ -1942,10 +2035,10 @@ def main():
                 # Generate button
                 st.markdown("---")
                 
-                # Convert mask to bytes
-                mask_buffer = io.BytesIO()
-                st.session_state.erase_mask_image.save(mask_buffer, format='PNG')
-                mask_data = mask_buffer.getvalue()
+                if brush is not None:
+                    mask_data = brush.to_png()
+                else:
+                    mask_data = get_session_mask('erase_mask_image', erase_image.size).payload
                 
                 if st.button("🗑️ Erase & Fill", type="primary", use_container_width=True, key="erase_generate"):
                     if not st.session_state.api_key:
@@ -1953,22 +2046,30 @@ def main():
                     else:
                         with st.spinner("🗑️ Erasing and filling..."):
                             try:
-                                result = generative_fill(
+                                if tiled_mode:
+                                    fill = tiled_generative_fill
+                                else:
+                                    fill = generative_fill_cropped if crop_mode else generative_fill
+                                result = fill(
                                     api_key=st.session_state.api_key,
-                                    image_data=st.session_state.erase_uploaded_image,
+                                    image_data=erase_image,
                                     mask_data=mask_data,
                                     prompt=prompt if prompt else "natural background",
                                     num_results=1,
                                     sync=sync_mode
                                 )
                                 
-                                if result and "result_url" in result:
-                                    st.session_state.erase_manual_result = result["result_url"]
+                                if not sync_mode and register_background_job(
+                                    result, 'erase_manual_result', "Erase & fill", image_type='erase'
+                                ):
+                                    st.rerun()  # Show the job's progress
+                                elif result and "result_url" in result:
+                                    st.session_state.erase_manual_result = keep_result(result["result_url"], 'erase')
                                     st.success("✨ Area erased successfully!")
                                     st.rerun()
                                 elif result and "result" in result and isinstance(result["result"], list):
                                     if len(result["result"]) > 0 and "urls" in result["result"][0]:
-                                        st.session_state.erase_manual_result = result["result"][0]["urls"][0]
+                                        st.session_state.erase_manual_result = keep_result(result["result"][0]["urls"][0], 'erase')
                                         st.success("✨ Area erased successfully!")
                                         st.rerun()
                                 else:
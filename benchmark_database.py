@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the per-user history queries on a large activity log
+
+Fills a scratch database with activity rows spread over many users, then
+times get_user_activities() with the history index and again without it.
+
+Usage: python benchmark_database.py [--rows 10000000] [--users 10000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from components.database import DatabaseManager
+
+ACTIVITY_TYPES = ("image_generation", "image_editing", "feature_usage", "authentication")
+
+def fill_activity_logs(db: DatabaseManager, rows: int, users: int, chunk: int = 200000):
+    """Insert rows activities, oldest first, each by a random user."""
+    rng = random.Random(0)
+    start = time.mktime((2020, 1, 1, 0, 0, 0, 0, 0, -1))
+    step = (time.time() - start) / rows
+    conn = db.get_connection()
+    for offset in range(0, rows, chunk):
+        batch = []
+        for i in range(offset, min(rows, offset + chunk)):
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start + i * step))
+            activity_type = ACTIVITY_TYPES[i % len(ACTIVITY_TYPES)]
+            batch.append((rng.randrange(1, users + 1), activity_type, f"Benchmark {activity_type}", timestamp))
+        with conn:
+            conn.executemany('''
+                INSERT INTO activity_logs (user_id, activity_type, activity_description, timestamp)
+                VALUES (?, ?, ?, ?)
+            ''', batch)
+        print(f"\r   {min(rows, offset + chunk):,} / {rows:,} rows", end="", flush=True)
+    print()
+
+def time_queries(db: DatabaseManager, user_ids, limit: int = 50):
+    """Latency in milliseconds of get_user_activities() for each user."""
+    latencies = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        db.get_user_activities(user_id, limit=limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+def report(label: str, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"   {label:<16} median {statistics.median(latencies):9.2f} ms   p95 {p95:9.2f} ms   ({len(latencies)} queries)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000000, help="activity rows to insert")
+    parser.add_argument("--users", type=int, default=10000, help="distinct users the rows belong to")
+    parser.add_argument("--queries", type=int, default=200, help="indexed queries to time")
+    parser.add_argument("--scans", type=int, default=5, help="unindexed queries to time (each scans the table)")
+    parser.add_argument("--path", help="database file (default: a temporary file)")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    print("📊 AdSnap Studio Database Benchmark")
+    print("=" * 50)
+    print(f"\n1. Filling {path}...")
+    db = DatabaseManager(path)
+    started = time.perf_counter()
+    fill_activity_logs(db, args.rows, args.users)
+    print(f"   Inserted in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(1)
+    conn = db.get_connection()
+    print("\n2. Timing get_user_activities(limit=50)...")
+    report("with index", time_queries(db, [rng.randrange(1, args.users + 1) for _ in range(args.queries)]))
+    conn.execute("DROP INDEX idx_activity_logs_user_time")
+    report("without index", time_queries(db, [rng.randrange(1, args.users + 1) for _ in range(args.scans)]))
+
+    started = time.perf_counter()
+    conn.execute("CREATE INDEX idx_activity_logs_user_time ON activity_logs (user_id, timestamp)")
+    print(f"   Index rebuilt in {time.perf_counter() - started:.1f}s")
+    db.close()
+    if not args.path:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+if __name__ == "__main__":
+    main()
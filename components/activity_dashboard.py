@@ -1,55 +1,198 @@
+import html
+import time
 import streamlit as st
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import random
 
-def show_real_time_activities():
-    """Display real-time user activities."""
+from components.activity_writer import get_activity_writer
+from components.database import get_database_manager
+
+ACTIVITY_ICONS = {
+    'image_generation': "🎨",
+    'image_editing': "✨",
+    'feature_usage': "🧰",
+    'project_management': "📁",
+    'authentication': "🔑"
+}
+
+def _time_ago(timestamp: str) -> str:
+    """Describe a stored UTC timestamp relative to now."""
+    try:
+        then = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return timestamp or ""
+    seconds = max(0, int((datetime.utcnow() - then).total_seconds()))
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{seconds // 60} minutes ago"
+    if seconds < 86400:
+        return f"{seconds // 3600} hours ago"
+    return then.strftime('%d %b %Y')
+
+def _history_page(key: str, fetch):
+    """
+    The page of a history feed the session is looking at.
+
+    Only the cursors of the pages opened so far are kept, so moving through
+    years of history costs one indexed query per page.
+    """
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    items, next_cursor = fetch(cursors[-1])
+    return items, next_cursor, cursors
+
+def _page_buttons(key: str, cursors, next_cursor):
+    newer_col, older_col = st.columns(2)
+    if newer_col.button("⬅️ Newer", key=f"{key}_newer", use_container_width=True, disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if older_col.button("Older ➡️", key=f"{key}_older", use_container_width=True, disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
+def show_real_time_activities(page_size: int = 5):
+    """Display the signed-in user's activities, a page at a time."""
     st.markdown("### 🔄 Recent Activities")
     
-    # Simulate recent activities
-    activities = [
-        ("Generated image", "2 minutes ago", "🎨"),
-        ("Added shadow effect", "5 minutes ago", "🌟"),
-        ("Created lifestyle shot", "10 minutes ago", "📸"),
-        ("Enhanced image quality", "15 minutes ago", "✨"),
-        ("Removed background", "20 minutes ago", "✂️")
-    ]
+    user_id = current_user_id()
+    if user_id is None:
+        st.info("Sign in to see your recent activities here.")
+        return
+    
+    db = get_database_manager()
+    activities, next_cursor, cursors = _history_page(
+        'activity_feed', lambda cursor: db.get_user_activities_page(user_id, page_size, cursor)
+    )
+    if not activities:
+        st.info("Your activities will appear here as you generate and edit images.")
+        return
     
-    for activity, time_ago, icon in activities:
+    for activity in activities:
+        icon = ACTIVITY_ICONS.get(activity['type'], "📌")
         st.markdown(f"""
         <div style="display: flex; align-items: center; padding: 0.5rem; margin: 0.25rem 0; 
                     background: rgba(102, 126, 234, 0.1); border-radius: 8px;">
             <span style="font-size: 1.5rem; margin-right: 1rem;">{icon}</span>
             <div>
-                <div style="font-weight: 500;">{activity}</div>
-                <div style="font-size: 0.8rem; color: #666;">{time_ago}</div>
+                <div style="font-weight: 500;">{html.escape(activity['description'])}</div>
+                <div style="font-size: 0.8rem; color: #666;">{_time_ago(activity['timestamp'])}</div>
             </div>
         </div>
         """, unsafe_allow_html=True)
+    
+    _page_buttons('activity_feed', cursors, next_cursor)
+
+def _seconds(latency_ms) -> str:
+    return f"{latency_ms / 1000:.1f}s" if latency_ms is not None else "—"
+
+def _percent(rate) -> str:
+    return f"{rate:.1%}" if rate is not None else "—"
 
-def show_activity_statistics():
-    """Display activity statistics."""
+def _change(current, previous, fmt):
+    """Metric delta against the previous period, or None when either is missing."""
+    if current is None or previous is None:
+        return None
+    return fmt(current - previous)
+
+def show_activity_statistics(days: int = 30):
+    """Display the signed-in user's usage over the last days, against the period before."""
     st.markdown("### 📊 Usage Statistics")
     
+    user_id = current_user_id()
+    if user_id is None:
+        st.info("Sign in to see your usage statistics here.")
+        return
+    
+    db = get_database_manager()
+    current = db.get_usage_summary(user_id, days)
+    previous = db.get_usage_summary(user_id, days, offset_days=days)
+    generation = current['by_type'].get('image_generation', {})
+    previous_generation = previous['by_type'].get('image_generation', {})
+    
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("Images Generated", "127", "+12")
+        st.metric(
+            f"Generations ({days}d)", generation.get('events', 0),
+            _change(generation.get('events', 0), previous_generation.get('events', 0), lambda d: f"{d:+d}")
+        )
     
     with col2:
-        st.metric("Processing Time", "2.3s", "-0.5s")
+        st.metric(
+            "Processing Time (median)", _seconds(current['p50_latency_ms']),
+            _change(current['p50_latency_ms'], previous['p50_latency_ms'], lambda d: f"{d / 1000:+.1f}s"),
+            delta_color="inverse",
+            help=f"95% of requests finished within {_seconds(current['p95_latency_ms'])}"
+        )
     
     with col3:
-        st.metric("Success Rate", "98.5%", "+1.2%")
+        st.metric(
+            "Success Rate", _percent(current['success_rate']),
+            _change(current['success_rate'], previous['success_rate'], lambda d: f"{d * 100:+.1f}%")
+        )
+    
+    if current['daily']:
+        st.bar_chart(
+            {'Activities': {day: events for day, events in current['daily']}},
+            height=160
+        )
 
-def show_recent_images():
-    """Display recent images."""
+def show_recent_images(page_size: int = 6):
+    """Display the signed-in user's images, a page at a time."""
     st.markdown("### 🖼️ Recent Images")
-    st.info("Recent images will appear here after you start generating or editing images.")
+    
+    user_id = current_user_id()
+    images, next_cursor, cursors = [], None, [None]
+    if user_id is not None:
+        db = get_database_manager()
+        images, next_cursor, cursors = _history_page(
+            'image_feed', lambda cursor: db.get_user_images_page(user_id, page_size, cursor)
+        )
+    if not images:
+        st.info("Recent images will appear here after you start generating or editing images.")
+        return
+    
+    cols = st.columns(3)
+    for index, image in enumerate(images):
+        with cols[index % 3]:
+            if image['url']:
+                st.image(image['url'], caption=(image['prompt'] or image['type'])[:40], use_column_width=True)
+            else:
+                st.caption(f"🗑️ {image['type']} image no longer stored")
+    
+    _page_buttons('image_feed', cursors, next_cursor)
+
+def current_user_id():
+    """Database id of the signed-in user, looked up once per session."""
+    username = st.session_state.get('username')
+    if not username:
+        return None
+    cached = st.session_state.get('activity_user')
+    if cached is None or cached[0] != username:
+        user_info = st.session_state.get('user_info') or {}
+        user_id = get_database_manager().ensure_user(
+            username,
+            email=user_info.get('email', ''),
+            full_name=user_info.get('full_name', ''),
+            user_uuid=user_info.get('user_id', '')
+        )
+        cached = (username, user_id)
+        st.session_state.activity_user = cached
+    return cached[1]
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
 
-def track_current_activity(activity_type: str, description: str, details: dict = None):
-    """Track current user activity (simplified version)."""
-    # For now, just store in session state for demo purposes
+def track_current_activity(activity_type: str, description: str, details: dict = None,
+                           success: bool = None, latency_ms: float = None):
+    """Track current user activity: shown from session state, persisted by the background writer."""
+    user_id = current_user_id()
+    if user_id is not None:
+        get_activity_writer().log(user_id, activity_type, description, details, _session_id(), success, latency_ms)
+    
     if 'user_activities' not in st.session_state:
         st.session_state.user_activities = []
     
@@ -62,4 +205,35 @@ def track_current_activity(activity_type: str, description: str, details: dict =
     
     st.session_state.user_activities.insert(0, activity)
     # Keep only last 50 activities
-    st.session_state.user_activities = st.session_state.user_activities[:50]
\ No newline at end of file
+    st.session_state.user_activities = st.session_state.user_activities[:50]
+
+class ActivityOutcome:
+    """Handed out by track_activity(); call fail() when the activity did not succeed."""
+
+    def __init__(self):
+        self.success = True
+
+    def fail(self):
+        self.success = False
+
+@contextmanager
+def track_activity(activity_type: str, description: str, details: dict = None):
+    """
+    Track an activity with its outcome and how long it took.
+
+    The activity is logged when the block ends: as failed if it raised or
+    called fail() on the yielded outcome, and as successful otherwise,
+    including when it ends with st.rerun().
+    """
+    outcome = ActivityOutcome()
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except Exception:
+        outcome.fail()
+        raise
+    finally:
+        track_current_activity(
+            activity_type, description, details,
+            success=outcome.success, latency_ms=(time.perf_counter() - started) * 1000
+        )
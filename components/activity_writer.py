@@ -0,0 +1,156 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+from components.database import DatabaseManager, get_database_manager
+
+ACTIVITY_QUEUE_SIZE = int(os.getenv('ACTIVITY_QUEUE_SIZE', '10000'))
+ACTIVITY_BATCH_SIZE = int(os.getenv('ACTIVITY_BATCH_SIZE', '500'))
+ACTIVITY_FLUSH_MS = int(os.getenv('ACTIVITY_FLUSH_MS', '250'))
+# How long a caller waits for room in a full queue before the event is dropped
+ACTIVITY_PUT_TIMEOUT_MS = int(os.getenv('ACTIVITY_PUT_TIMEOUT_MS', '50'))
+
+class ActivityWriter:
+    """
+    Write-behind activity log.
+
+    log() only stamps the event and puts it on a bounded queue. A background
+    thread writes whatever has queued up with one executemany in a single
+    transaction, once ACTIVITY_BATCH_SIZE events are waiting or
+    ACTIVITY_FLUSH_MS after the first of them arrived. When the database
+    falls behind and the queue fills, callers wait briefly for room and the
+    event is dropped (and counted) if none frees up.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        max_queue: int = ACTIVITY_QUEUE_SIZE,
+        batch_size: int = ACTIVITY_BATCH_SIZE,
+        flush_ms: int = ACTIVITY_FLUSH_MS,
+        put_timeout_ms: int = ACTIVITY_PUT_TIMEOUT_MS
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.put_timeout = put_timeout_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self.stats = {'logged': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+        self._thread.start()
+
+    def log(self, user_id: int, activity_type: str, description: str,
+            details: Dict = None, session_id: str = None,
+            success: Optional[bool] = None, latency_ms: Optional[float] = None) -> bool:
+        """
+        Queue an activity for writing.
+
+        Args:
+            success: Whether the activity succeeded, if it has an outcome
+            latency_ms: How long it took, if it was timed
+
+        Returns:
+            False if the event was dropped because the writer is closed or
+            the queue stayed full
+        """
+        if self._closed:
+            return False
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        event = (user_id, activity_type, description, details, session_id, timestamp, success, latency_ms)
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['logged'] += 1
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until everything queued so far has been written.
+
+        Returns:
+            False if that did not happen within timeout, including when the
+            queue stayed full
+        """
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+
+    def close(self, timeout: float = 5.0):
+        """Stop accepting events, write out the queue and stop the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        if not self.flush(timeout):
+            print(f"Activity writer did not flush within {timeout}s; {self._queue.qsize()} event(s) not written")
+        try:
+            self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Full:
+            return
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'queued': self._queue.qsize(), **self.stats}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch: List[tuple] = []
+            markers: List[threading.Event] = []
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    # A flush: write what came before it now
+                    markers.append(item)
+                    break
+                else:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                remaining = deadline - time.monotonic()
+                if stop or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for marker in markers:
+                marker.set()
+            if stop:
+                return
+
+    def _write(self, batch: List[tuple]):
+        try:
+            self.db.log_activities(batch)
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"Error writing activities: {e}")
+
+@st.cache_resource
+def get_activity_writer() -> ActivityWriter:
+    """Get the activity writer shared by all sessions; flushed when the process exits."""
+    writer = ActivityWriter(get_database_manager())
+    atexit.register(writer.close)
+    return writer
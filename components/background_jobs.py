@@ -0,0 +1,79 @@
+import streamlit as st
+from typing import Dict, Any
+
+from components.activity_dashboard import current_user_id
+from components.result_downloader import keep_results
+from services.job_poller import get_job_poller, READY, FAILED
+from services.result_cache import extract_result_urls
+
+# Seconds between fragment refreshes while jobs are pending
+POLL_UI_INTERVAL = 2
+
+def register_background_job(response: Dict[str, Any], target: str, label: str, multiple: bool = False,
+                            image_type: str = 'generated', prompt: str = "") -> bool:
+    """
+    Hand the result URLs of a sync=False response to the background poller.
+
+    Args:
+        response: API response of the sync=False request
+        target: Session state key that receives the result when it is ready
+        label: Description shown while the job is pending
+        multiple: Store the list of all result URLs instead of the first one
+        image_type: Kind of result recorded in the user's image history
+        prompt: Prompt recorded with the results
+
+    Returns:
+        True if the response contained result URLs to wait for
+    """
+    urls = extract_result_urls(response)
+    if not urls:
+        return False
+    job_id = get_job_poller().submit(urls, label)
+    st.session_state.pending_urls.append({
+        'job_id': job_id,
+        'target': target,
+        'label': label,
+        'multiple': multiple,
+        'image_type': image_type,
+        'prompt': prompt,
+        'error': None
+    })
+    return True
+
+@st.fragment(run_every=POLL_UI_INTERVAL)
+def _show_pending_jobs_fragment():
+    poller = get_job_poller()
+    completed = False
+
+    for entry in list(st.session_state.pending_urls):
+        if entry['error']:
+            st.error(f"❌ {entry['label']}: {entry['error']}")
+            if st.button("Dismiss", key=f"dismiss_job_{entry['job_id']}"):
+                st.session_state.pending_urls.remove(entry)
+                st.rerun(scope="app")
+            continue
+
+        job = poller.get(entry['job_id'])
+        if job is None or job['status'] == FAILED:
+            entry['error'] = job['error'] if job else "Job was lost after a server restart"
+            poller.forget(entry['job_id'])
+            st.error(f"❌ {entry['label']}: {entry['error']}")
+        elif job['status'] == READY:
+            # Mirror the results locally before the API's URLs expire, and show the local copies
+            urls = job['urls'] if entry['multiple'] else job['urls'][:1]
+            kept = keep_results(urls, entry.get('image_type', 'generated'), entry.get('prompt', ""), user_id=current_user_id())
+            st.session_state[entry['target']] = kept if entry['multiple'] else kept[0]
+            st.session_state.pending_urls.remove(entry)
+            poller.forget(entry['job_id'])
+            completed = True
+        else:
+            st.info(f"⏳ {entry['label']}: {job['ready']}/{job['total']} ready ({job['elapsed']:.0f}s)")
+
+    if completed:
+        # Results land in session state; redraw the page so they are shown
+        st.rerun(scope="app")
+
+def show_pending_jobs():
+    """Show background jobs and refresh them in place until their results land."""
+    if st.session_state.get('pending_urls'):
+        _show_pending_jobs_fragment()
@@ -0,0 +1,257 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import streamlit as st
+
+BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', 'data/blobs')
+BLOB_STORE_MAX_MB = int(os.getenv('BLOB_STORE_MAX_MB', '2048'))
+
+# Prefix of blob references stored in the database instead of remote URLs
+BLOB_REF_PREFIX = 'blob:'
+# Temporary files older than this were left by an interrupted write
+STALE_TMP_SECONDS = 3600
+
+class BlobStore:
+    """
+    Content-addressed store for result images under data/.
+
+    Each blob is written once under the SHA-256 of its bytes, so the same
+    image produced twice is stored once. Writes go to a temporary file that
+    is renamed into place, reads are memory-mapped, and the least recently
+    used blobs are evicted when the store grows past max_bytes. Remote result
+    URLs can be linked to the blob holding their content; a blob's links are
+    removed with it.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR, max_bytes: int = BLOB_STORE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._tmp_dir = os.path.join(root, 'tmp')
+        self._url_dir = os.path.join(root, 'urls')
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # digest -> names of the URL link files pointing at it
+        self._links: Dict[str, Set[str]] = {}
+        self._link_targets: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.stats = {'writes': 0, 'dedup_hits': 0, 'reads': 0, 'evictions': 0}
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        os.makedirs(self._url_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU and link indexes from disk, least recently used first."""
+        entries = []
+        with os.scandir(self.root) as shards:
+            for shard in shards:
+                if not shard.is_dir() or len(shard.name) != 2:
+                    continue
+                with os.scandir(shard.path) as blobs:
+                    for blob in blobs:
+                        if len(blob.name) != 64 or not blob.is_file():
+                            continue
+                        stat = blob.stat()
+                        entries.append((stat.st_mtime, blob.name, stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._entries[digest] = size
+            self._total_bytes += size
+        stale = time.time() - STALE_TMP_SECONDS
+        with os.scandir(self._tmp_dir) as leftovers:
+            for leftover in leftovers:
+                if leftover.is_file() and leftover.stat().st_mtime < stale:
+                    self._remove_path(leftover.path)
+        with os.scandir(self._url_dir) as links:
+            for link in links:
+                try:
+                    with open(link.path) as f:
+                        digest = f.read().strip()
+                except OSError:
+                    continue
+                if digest in self._entries:
+                    self._add_link(link.name, digest)
+                else:
+                    self._remove_path(link.path)
+
+    def path(self, digest: str) -> str:
+        """Filesystem path of a blob (usable directly with st.image)."""
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._entries
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their digest; identical content is stored once."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                self.stats['dedup_hits'] += 1
+                return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            if digest not in self._entries:
+                self._entries[digest] = len(data)
+                self._total_bytes += len(data)
+                self.stats['writes'] += 1
+            evicted = self._evict_locked(keep=digest)
+            links = self._drop_links(evicted)
+        self._remove_files(evicted, links)
+        return digest
+
+    def _evict_locked(self, keep: str):
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            digest, size = next(iter(self._entries.items()))
+            if digest == keep:
+                self._entries.move_to_end(digest)
+                continue
+            del self._entries[digest]
+            self._total_bytes -= size
+            self.stats['evictions'] += 1
+            evicted.append(digest)
+        return evicted
+
+    def _add_link(self, name: str, digest: str):
+        previous = self._link_targets.get(name)
+        if previous is not None and previous != digest:
+            self._links[previous].discard(name)
+            if not self._links[previous]:
+                del self._links[previous]
+        self._link_targets[name] = digest
+        self._links.setdefault(digest, set()).add(name)
+
+    def _drop_links(self, digests: Iterable[str]) -> List[str]:
+        """Unregister the links to removed blobs and return their file names."""
+        names = []
+        for digest in digests:
+            for name in self._links.pop(digest, ()):
+                del self._link_targets[name]
+                names.append(name)
+        return names
+
+    @staticmethod
+    def _remove_path(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remove_files(self, digests, links=()):
+        for digest in digests:
+            self._remove_path(self.path(digest))
+        for name in links:
+            self._remove_path(os.path.join(self._url_dir, name))
+
+    def _touch(self, digest: str) -> bool:
+        with self._lock:
+            if digest not in self._entries:
+                return False
+            self._entries.move_to_end(digest)
+            self.stats['reads'] += 1
+        try:
+            # Persist recency for the index rebuilt at the next start
+            os.utime(self.path(digest))
+        except OSError:
+            return False
+        return True
+
+    def open(self, digest: str) -> Optional[mmap.mmap]:
+        """
+        Memory-map a blob read-only; the caller closes the returned map.
+
+        Returns None if the blob is not in the store.
+        """
+        if not self._touch(digest):
+            return None
+        try:
+            with open(self.path(digest), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            self._forget(digest)
+            return None
+
+    def read(self, digest: str) -> Optional[memoryview]:
+        """
+        Return a read-only view of a blob, or None if it is missing.
+
+        The view is the memory map itself, not a copy; the blob is unmapped
+        once the view and any slices of it are released. Use bytes(view)
+        where real bytes are needed, or path() to hand the file to Streamlit.
+        """
+        mapped = self.open(digest)
+        if mapped is None:
+            return None
+        return memoryview(mapped)
+
+    def _forget(self, digest: str):
+        with self._lock:
+            size = self._entries.pop(digest, None)
+            if size is not None:
+                self._total_bytes -= size
+            links = self._drop_links([digest])
+        self._remove_files([], links)
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self._url_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def link_url(self, url: str, digest: str):
+        """Remember that a remote URL's content is stored under digest."""
+        path = self._url_path(url)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(digest)
+        os.replace(tmp_path, path)
+        with self._lock:
+            stored = digest in self._entries
+            if stored:
+                self._add_link(os.path.basename(path), digest)
+        if not stored:
+            # Evicted before the link was written
+            self._remove_path(path)
+
+    def digest_for_url(self, url: str) -> Optional[str]:
+        """Return the digest of a mirrored URL, or None if it is not (or no longer) stored."""
+        try:
+            with open(self._url_path(url)) as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        return digest if self.exists(digest) else None
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'blobs': len(self._entries), 'bytes': self._total_bytes, 'links': len(self._link_targets), **self.stats}
+
+def blob_ref(digest: str) -> str:
+    """Reference to a blob as stored in the database."""
+    return f"{BLOB_REF_PREFIX}{digest}"
+
+def is_blob_ref(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith(BLOB_REF_PREFIX)
+
+def digest_from_ref(ref: str) -> str:
+    return ref[len(BLOB_REF_PREFIX):]
+
+@st.cache_resource
+def get_blob_store() -> BlobStore:
+    """Get the blob store shared by all sessions."""
+    return BlobStore()
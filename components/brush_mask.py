@@ -0,0 +1,172 @@
+import io
+from typing import Optional, Tuple
+
+import numpy as np
+import streamlit as st
+from PIL import Image
+
+from components.preview_cache import decoded_image, preview_image
+from services.image_payload import ImageInput, ImagePayload, as_image_payload
+from services.masks import PackedMask
+from services.preprocess import EXIF_ORIENTATION_TAG, ORIENTATION_TRANSPOSE
+
+# Transpose that takes an upright image back to its stored orientation
+INVERSE_TRANSPOSE = {
+    Image.Transpose.ROTATE_90: Image.Transpose.ROTATE_270,
+    Image.Transpose.ROTATE_270: Image.Transpose.ROTATE_90,
+}
+
+# Tint of brushed pixels in the preview, and how strongly it covers the image
+OVERLAY_COLOR = np.array([255, 40, 40], dtype=np.float32)
+OVERLAY_OPACITY = 0.5
+
+Box = Tuple[int, int, int, int]
+
+def _disc(size: Tuple[int, int], x: int, y: int, radius: int) -> Optional[Tuple[Box, np.ndarray]]:
+    """A filled disc clipped to an image of the given size, as its box and the pixels inside it."""
+    width, height = size
+    left, right = max(0, x - radius), min(width, x + radius + 1)
+    top, bottom = max(0, y - radius), min(height, y + radius + 1)
+    if left >= right or top >= bottom:
+        return None
+    dy = np.arange(top, bottom) - y
+    dx = np.arange(left, right) - x
+    return (left, top, right, bottom), dy[:, None] ** 2 + dx[None, :] ** 2 <= radius * radius
+
+class BrushMask:
+    """
+    Brush strokes drawn on an image, kept as points and rasterized incrementally.
+
+    Each stroke is a row (x, y, radius) in full-resolution upright pixels. A
+    new stroke only touches its own bounding box, both in the full-resolution
+    mask sent to the API (bit-packed, so it costs a byte per eight pixels of
+    session memory) and in the preview-size overlay shown while drawing.
+    Undo re-rasterizes from the stroke list.
+
+    Only the encoded preview is kept; its pixels come from the shared preview
+    cache when a stroke is tinted, and the tinted copy exists once something
+    has been drawn.
+    """
+
+    def __init__(self, size: Tuple[int, int], preview: ImageInput, transpose: Optional[Image.Transpose] = None):
+        self.size = size
+        self._preview = as_image_payload(preview)
+        self.preview_size = decoded_image(self._preview).size
+        # Stored orientation of the upload, to hand the mask back on its grid
+        self.transpose = transpose
+        self.strokes = np.empty((0, 3), dtype=np.int32)
+        self.mask = PackedMask.empty(size)
+        self._preview_mask = np.zeros((self.preview_size[1], self.preview_size[0]), dtype=bool)
+        self._overlay: Optional[np.ndarray] = None
+        self._png: Optional[bytes] = None
+
+    def __len__(self) -> int:
+        return len(self.strokes)
+
+    @property
+    def nbytes(self) -> int:
+        """Session memory held by the strokes, masks, overlay and encoded preview."""
+        total = self.strokes.nbytes + self.mask.nbytes + self._preview_mask.nbytes + len(self._preview.data)
+        if self._overlay is not None:
+            total += self._overlay.nbytes
+        return total + (len(self._png) if self._png is not None else 0)
+
+    def _base(self, box: Optional[Box] = None) -> np.ndarray:
+        """Preview pixels, or those inside a box, read from the shared preview cache."""
+        img = decoded_image(self._preview)
+        img = img.crop(box) if box is not None else img
+        return np.asarray(img if img.mode == 'RGB' else img.convert('RGB'))
+
+    @property
+    def scale(self) -> float:
+        """Preview pixels per full-resolution pixel."""
+        return self.preview_size[0] / self.size[0]
+
+    def _paint(self, x: int, y: int, radius: int):
+        disc = _disc(self.size, x, y, radius)
+        if disc is not None:
+            (left, top, _, _), values = disc
+            self.mask.paint(left, top, values)
+            self._png = None
+        scale = self.scale
+        disc = _disc(self.preview_size, round(x * scale), round(y * scale), max(1, round(radius * scale)))
+        if disc is not None:
+            box, values = disc
+            left, top, right, bottom = box
+            self._preview_mask[top:bottom, left:right] |= values
+            self._tint(box)
+
+    def _tint(self, box: Box):
+        left, top, right, bottom = box
+        if self._overlay is None:
+            self._overlay = self._base().copy()
+        region = self._base(box).astype(np.float32)
+        brushed = self._preview_mask[top:bottom, left:right]
+        region[brushed] = region[brushed] * (1 - OVERLAY_OPACITY) + OVERLAY_COLOR * OVERLAY_OPACITY
+        self._overlay[top:bottom, left:right] = region.astype(np.uint8)
+
+    def add(self, x: int, y: int, radius: int):
+        """Add a stroke at full-resolution coordinates."""
+        x, y, radius = int(x), int(y), max(1, int(radius))
+        self.strokes = np.vstack([self.strokes, np.array([[x, y, radius]], dtype=np.int32)])
+        self._paint(x, y, radius)
+
+    def add_from_preview(self, x: float, y: float, radius: float):
+        """Add a stroke given in preview coordinates (e.g. a click on the preview)."""
+        scale = self.scale
+        self.add(round(x / scale), round(y / scale), round(radius / scale))
+
+    def undo(self):
+        """Remove the last stroke and redraw the rest."""
+        strokes = self.strokes[:-1]
+        self.clear()
+        for x, y, radius in strokes.tolist():
+            self._paint(x, y, radius)
+        self.strokes = strokes
+
+    def clear(self):
+        self.strokes = np.empty((0, 3), dtype=np.int32)
+        self.mask = PackedMask.empty(self.size)
+        self._preview_mask[:] = False
+        self._overlay = None
+        self._png = None
+
+    def overlay(self) -> np.ndarray:
+        """The preview with brushed areas tinted, at preview resolution."""
+        return self._overlay if self._overlay is not None else self._base()
+
+    def to_png(self) -> bytes:
+        """The mask as a 1-bit PNG on the upload's stored pixel grid, encoded once per change."""
+        if self.transpose is None:
+            return self.mask.payload.data
+        if self._png is None:
+            img = self.mask.to_image().transpose(INVERSE_TRANSPOSE.get(self.transpose, self.transpose))
+            buffer = io.BytesIO()
+            img.save(buffer, format='PNG')
+            self._png = buffer.getvalue()
+        return self._png
+
+def brush_mask_for(image: ImagePayload) -> BrushMask:
+    """Create an empty brush mask for an upload, drawn on its upright preview."""
+    with Image.open(io.BytesIO(image.data)) as img:
+        transpose = ORIENTATION_TRANSPOSE.get(img.getexif().get(EXIF_ORIENTATION_TAG, 1))
+        width, height = img.size
+    if transpose in (Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270,
+                     Image.Transpose.TRANSPOSE, Image.Transpose.TRANSVERSE):
+        width, height = height, width
+    return BrushMask((width, height), preview_image(image), transpose)
+
+def get_brush_mask(key: str, image: ImagePayload) -> BrushMask:
+    """The session's brush mask for an upload, started afresh when the upload changes."""
+    state = st.session_state.get(key)
+    if state is None or state[0] != image.sha256:
+        state = (image.sha256, brush_mask_for(image))
+        st.session_state[key] = state
+    return state[1]
+
+def get_brush_bytes() -> int:
+    """Bytes held by the current session's brush masks."""
+    return sum(
+        state[1].nbytes for state in st.session_state.values()
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], BrushMask)
+    )
@@ -78,22 +78,6 @@ def show_stat_card(title, value, icon, color):
     </div>
     """, unsafe_allow_html=True)
 
-def get_user_stats():
-    """Get user statistics (simulated for demo)."""
-    # In a real app, this would query a database
-    base_stats = {
-        'images_generated': random.randint(15, 150),
-        'projects': random.randint(3, 25),
-        'success_rate': random.randint(85, 99),
-        'time_saved': random.randint(5, 50)
-    }
-    
-    # Store in session state to maintain consistency
-    if 'user_stats' not in st.session_state:
-        st.session_state.user_stats = base_stats
-    
-    return st.session_state.user_stats
-
 def show_recent_activity():
     """Display recent user activity."""
     st.markdown("### 📊 Recent Activity")
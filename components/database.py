@@ -1,13 +1,279 @@
 import sqlite3
 import json
+import math
 import os
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+import threading
+import weakref
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+from collections.abc import Mapping
+from typing import Any, Iterator, List, Dict, Optional, Tuple
 import streamlit as st
+from PIL import Image
+
+from components.blob_store import BlobStore, get_blob_store, blob_ref, is_blob_ref, digest_from_ref
+
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_CACHE_MB = int(os.getenv('DB_CACHE_MB', '16'))
+DB_MMAP_MB = int(os.getenv('DB_MMAP_MB', '128'))
+DB_STATEMENT_CACHE = int(os.getenv('DB_STATEMENT_CACHE', '256'))
+# Usage summaries kept in memory, across users and date ranges
+USAGE_CACHE_SIZE = int(os.getenv('USAGE_CACHE_SIZE', '1024'))
+
+def _create_tables(cursor):
+    """Version 1: the original tables."""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            full_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            user_id TEXT UNIQUE,
+            profile_image TEXT,
+            preferences TEXT -- JSON string for user preferences
+        )
+    ''')
+    
+    # Activity logs table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            activity_type TEXT NOT NULL,
+            activity_description TEXT NOT NULL,
+            details TEXT, -- JSON string for additional details
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            session_id TEXT,
+            ip_address TEXT,
+            user_agent TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Projects table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            project_name TEXT NOT NULL,
+            project_description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            project_data TEXT, -- JSON string for project configuration
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Generated images table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generated_images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            project_id INTEGER,
+            image_url TEXT,
+            image_type TEXT, -- 'generated', 'edited', 'lifestyle', etc.
+            prompt TEXT,
+            settings TEXT, -- JSON string for generation settings
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            file_size INTEGER,
+            dimensions TEXT, -- "width x height"
+            is_favorite BOOLEAN DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (project_id) REFERENCES projects (id)
+        )
+    ''')
+    
+    # User sessions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_id TEXT UNIQUE,
+            login_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            logout_time TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # User statistics table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE,
+            total_images_generated INTEGER DEFAULT 0,
+            total_images_edited INTEGER DEFAULT 0,
+            total_projects INTEGER DEFAULT 0,
+            total_login_time INTEGER DEFAULT 0, -- in minutes
+            favorite_feature TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+def _add_history_indexes(cursor):
+    """
+    Version 2: indexes for the per-user history queries.
+
+    Each matches a query's filter and sort order, so a page of history is
+    read straight off the index (the rowid breaks timestamp ties) instead of
+    scanning and sorting the table.
+    """
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_activity_logs_user_time
+        ON activity_logs (user_id, timestamp)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generated_images_user_time
+        ON generated_images (user_id, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_projects_user_active_updated
+        ON projects (user_id, is_active, updated_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_sessions_user_login
+        ON user_sessions (user_id, login_time)
+    ''')
+
+def _add_usage_rollups(cursor):
+    """
+    Version 3: outcome columns on activity_logs and the daily usage rollups.
+
+    activity_daily holds one row per user, day and activity type, and
+    activity_latency_histogram the latency distribution of those activities
+    in log-spaced buckets, so percentiles over any range of days merge a few
+    small histograms instead of sorting raw events. Both are kept up to date
+    by log_activities(). Existing activities are counted in; they have no
+    recorded outcome or latency.
+    """
+    cursor.execute('ALTER TABLE activity_logs ADD COLUMN success BOOLEAN')
+    cursor.execute('ALTER TABLE activity_logs ADD COLUMN latency_ms REAL')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL, -- UTC date, YYYY-MM-DD
+            activity_type TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 0,
+            successes INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            timed INTEGER NOT NULL DEFAULT 0, -- events with a latency
+            latency_ms_total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, activity_type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_latency_histogram (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            activity_type TEXT NOT NULL,
+            bucket INTEGER NOT NULL, -- see latency_bucket()
+            events INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, activity_type, bucket)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        INSERT INTO activity_daily (user_id, day, activity_type, events)
+        SELECT user_id, substr(timestamp, 1, 10), activity_type, COUNT(*)
+        FROM activity_logs
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, substr(timestamp, 1, 10), activity_type
+    ''')
+
+def _add_image_sources(cursor):
+    """
+    Version 4: the URL each stored image came from.
+
+    image_url points at the local blob once an image is mirrored; source_url
+    keeps the API's URL (or cached file) so the image can still be shown
+    after the blob store evicts it.
+    """
+    cursor.execute('ALTER TABLE generated_images ADD COLUMN source_url TEXT')
+
+# Latency histogram resolution: buckets per doubling, i.e. about 19% wide
+LATENCY_BUCKETS_PER_OCTAVE = 4
+
+def latency_bucket(latency_ms: float) -> int:
+    """Histogram bucket of a latency; bucket b covers [2 ** (b / 4), 2 ** ((b + 1) / 4)) ms."""
+    return math.floor(math.log2(max(latency_ms, 1.0)) * LATENCY_BUCKETS_PER_OCTAVE)
+
+def _histogram_percentile(histogram: Dict[int, int], fraction: float) -> Optional[float]:
+    """Latency at a fraction of a histogram's events, as the geometric middle of its bucket."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= fraction * total:
+            break
+    return 2 ** ((bucket + 0.5) / LATENCY_BUCKETS_PER_OCTAVE)
+
+def _usage_totals(rows: List[Tuple], histogram: Dict[int, int]) -> Dict[str, Any]:
+    """Totals of activity_daily rows (events, successes, failures, timed, latency_ms_total)."""
+    events, successes, failures, timed, latency_total = (sum(column) for column in zip(*rows)) if rows else (0,) * 5
+    return {
+        'events': events,
+        'successes': successes,
+        'failures': failures,
+        'success_rate': successes / (successes + failures) if successes + failures else None,
+        'avg_latency_ms': latency_total / timed if timed else None,
+        'p50_latency_ms': _histogram_percentile(histogram, 0.50),
+        'p95_latency_ms': _histogram_percentile(histogram, 0.95)
+    }
+
+# Position in a newest-first history: the (timestamp, id) of the last row seen
+Cursor = Tuple[str, int]
+# Sorts after every stored timestamp, so the first page starts at the newest row
+_CURSOR_START = ('9999-12-31 23:59:59', 0)
+
+class LazyRecord(Mapping):
+    """A result row as a read-only mapping whose JSON columns are decoded on first access."""
+
+    __slots__ = ('_values', '_json')
+
+    def __init__(self, values: Dict[str, Any], json_columns: Dict[str, Optional[str]]):
+        self._values = values
+        self._json = json_columns
+
+    def __getitem__(self, key):
+        if key in self._json:
+            raw = self._json.pop(key)
+            self._values[key] = json.loads(raw) if raw else {}
+        return self._values[key]
+
+    def __iter__(self):
+        # A snapshot: reading a JSON column moves it between the two dicts
+        return iter(list(self._values) + list(self._json))
+
+    def __len__(self) -> int:
+        return len(self._values) + len(self._json)
+
+    def __repr__(self) -> str:
+        return f"LazyRecord({self._values})"
+
+# Schema migrations in order; the database's PRAGMA user_version counts those applied
+MIGRATIONS = [_create_tables, _add_history_indexes, _add_usage_rollups, _add_image_sources]
+SCHEMA_VERSION = len(MIGRATIONS)
 
 class DatabaseManager:
-    def __init__(self, db_path="data/adsnap_studio.db"):
+    def __init__(self, db_path="data/adsnap_studio.db", blob_store: Optional[BlobStore] = None):
         self.db_path = db_path
+        self.blob_store = blob_store
+        # One long-lived connection per thread, dropped with the thread
+        self._connections = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # get_usage_summary() results by (user_id, days, last day), dropped when the user logs activity
+        self._usage_cache: Dict[Tuple[int, int, str], Dict[str, Any]] = {}
+        self._usage_writes = 0
         self.ensure_data_directory()
         self.init_database()
     
@@ -16,112 +282,65 @@ class DatabaseManager:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
     
     def get_connection(self):
-        """Get database connection."""
-        return sqlite3.connect(self.db_path)
+        """
+        Get this thread's database connection, opening it on first use.
+
+        Connections stay open for the life of the thread and keep up to
+        DB_STATEMENT_CACHE prepared statements. The database runs in WAL mode,
+        so readers never wait for a writer and commits skip most fsyncs.
+        Use it as a context manager for a transaction; do not close it.
+        """
+        thread = threading.current_thread()
+        conn = self._connections.get(thread)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                cached_statements=DB_STATEMENT_CACHE,
+                # Only its own thread queries it, but close() may run elsewhere
+                check_same_thread=False
+            )
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+            conn.execute(f'PRAGMA cache_size = {-DB_CACHE_MB * 1024}')
+            conn.execute(f'PRAGMA mmap_size = {DB_MMAP_MB * 1024 * 1024}')
+            conn.execute('PRAGMA temp_store = MEMORY')
+            with self._lock:
+                self._connections[thread] = conn
+        return conn
+    
+    def close(self):
+        """Close the connections of all threads."""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
     
     def init_database(self):
-        """Initialize database tables."""
-        with self.get_connection() as conn:
+        """
+        Bring the schema up to date.
+
+        PRAGMA user_version records how many MIGRATIONS the database has had,
+        so an up-to-date database costs one read. Pending migrations run in a
+        single write transaction, which also keeps concurrent processes from
+        applying them twice.
+        """
+        conn = self.get_connection()
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
             cursor = conn.cursor()
-            
-            # Users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    full_name TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    user_id TEXT UNIQUE,
-                    profile_image TEXT,
-                    preferences TEXT -- JSON string for user preferences
-                )
-            ''')
-            
-            # Activity logs table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS activity_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    activity_type TEXT NOT NULL,
-                    activity_description TEXT NOT NULL,
-                    details TEXT, -- JSON string for additional details
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    session_id TEXT,
-                    ip_address TEXT,
-                    user_agent TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Projects table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS projects (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    project_name TEXT NOT NULL,
-                    project_description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    project_data TEXT, -- JSON string for project configuration
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Generated images table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS generated_images (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    project_id INTEGER,
-                    image_url TEXT,
-                    image_type TEXT, -- 'generated', 'edited', 'lifestyle', etc.
-                    prompt TEXT,
-                    settings TEXT, -- JSON string for generation settings
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    file_size INTEGER,
-                    dimensions TEXT, -- "width x height"
-                    is_favorite BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    FOREIGN KEY (project_id) REFERENCES projects (id)
-                )
-            ''')
-            
-            # User sessions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    session_id TEXT UNIQUE,
-                    login_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    logout_time TIMESTAMP,
-                    ip_address TEXT,
-                    user_agent TEXT,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # User statistics table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_statistics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER UNIQUE,
-                    total_images_generated INTEGER DEFAULT 0,
-                    total_images_edited INTEGER DEFAULT 0,
-                    total_projects INTEGER DEFAULT 0,
-                    total_login_time INTEGER DEFAULT 0, -- in minutes
-                    favorite_feature TEXT,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
+            for migrate in MIGRATIONS[version:]:
+                migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
     
     def create_user(self, username: str, email: str, password_hash: str, 
                    full_name: str = "", user_uuid: str = "") -> Tuple[bool, str]:
@@ -156,6 +375,30 @@ class DatabaseManager:
         except Exception as e:
             return False, f"Database error: {str(e)}"
     
+    def ensure_user(self, username: str, email: str = "", full_name: str = "", user_uuid: str = "") -> Optional[int]:
+        """Return a user's id, adding a row for accounts kept outside the database (e.g. the JSON user store)."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
+                row = cursor.fetchone()
+                if row:
+                    return row[0]
+                
+                # No password: these accounts sign in through their own store
+                cursor.execute('''
+                    INSERT INTO users (username, email, password_hash, full_name, user_id)
+                    VALUES (?, ?, '', ?, ?)
+                ''', (username, email or username, full_name, user_uuid or None))
+                user_id = cursor.lastrowid
+                cursor.execute('INSERT INTO user_statistics (user_id) VALUES (?)', (user_id,))
+                conn.commit()
+                return user_id
+                
+        except Exception as e:
+            print(f"Error resolving user: {e}")
+            return None
+    
     def authenticate_user(self, username: str, password_hash: str) -> Tuple[bool, str, Optional[Dict]]:
         """Authenticate user and return user info."""
         try:
@@ -198,54 +441,207 @@ class DatabaseManager:
             return False, f"Database error: {str(e)}", None
     
     def log_activity(self, user_id: int, activity_type: str, description: str, 
-                    details: Dict = None, session_id: str = None):
+                    details: Dict = None, session_id: str = None,
+                    success: Optional[bool] = None, latency_ms: Optional[float] = None):
         """Log user activity."""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                details_json = json.dumps(details) if details else None
-                
-                cursor.execute('''
-                    INSERT INTO activity_logs 
-                    (user_id, activity_type, activity_description, details, session_id)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, activity_type, description, details_json, session_id))
-                
-                conn.commit()
-                
+            timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            self.log_activities([
+                (user_id, activity_type, description, details, session_id, timestamp, success, latency_ms)
+            ])
+            
         except Exception as e:
             print(f"Error logging activity: {e}")
     
-    def get_user_activities(self, user_id: int, limit: int = 50) -> List[Dict]:
-        """Get user's recent activities."""
+    def log_activities(self, activities: List[Tuple]):
+        """
+        Write a batch of activities in one transaction, rolling them up as it goes.
+
+        The batch is first summed per user, day and activity type, so the
+        rollup tables take one upsert per group rather than per event.
+
+        Args:
+            activities: (user_id, activity_type, description, details, session_id,
+                timestamp, success, latency_ms) tuples, with details as a dict,
+                timestamp in UTC, and success and latency_ms None when unknown
+        """
+        rows = []
+        daily = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+        histogram = defaultdict(int)
+        for user_id, activity_type, description, details, session_id, timestamp, success, latency_ms in activities:
+            rows.append((
+                user_id, activity_type, description, json.dumps(details) if details else None,
+                session_id, timestamp, success, latency_ms
+            ))
+            if user_id is None:
+                continue
+            key = (user_id, timestamp[:10], activity_type)
+            totals = daily[key]
+            totals[0] += 1
+            if success is not None:
+                totals[1 if success else 2] += 1
+            if latency_ms is not None:
+                totals[3] += 1
+                totals[4] += latency_ms
+                histogram[key + (latency_bucket(latency_ms),)] += 1
+        
+        with self.get_connection() as conn:
+            conn.executemany('''
+                INSERT INTO activity_logs 
+                (user_id, activity_type, activity_description, details, session_id, timestamp, success, latency_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.executemany('''
+                INSERT INTO activity_daily
+                (user_id, day, activity_type, events, successes, failures, timed, latency_ms_total)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, day, activity_type) DO UPDATE SET
+                    events = events + excluded.events,
+                    successes = successes + excluded.successes,
+                    failures = failures + excluded.failures,
+                    timed = timed + excluded.timed,
+                    latency_ms_total = latency_ms_total + excluded.latency_ms_total
+            ''', [key + tuple(totals) for key, totals in daily.items()])
+            conn.executemany('''
+                INSERT INTO activity_latency_histogram (user_id, day, activity_type, bucket, events)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, day, activity_type, bucket) DO UPDATE SET
+                    events = events + excluded.events
+            ''', [key + (count,) for key, count in histogram.items()])
+        
+        self._invalidate_usage({key[0] for key in daily})
+    
+    def _invalidate_usage(self, user_ids):
+        with self._lock:
+            self._usage_writes += 1
+            for key in [key for key in self._usage_cache if key[0] in user_ids]:
+                del self._usage_cache[key]
+    
+    def get_usage_summary(self, user_id: int, days: int = 30, offset_days: int = 0) -> Dict[str, Any]:
+        """
+        Summarize a user's activity over a range of days from the rollups.
+
+        Reads at most one row per day and activity type (plus their latency
+        histograms), however many events there were. Results are cached until
+        the user logs more activity.
+
+        Args:
+            user_id: User to summarize
+            days: Number of days in the range, counting the last one
+            offset_days: How many days before today the range ends (e.g. days to
+                summarize the period before)
+
+        Returns:
+            Dict with the overall totals (events, successes, failures, success_rate,
+            avg_latency_ms, p50_latency_ms, p95_latency_ms), the same per activity
+            type under 'by_type', and 'daily' event counts as (day, events) pairs;
+            rates and latencies are None where nothing was recorded
+        """
+        last_day = datetime.now(timezone.utc).date() - timedelta(days=offset_days)
+        first_day = (last_day - timedelta(days=days - 1)).isoformat()
+        last_day = last_day.isoformat()
+        key = (user_id, days, last_day)
+        with self._lock:
+            cached = self._usage_cache.get(key)
+            writes = self._usage_writes
+        if cached is not None:
+            return cached
+        
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
+                rows = conn.execute('''
+                    SELECT day, activity_type, events, successes, failures, timed, latency_ms_total
+                    FROM activity_daily
+                    WHERE user_id = ? AND day BETWEEN ? AND ?
+                ''', (user_id, first_day, last_day)).fetchall()
+                buckets = conn.execute('''
+                    SELECT activity_type, bucket, SUM(events)
+                    FROM activity_latency_histogram
+                    WHERE user_id = ? AND day BETWEEN ? AND ?
+                    GROUP BY activity_type, bucket
+                ''', (user_id, first_day, last_day)).fetchall()
                 
-                cursor.execute('''
-                    SELECT activity_type, activity_description, details, timestamp
+        except Exception as e:
+            print(f"Error fetching usage: {e}")
+            return {**_usage_totals([], {}), 'by_type': {}, 'daily': []}
+        
+        rows_by_type = defaultdict(list)
+        daily = defaultdict(int)
+        for day, activity_type, *totals in rows:
+            rows_by_type[activity_type].append(totals)
+            daily[day] += totals[0]
+        histograms = defaultdict(dict)
+        overall = defaultdict(int)
+        for activity_type, bucket, events in buckets:
+            histograms[activity_type][bucket] = events
+            overall[bucket] += events
+        
+        summary = {
+            **_usage_totals([totals for group in rows_by_type.values() for totals in group], overall),
+            'by_type': {
+                activity_type: _usage_totals(group, histograms[activity_type])
+                for activity_type, group in rows_by_type.items()
+            },
+            'daily': sorted(daily.items())
+        }
+        with self._lock:
+            # Not if activity was written meanwhile: the summary may predate it
+            if writes == self._usage_writes:
+                if len(self._usage_cache) >= USAGE_CACHE_SIZE:
+                    self._usage_cache.clear()
+                self._usage_cache[key] = summary
+        return summary
+    
+    def get_user_activities_page(self, user_id: int, limit: int = 50,
+                                 cursor: Optional[Cursor] = None) -> Tuple[List[LazyRecord], Optional[Cursor]]:
+        """
+        Get one page of a user's activities, newest first.
+
+        Args:
+            user_id: User whose activities to fetch
+            limit: Page size
+            cursor: The cursor returned with the previous page, or None for the first
+
+        Returns:
+            Tuple of (activities, cursor of the next page or None after the last page)
+        """
+        try:
+            with self.get_connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, activity_type, activity_description, details, timestamp
                     FROM activity_logs 
-                    WHERE user_id = ?
-                    ORDER BY timestamp DESC
+                    WHERE user_id = ? AND (timestamp, id) < (?, ?)
+                    ORDER BY timestamp DESC, id DESC
                     LIMIT ?
-                ''', (user_id, limit))
-                
-                activities = []
-                for row in cursor.fetchall():
-                    activity = {
-                        'type': row[0],
-                        'description': row[1],
-                        'details': json.loads(row[2]) if row[2] else {},
-                        'timestamp': row[3]
-                    }
-                    activities.append(activity)
-                
-                return activities
+                ''', (user_id, *(cursor or _CURSOR_START), limit + 1)).fetchall()
+                
+                activities = [
+                    LazyRecord(
+                        {'id': row[0], 'type': row[1], 'description': row[2], 'timestamp': row[4]},
+                        {'details': row[3]}
+                    )
+                    for row in rows[:limit]
+                ]
+                next_cursor = (rows[limit - 1][4], rows[limit - 1][0]) if len(rows) > limit else None
+                return activities, next_cursor
                 
         except Exception as e:
             print(f"Error fetching activities: {e}")
-            return []
+            return [], None
+    
+    def iter_user_activities(self, user_id: int, page_size: int = 500,
+                             cursor: Optional[Cursor] = None) -> Iterator[LazyRecord]:
+        """Stream a user's activities, newest first, one page in memory at a time."""
+        while True:
+            activities, cursor = self.get_user_activities_page(user_id, page_size, cursor)
+            yield from activities
+            if cursor is None:
+                return
+    
+    def get_user_activities(self, user_id: int, limit: int = 50) -> List[Dict]:
+        """Get user's recent activities."""
+        activities, _ = self.get_user_activities_page(user_id, limit)
+        return [dict(activity) for activity in activities]
     
     def get_user_statistics(self, user_id: int) -> Dict:
         """Get user statistics."""
@@ -289,43 +685,85 @@ class DatabaseManager:
                 'favorite_feature': 'Image Generation'
             }
     
+    def _increment_statistic(self, cursor, user_id: int, stat_type: str, increment: int = 1):
+        """Bump a user statistic as part of the caller's transaction."""
+        if stat_type == 'images_generated':
+            cursor.execute('''
+                UPDATE user_statistics 
+                SET total_images_generated = total_images_generated + ?,
+                    last_updated = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            ''', (increment, user_id))
+        elif stat_type == 'images_edited':
+            cursor.execute('''
+                UPDATE user_statistics 
+                SET total_images_edited = total_images_edited + ?,
+                    last_updated = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            ''', (increment, user_id))
+        elif stat_type == 'projects':
+            cursor.execute('''
+                UPDATE user_statistics 
+                SET total_projects = total_projects + ?,
+                    last_updated = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            ''', (increment, user_id))
+    
     def update_user_statistics(self, user_id: int, stat_type: str, increment: int = 1):
         """Update user statistics."""
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                if stat_type == 'images_generated':
-                    cursor.execute('''
-                        UPDATE user_statistics 
-                        SET total_images_generated = total_images_generated + ?,
-                            last_updated = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    ''', (increment, user_id))
-                elif stat_type == 'images_edited':
-                    cursor.execute('''
-                        UPDATE user_statistics 
-                        SET total_images_edited = total_images_edited + ?,
-                            last_updated = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    ''', (increment, user_id))
-                elif stat_type == 'projects':
-                    cursor.execute('''
-                        UPDATE user_statistics 
-                        SET total_projects = total_projects + ?,
-                            last_updated = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    ''', (increment, user_id))
-                
+                self._increment_statistic(conn.cursor(), user_id, stat_type, increment)
                 conn.commit()
                 
         except Exception as e:
             print(f"Error updating statistics: {e}")
     
+    def _store_image(self, image_url: str, image_data: bytes = None) -> Tuple[str, Optional[int], Optional[str]]:
+        """
+        Point an image at its local blob when there is one.
+
+        Returns:
+            Tuple of (image_url or blob reference, file size, "width x height")
+        """
+        if self.blob_store is None:
+            return image_url, (len(image_data) if image_data else None), None
+        
+        if image_data:
+            digest = self.blob_store.put(image_data)
+            if image_url and not is_blob_ref(image_url):
+                self.blob_store.link_url(image_url, digest)
+        elif is_blob_ref(image_url):
+            digest = digest_from_ref(image_url)
+        else:
+            digest = self.blob_store.digest_for_url(image_url) if image_url else None
+        
+        if digest is None or not self.blob_store.exists(digest):
+            return image_url, None, None
+        
+        dimensions = None
+        try:
+            with Image.open(self.blob_store.path(digest)) as img:
+                dimensions = f"{img.width} x {img.height}"
+        except Exception:
+            pass
+        return blob_ref(digest), os.path.getsize(self.blob_store.path(digest)), dimensions
+    
     def save_generated_image(self, user_id: int, image_url: str, image_type: str,
-                           prompt: str = "", settings: Dict = None, project_id: int = None):
-        """Save generated image information."""
+                           prompt: str = "", settings: Dict = None, project_id: int = None,
+                           image_data: bytes = None, source_url: str = None):
+        """
+        Save generated image information; the image is referenced by its local blob when stored.
+
+        The URL it came from (image_url, unless source_url is given) is kept
+        alongside the blob reference, to fall back to once the blob is evicted.
+        """
         try:
+            source_url = source_url or (image_url if not is_blob_ref(image_url) else None)
+            image_url, file_size, dimensions = self._store_image(image_url, image_data)
+            if not is_blob_ref(image_url):
+                source_url = None
+            
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
@@ -333,51 +771,94 @@ class DatabaseManager:
                 
                 cursor.execute('''
                     INSERT INTO generated_images 
-                    (user_id, project_id, image_url, image_type, prompt, settings)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (user_id, project_id, image_url, image_type, prompt, settings_json))
-                
-                conn.commit()
+                    (user_id, project_id, image_url, image_type, prompt, settings, file_size, dimensions, source_url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, project_id, image_url, image_type, prompt, settings_json, file_size, dimensions, source_url))
                 
-                # Update statistics
+                # Update statistics in the same transaction
                 if image_type in ['generated', 'hd_generation']:
-                    self.update_user_statistics(user_id, 'images_generated')
+                    self._increment_statistic(cursor, user_id, 'images_generated')
                 else:
-                    self.update_user_statistics(user_id, 'images_edited')
+                    self._increment_statistic(cursor, user_id, 'images_edited')
+                
+                conn.commit()
                 
         except Exception as e:
             print(f"Error saving image: {e}")
     
-    def get_user_images(self, user_id: int, limit: int = 20) -> List[Dict]:
-        """Get user's recent images."""
+    def _resolve_image_url(self, image_url: str, source_url: Optional[str] = None) -> Optional[str]:
+        """
+        Turn a blob reference into the blob's local path.
+
+        Once the blob has been evicted this falls back to the URL the image
+        came from, or None if that was a local file that is gone too.
+        """
+        if not is_blob_ref(image_url):
+            return image_url
+        digest = digest_from_ref(image_url)
+        if self.blob_store is not None and self.blob_store.exists(digest):
+            return self.blob_store.path(digest)
+        if source_url and (source_url.startswith(('http://', 'https://')) or os.path.isfile(source_url)):
+            return source_url
+        return None
+    
+    def get_user_images_page(self, user_id: int, limit: int = 20,
+                             cursor: Optional[Cursor] = None) -> Tuple[List[LazyRecord], Optional[Cursor]]:
+        """
+        Get one page of a user's images, newest first.
+
+        Args:
+            user_id: User whose images to fetch
+            limit: Page size
+            cursor: The cursor returned with the previous page, or None for the first
+
+        Returns:
+            Tuple of (images, cursor of the next page or None after the last page)
+        """
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT image_url, image_type, prompt, created_at, is_favorite
+                rows = conn.execute('''
+                    SELECT id, image_url, image_type, prompt, created_at, is_favorite, settings, source_url
                     FROM generated_images 
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
+                    WHERE user_id = ? AND (created_at, id) < (?, ?)
+                    ORDER BY created_at DESC, id DESC
                     LIMIT ?
-                ''', (user_id, limit))
-                
-                images = []
-                for row in cursor.fetchall():
-                    image = {
-                        'url': row[0],
-                        'type': row[1],
-                        'prompt': row[2],
-                        'created_at': row[3],
-                        'is_favorite': bool(row[4])
-                    }
-                    images.append(image)
-                
-                return images
+                ''', (user_id, *(cursor or _CURSOR_START), limit + 1)).fetchall()
+                
+                images = [
+                    LazyRecord(
+                        {
+                            'id': row[0],
+                            'url': self._resolve_image_url(row[1], row[7]),
+                            'type': row[2],
+                            'prompt': row[3],
+                            'created_at': row[4],
+                            'is_favorite': bool(row[5])
+                        },
+                        {'settings': row[6]}
+                    )
+                    for row in rows[:limit]
+                ]
+                next_cursor = (rows[limit - 1][4], rows[limit - 1][0]) if len(rows) > limit else None
+                return images, next_cursor
                 
         except Exception as e:
             print(f"Error fetching images: {e}")
-            return []
+            return [], None
+    
+    def iter_user_images(self, user_id: int, page_size: int = 200,
+                         cursor: Optional[Cursor] = None) -> Iterator[LazyRecord]:
+        """Stream a user's images, newest first, one page in memory at a time."""
+        while True:
+            images, cursor = self.get_user_images_page(user_id, page_size, cursor)
+            yield from images
+            if cursor is None:
+                return
+    
+    def get_user_images(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """Get user's recent images."""
+        images, _ = self.get_user_images_page(user_id, limit)
+        return [{key: image[key] for key in ('url', 'type', 'prompt', 'created_at', 'is_favorite')} for image in images]
     
     def create_project(self, user_id: int, project_name: str, description: str = "") -> int:
         """Create a new project."""
@@ -391,10 +872,10 @@ class DatabaseManager:
                 ''', (user_id, project_name, description))
                 
                 project_id = cursor.lastrowid
-                conn.commit()
                 
-                # Update statistics
-                self.update_user_statistics(user_id, 'projects')
+                # Update statistics in the same transaction
+                self._increment_statistic(cursor, user_id, 'projects')
+                conn.commit()
                 
                 return project_id
                 
@@ -434,12 +915,20 @@ class DatabaseManager:
 
 # Activity tracking helper functions
 class ActivityTracker:
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, writer=None):
         self.db = db_manager
+        # An ActivityWriter to log through in the background; None writes synchronously
+        self.writer = writer
+    
+    def _log(self, user_id: int, activity_type: str, description: str, details: Dict = None):
+        if self.writer is not None:
+            self.writer.log(user_id, activity_type, description, details)
+        else:
+            self.db.log_activity(user_id, activity_type, description, details)
     
     def track_login(self, user_id: int):
         """Track user login."""
-        self.db.log_activity(
+        self._log(
             user_id, 
             "authentication", 
             "User logged in",
@@ -448,7 +937,7 @@ class ActivityTracker:
     
     def track_image_generation(self, user_id: int, prompt: str, settings: Dict):
         """Track image generation."""
-        self.db.log_activity(
+        self._log(
             user_id,
             "image_generation",
             f"Generated image with prompt: '{prompt[:50]}...'",
@@ -457,7 +946,7 @@ class ActivityTracker:
     
     def track_image_editing(self, user_id: int, edit_type: str, details: Dict):
         """Track image editing."""
-        self.db.log_activity(
+        self._log(
             user_id,
             "image_editing",
             f"Applied {edit_type} to image",
@@ -466,7 +955,7 @@ class ActivityTracker:
     
     def track_project_creation(self, user_id: int, project_name: str):
         """Track project creation."""
-        self.db.log_activity(
+        self._log(
             user_id,
             "project_management",
             f"Created new project: {project_name}",
@@ -475,7 +964,7 @@ class ActivityTracker:
     
     def track_feature_usage(self, user_id: int, feature_name: str, details: Dict = None):
         """Track feature usage."""
-        self.db.log_activity(
+        self._log(
             user_id,
             "feature_usage",
             f"Used {feature_name} feature",
@@ -486,10 +975,11 @@ class ActivityTracker:
 @st.cache_resource
 def get_database_manager():
     """Get cached database manager instance."""
-    return DatabaseManager()
+    return DatabaseManager(blob_store=get_blob_store())
 
 @st.cache_resource
 def get_activity_tracker():
     """Get cached activity tracker instance."""
+    from components.activity_writer import get_activity_writer
     db_manager = get_database_manager()
-    return ActivityTracker(db_manager)
\ No newline at end of file
+    return ActivityTracker(db_manager, get_activity_writer())
\ No newline at end of file
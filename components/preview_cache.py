@@ -0,0 +1,139 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import streamlit as st
+from PIL import Image, ImageOps
+
+from services.image_payload import ImageInput, ImagePayload, as_image_payload
+
+PREVIEW_MAX_EDGE = int(os.getenv('PREVIEW_MAX_EDGE', '1024'))
+PREVIEW_CACHE_MB = int(os.getenv('PREVIEW_CACHE_MB', '64'))
+DECODED_CACHE_MB = int(os.getenv('DECODED_CACHE_MB', '256'))
+
+class _ByteLRU:
+    """LRU of values bounded by the total of their sizes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self.total = 0
+
+    def get(self, key) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.total -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.total += size
+        while self.total > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.total -= evicted
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class PreviewCache:
+    """
+    Decoded images and display-size previews, shared by all sessions.
+
+    Both are keyed by the SHA-256 of the source bytes, so a rerun (or another
+    session showing the same upload) reuses the work. Previews are encoded
+    once at display resolution and handed to st.image as bytes, which
+    Streamlit forwards without decoding and re-encoding the full image.
+    """
+
+    def __init__(
+        self,
+        preview_bytes: int = PREVIEW_CACHE_MB * 1024 * 1024,
+        decoded_bytes: int = DECODED_CACHE_MB * 1024 * 1024
+    ):
+        self._previews = _ByteLRU(preview_bytes)
+        self._decoded = _ByteLRU(decoded_bytes)
+        self._lock = threading.Lock()
+        self.stats = {'preview_hits': 0, 'previews': 0, 'decoded_hits': 0, 'decodes': 0}
+
+    def decoded(self, payload: ImagePayload) -> Image.Image:
+        """
+        Return the full-resolution image, decoded once.
+
+        Pixels are on the upload's own grid (EXIF orientation is not applied),
+        matching the masks drawn for it. The image is shared between callers:
+        copy it before modifying it.
+        """
+        with self._lock:
+            img = self._decoded.get(payload.sha256)
+            if img is not None:
+                self.stats['decoded_hits'] += 1
+                return img
+        img = Image.open(io.BytesIO(payload.data))
+        img.load()
+        with self._lock:
+            self.stats['decodes'] += 1
+            self._decoded.put(payload.sha256, img, img.width * img.height * len(img.getbands()))
+        return img
+
+    def preview(self, payload: ImagePayload, max_edge: int = PREVIEW_MAX_EDGE) -> bytes:
+        """Return the image encoded at no more than max_edge pixels on its longest side."""
+        key = (payload.sha256, max_edge)
+        with self._lock:
+            data = self._previews.get(key)
+            if data is not None:
+                self.stats['preview_hits'] += 1
+                return data
+        data = _render_preview(payload, max_edge)
+        with self._lock:
+            self.stats['previews'] += 1
+            # Uploads that are already small enough are shown as is and not copied
+            if data is not payload.data:
+                self._previews.put(key, data, len(data))
+        return data
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'previews_cached': len(self._previews),
+                'preview_bytes': self._previews.total,
+                'decoded_cached': len(self._decoded),
+                'decoded_bytes': self._decoded.total,
+                **self.stats
+            }
+
+def _render_preview(payload: ImagePayload, max_edge: int) -> bytes:
+    with Image.open(io.BytesIO(payload.data)) as img:
+        orientation = img.getexif().get(0x0112, 1)
+        if max(img.size) <= max_edge and orientation == 1 and img.format in ('JPEG', 'PNG'):
+            return payload.data
+        if img.format == 'JPEG':
+            img.draft('RGB', (max_edge, max_edge))
+        thumbnail = ImageOps.exif_transpose(img)
+        thumbnail.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    if thumbnail.mode in ('RGBA', 'LA', 'PA', 'P'):
+        thumbnail.save(buffer, format='PNG')
+    else:
+        thumbnail = thumbnail if thumbnail.mode in ('RGB', 'L') else thumbnail.convert('RGB')
+        thumbnail.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+@st.cache_resource
+def get_preview_cache() -> PreviewCache:
+    """Get the preview cache shared by all sessions."""
+    return PreviewCache()
+
+def preview_image(image: ImageInput, max_edge: int = PREVIEW_MAX_EDGE) -> bytes:
+    """Display-size version of an image, for st.image."""
+    return get_preview_cache().preview(as_image_payload(image), max_edge)
+
+def decoded_image(image: ImageInput) -> Image.Image:
+    """Full-resolution decoded image (shared; copy before modifying)."""
+    return get_preview_cache().decoded(as_image_payload(image))
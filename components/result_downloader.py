@@ -0,0 +1,210 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional
+
+import streamlit as st
+
+from components.blob_store import BlobStore, get_blob_store, blob_ref, is_blob_ref, digest_from_ref
+from components.database import get_database_manager
+from services.http_client import get_session, get_timeout
+
+DOWNLOAD_CACHE_MEMORY_MB = int(os.getenv('DOWNLOAD_CACHE_MEMORY_MB', '64'))
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+
+class ResultDownloader:
+    """
+    Downloads generated result images once and mirrors them into the blob store.
+
+    Recently used images are kept in a memory LRU; every download is also
+    written to the content-addressed blob store and linked to its URL, so an
+    image survives memory eviction, server restarts and the expiry of the
+    API's URL. Downloads run on a small thread pool, and concurrent requests
+    for the same URL share one download.
+    """
+
+    def __init__(
+        self,
+        blob_store: Optional[BlobStore] = None,
+        memory_bytes: int = DOWNLOAD_CACHE_MEMORY_MB * 1024 * 1024,
+        workers: int = DOWNLOAD_WORKERS
+    ):
+        self.blob_store = blob_store if blob_store is not None else BlobStore()
+        self.memory_bytes = memory_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_total = 0
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='result-download')
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'downloads': 0, 'errors': 0}
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, data: bytes):
+        """Put data in the memory LRU, evicting the least recently used entries."""
+        if len(data) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_total -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_total += len(data)
+        while self._memory_total > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_total -= len(evicted)
+
+    def _lookup(self, url: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return data
+        digest = self.blob_store.digest_for_url(url)
+        view = self.blob_store.read(digest) if digest else None
+        if view is None:
+            return None
+        data = bytes(view)
+        with self._lock:
+            self.stats['disk_hits'] += 1
+            self._remember(key, data)
+        return data
+
+    def _store(self, url: str, key: str, data: bytes):
+        digest = self.blob_store.put(data)
+        self.blob_store.link_url(url, digest)
+        with self._lock:
+            self._remember(key, data)
+
+    def _download(self, url: str, key: str) -> bytes:
+        try:
+            data = self._lookup(url, key)
+            if data is not None:
+                return data
+            response = get_session().get(url, timeout=get_timeout(''))
+            response.raise_for_status()
+            data = response.content
+            with self._lock:
+                self.stats['downloads'] += 1
+            self._store(url, key, data)
+            return data
+        except Exception:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _submit(self, url: str) -> Future:
+        key = self._key(url)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._download, url, key)
+                self._in_flight[key] = future
+            return future
+
+    def prefetch(self, urls: Iterable[str]):
+        """Start downloading and mirroring every URL that is not stored yet, in parallel."""
+        for url in urls:
+            if url and not is_blob_ref(url) and not os.path.isfile(url):
+                with self._lock:
+                    cached = self._key(url) in self._memory
+                if not cached and self.blob_store.digest_for_url(url) is None:
+                    self._submit(url)
+
+    def fetch(self, url: str) -> bytes:
+        """Return the image bytes for a URL or blob reference, downloading it if needed."""
+        if is_blob_ref(url):
+            view = self.blob_store.read(digest_from_ref(url))
+            if view is None:
+                raise FileNotFoundError(f"Image {url} is no longer stored")
+            return bytes(view)
+        # Cached API results point at local files instead of remote URLs
+        if os.path.isfile(url):
+            with open(url, 'rb') as f:
+                return f.read()
+        data = self._lookup(url, self._key(url))
+        if data is not None:
+            return data
+        return self._submit(url).result()
+
+    def mirror(self, url: str) -> Optional[str]:
+        """Make sure a URL's content is in the blob store and return its digest."""
+        if is_blob_ref(url):
+            digest = digest_from_ref(url)
+            return digest if self.blob_store.exists(digest) else None
+        if os.path.isfile(url):
+            with open(url, 'rb') as f:
+                return self.blob_store.put(f.read())
+        digest = self.blob_store.digest_for_url(url)
+        if digest is None:
+            self.fetch(url)
+            digest = self.blob_store.digest_for_url(url)
+        return digest
+
+    def path(self, url: str) -> Optional[str]:
+        """Local file holding a result (its blob, or a cached API result), or None if it is not stored."""
+        if is_blob_ref(url):
+            digest = digest_from_ref(url)
+            return self.blob_store.path(digest) if self.blob_store.exists(digest) else None
+        if os.path.isfile(url):
+            return url
+        digest = self.blob_store.digest_for_url(url)
+        return self.blob_store.path(digest) if digest else None
+
+    def open(self, url: str) -> BinaryIO:
+        """Open a result for reading from its local file, downloading and mirroring it first if needed."""
+        path = self.path(url)
+        if path is None:
+            data = self.fetch(url)
+            path = self.path(url)
+            if path is None:
+                return io.BytesIO(data)
+        return open(path, 'rb')
+
+    def lazy(self, url: str) -> Callable[[], BinaryIO]:
+        """A zero-argument callable for st.download_button that opens the result on click."""
+        return lambda: self.open(url)
+
+@st.cache_resource
+def get_result_downloader() -> ResultDownloader:
+    """Get the result downloader shared by all sessions."""
+    return ResultDownloader(blob_store=get_blob_store())
+
+def keep_results(urls: List[str], image_type: str, prompt: str = "", settings: Dict = None,
+                 user_id: Optional[int] = None) -> List[str]:
+    """
+    Mirror results into the blob store as soon as they land and add them to the user's image history.
+
+    Args:
+        urls: Result URLs (or local cached results) returned by the API
+        image_type: Kind of result recorded in the history, e.g. 'generated' or 'packshot'
+        prompt: Prompt the results were made from, if any
+        settings: Settings recorded with each result
+        user_id: Database id of the user whose history gets the results; None records nothing
+
+    Returns:
+        The local file of each result, in order, for st.image and download
+        buttons; a result that could not be downloaded keeps its URL
+    """
+    downloader = get_result_downloader()
+    downloader.prefetch(urls)
+    kept = []
+    for url in urls:
+        try:
+            digest = downloader.mirror(url)
+        except Exception as e:
+            print(f"Error mirroring result: {e}")
+            digest = None
+        if user_id is not None:
+            get_database_manager().save_generated_image(
+                user_id, blob_ref(digest) if digest else url, image_type, prompt, settings, source_url=url
+            )
+        kept.append(downloader.blob_store.path(digest) if digest else url)
+    return kept
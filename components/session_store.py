@@ -0,0 +1,253 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import streamlit as st
+
+from components.blob_store import BlobStore, get_blob_store
+from services.image_payload import ImagePayload
+from services.masks import MaskInput, PackedMask, fit_mask, load_mask, unreadable_mask
+
+SESSION_MEMORY_MB = int(os.getenv('SESSION_MEMORY_MB', '32'))
+SESSION_STORE_MEMORY_MB = int(os.getenv('SESSION_STORE_MEMORY_MB', '512'))
+
+class SessionHandle:
+    """Small reference to an image in the session store, kept in st.session_state."""
+
+    __slots__ = ('digest', 'name', 'size')
+
+    def __init__(self, digest: str, name: Optional[str], size: int):
+        self.digest = digest
+        self.name = name
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f"SessionHandle({self.digest[:12]}, {self.size} bytes)"
+
+class SessionStore:
+    """
+    Images of all sessions, held in memory up to a budget and spilled to disk.
+
+    Every image is written through to the blob store, so session state only
+    needs a SessionHandle. The decoded ImagePayload (with its cached base64
+    and downscaled variants) is kept in a memory LRU bounded both per session
+    and across all sessions; evicted entries are read back from disk on the
+    next access. Entry sizes are re-measured on every access, since payloads
+    grow as their encodings are memoized. The entry accessed last is never
+    the one spilled, so an upload larger than the budget stays in memory
+    until another image is used.
+    """
+
+    def __init__(
+        self,
+        blob_store: Optional[BlobStore] = None,
+        session_bytes: int = SESSION_MEMORY_MB * 1024 * 1024,
+        total_bytes: int = SESSION_STORE_MEMORY_MB * 1024 * 1024
+    ):
+        self.blob_store = blob_store if blob_store is not None else BlobStore()
+        self.session_bytes = session_bytes
+        self.total_bytes = total_bytes
+        # (session id, digest) -> [payload, bytes charged]
+        self._memory: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._session_totals: Dict[str, int] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self.stats = {'puts': 0, 'memory_hits': 0, 'disk_reads': 0, 'misses': 0, 'evictions': 0}
+
+    def _charge(self, key: Tuple[str, str], size: int):
+        entry = self._memory[key]
+        delta = size - entry[1]
+        entry[1] = size
+        self._session_totals[key[0]] = self._session_totals.get(key[0], 0) + delta
+        self._total += delta
+
+    def _drop(self, key: Tuple[str, str]):
+        _, size = self._memory.pop(key)
+        remaining = self._session_totals[key[0]] - size
+        if remaining:
+            self._session_totals[key[0]] = remaining
+        else:
+            del self._session_totals[key[0]]
+        self._total -= size
+
+    def _evict(self, session_id: str, pinned: Tuple[str, str]):
+        """Drop least recently used entries, except pinned, until the session and the store fit their budgets."""
+        while self._session_totals.get(session_id, 0) > self.session_bytes:
+            key = next((key for key in self._memory if key[0] == session_id and key != pinned), None)
+            if key is None:
+                break
+            self._drop(key)
+            self.stats['evictions'] += 1
+        while self._total > self.total_bytes:
+            key = next((key for key in self._memory if key != pinned), None)
+            if key is None:
+                break
+            self._drop(key)
+            self.stats['evictions'] += 1
+
+    def _remember(self, session_id: str, payload: ImagePayload):
+        key = (session_id, payload.sha256)
+        if key not in self._memory:
+            self._memory[key] = [payload, 0]
+        self._memory.move_to_end(key)
+        self._charge(key, payload.nbytes)
+        self._evict(session_id, key)
+
+    def put(self, session_id: str, data: bytes, name: Optional[str] = None) -> SessionHandle:
+        """Store an image for a session and return the handle to keep in session state."""
+        payload = ImagePayload(data, name)
+        self.blob_store.put(data)
+        with self._lock:
+            self.stats['puts'] += 1
+            self._remember(session_id, payload)
+        return SessionHandle(payload.sha256, name, len(data))
+
+    def get(self, session_id: str, handle: SessionHandle) -> Optional[ImagePayload]:
+        """Return the image behind a handle, or None if it is no longer stored."""
+        key = (session_id, handle.digest)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self.stats['memory_hits'] += 1
+                self._remember(session_id, entry[0])
+                return entry[0]
+        data = self.blob_store.read(handle.digest)
+        with self._lock:
+            if data is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_reads'] += 1
+            payload = ImagePayload(bytes(data), handle.name)
+            self._remember(session_id, payload)
+        return payload
+
+    def release(self, session_id: str, handle: SessionHandle):
+        """Drop a session's in-memory copy of an image; the blob on disk stays."""
+        with self._lock:
+            if (session_id, handle.digest) in self._memory:
+                self._drop((session_id, handle.digest))
+
+    def drop_sessions(self, keep) -> int:
+        """Drop the memory of every session whose id is not accepted by keep()."""
+        with self._lock:
+            closed = [key for key in self._memory if not keep(key[0])]
+            for key in closed:
+                self._drop(key)
+        return len(closed)
+
+    def session_usage(self, session_id: str) -> int:
+        """Bytes of images held in memory for a session."""
+        with self._lock:
+            return self._session_totals.get(session_id, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len(self._session_totals),
+                'entries': len(self._memory),
+                'bytes': self._total,
+                'per_session': dict(self._session_totals),
+                **self.stats
+            }
+
+@st.cache_resource
+def get_session_store() -> SessionStore:
+    """Get the session image store shared by all sessions."""
+    return SessionStore(blob_store=get_blob_store())
+
+def _session_id() -> str:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'default'
+
+def _is_active_session(session_id: str) -> bool:
+    from streamlit.runtime import Runtime
+    return not Runtime.exists() or Runtime.instance().is_active_session(session_id)
+
+def put_session_image(key: str, data: bytes, name: Optional[str] = None) -> SessionHandle:
+    """
+    Store an image for the current session under a session state key.
+
+    Args:
+        key: Session state key that receives the handle
+        data: Encoded image bytes
+        name: Original file name
+
+    Returns:
+        The handle now stored in st.session_state[key]
+    """
+    store = get_session_store()
+    session_id = _session_id()
+    previous = st.session_state.get(key)
+    if isinstance(previous, SessionHandle):
+        store.release(session_id, previous)
+    # Free the memory of sessions that have disconnected since the last upload
+    store.drop_sessions(_is_active_session)
+    handle = store.put(session_id, data, name)
+    st.session_state[key] = handle
+    return handle
+
+def get_session_image(key: str, source: Any = None) -> Optional[ImagePayload]:
+    """
+    Return the image stored under a session state key.
+
+    Args:
+        key: Session state key holding a SessionHandle
+        source: Optional uploaded file to store again if the image was evicted
+
+    Returns:
+        The image as an ImagePayload, or None if there is none
+    """
+    handle = st.session_state.get(key)
+    payload = get_session_store().get(_session_id(), handle) if isinstance(handle, SessionHandle) else None
+    if payload is None and source is not None:
+        put_session_image(key, source.getvalue(), getattr(source, 'name', None))
+        payload = get_session_store().get(_session_id(), st.session_state[key])
+    return payload
+
+def put_session_mask(
+    key: str,
+    mask: MaskInput,
+    size: Optional[Tuple[int, int]] = None,
+    source: Optional[str] = None
+) -> PackedMask:
+    """
+    Store a mask for the current session, bit-packed and fitted to an image.
+
+    Args:
+        key: Session state key that receives the mask
+        mask: Mask in any form load_mask() accepts
+        size: (width, height) to fit the mask to, or None to keep its own size
+        source: Identifies where the mask came from (e.g. an upload's file id);
+            storing the same source again returns the stored mask unchanged
+
+    Returns:
+        The stored PackedMask
+
+    Raises:
+        ValueError: If the mask cannot be read
+    """
+    size = tuple(size) if size is not None else None
+    stored = st.session_state.get(key)
+    if source is not None and stored is not None and stored[0] == source and size in (None, stored[1].size):
+        return stored[1]
+    if not isinstance(mask, PackedMask) or size not in (None, mask.size):
+        try:
+            values = load_mask(mask)
+            mask = PackedMask.from_array(values if size is None else fit_mask(values, size))
+        except OSError as e:
+            raise unreadable_mask(e)
+    st.session_state[key] = (source, mask)
+    return mask
+
+def get_session_mask(key: str, size: Tuple[int, int]) -> PackedMask:
+    """Return the mask stored under key, starting from an empty mask of the given size."""
+    stored = st.session_state.get(key)
+    if stored is None or stored[1].size != tuple(size):
+        return put_session_mask(key, PackedMask.empty(size), size)
+    return stored[1]
+
+def get_session_bytes() -> int:
+    """Bytes of images the current session holds in memory."""
+    return get_session_store().session_usage(_session_id())
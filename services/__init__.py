@@ -1,10 +1,22 @@
-from .lifestyle_shot import lifestyle_shot_by_text, lifestyle_shot_by_image
-from .shadow import add_shadow
-from .packshot import create_packshot
-from .prompt_enhancement import enhance_prompt
-from .generative_fill import generative_fill
-from .hd_image_generation import generate_hd_image
-from .erase_foreground import erase_foreground
+from .lifestyle_shot import (
+    lifestyle_shot_by_text,
+    lifestyle_shot_by_image,
+    lifestyle_shot_by_text_async,
+    lifestyle_shot_by_image_async
+)
+from .shadow import add_shadow, add_shadow_async
+from .packshot import create_packshot, create_packshot_async
+from .prompt_enhancement import enhance_prompt, enhance_prompt_async
+from .generative_fill import generative_fill, generative_fill_async
+from .crop_fill import generative_fill_cropped, generative_fill_cropped_async
+from .tiling import (
+    tiled_generative_fill,
+    tiled_erase_foreground,
+    tiled_generative_fill_async,
+    tiled_erase_foreground_async
+)
+from .hd_image_generation import generate_hd_image, generate_hd_image_async
+from .erase_foreground import erase_foreground, erase_foreground_async
 
 __all__ = [
     'lifestyle_shot_by_text',
@@ -13,6 +25,20 @@ __all__ = [
     'create_packshot',
     'enhance_prompt',
     'generative_fill',
+    'generative_fill_cropped',
+    'tiled_generative_fill',
     'generate_hd_image',
-    'erase_foreground'
-] 
\ No newline at end of file
+    'erase_foreground',
+    'tiled_erase_foreground',
+    'lifestyle_shot_by_text_async',
+    'lifestyle_shot_by_image_async',
+    'add_shadow_async',
+    'create_packshot_async',
+    'enhance_prompt_async',
+    'generative_fill_async',
+    'generative_fill_cropped_async',
+    'tiled_generative_fill_async',
+    'generate_hd_image_async',
+    'erase_foreground_async',
+    'tiled_erase_foreground_async'
+]
@@ -0,0 +1,197 @@
+"""
+Structured logging for Bria AI API calls.
+
+Service-layer events go to the 'adsnap.services' logger as JSON lines, one
+object per event, with a per-request id, the endpoint, byte counts and
+latency. Request payloads are only logged at DEBUG and always redacted:
+API tokens are masked and base64 image fields are replaced by their length.
+Successful calls are sampled so a busy app does not flood the log; failures
+are always written.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+from .image_payload import ImagePayload
+
+LOG_LEVEL = os.getenv('BRIA_LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('BRIA_LOG_FILE', '')
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv('BRIA_LOG_SUCCESS_SAMPLE_RATE', '0.1'))
+
+# Longest string value written as-is; longer values are truncated
+MAX_FIELD_CHARS = 256
+SENSITIVE_KEYS = {'api_token', 'api_key', 'authorization', 'password', 'token'}
+
+_settings = {
+    'success_sample_rate': LOG_SUCCESS_SAMPLE_RATE,
+}
+_logger = logging.getLogger('adsnap.services')
+_lock = threading.Lock()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format a record as a single JSON object; extra fields come from record.fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    log_file: Optional[str] = None,
+    success_sample_rate: Optional[float] = None
+):
+    """
+    Set up the service logger's JSON-lines sink.
+
+    Args:
+        level: Logging level name, e.g. 'DEBUG' to include redacted payloads
+        log_file: Append JSON lines to this file instead of stderr
+        success_sample_rate: Fraction of successful calls to log (0-1)
+    """
+    with _lock:
+        if success_sample_rate is not None:
+            _settings['success_sample_rate'] = max(0.0, min(1.0, success_sample_rate))
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+            handler.close()
+        path = log_file if log_file is not None else LOG_FILE
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            handler = logging.FileHandler(path, encoding='utf-8')
+        else:
+            handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonLinesFormatter())
+        _logger.addHandler(handler)
+        _logger.setLevel((level or LOG_LEVEL).upper())
+        _logger.propagate = False
+
+
+def get_logger() -> logging.Logger:
+    """Get the service logger, installing the default sink on first use."""
+    if not _logger.handlers:
+        configure_logging()
+    return _logger
+
+
+def new_request_id() -> str:
+    """Short random id tying together the log lines of one API call."""
+    return uuid.uuid4().hex[:12]
+
+
+def redact(value: Any, key: str = '') -> Any:
+    """
+    Copy a payload with secrets masked and long strings shortened.
+
+    Base64 uploads become '<base64: N chars>' so logging a request costs a
+    few bytes instead of the whole image.
+    """
+    if key.lower() in SENSITIVE_KEYS:
+        return '***'
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item, key) for item in value]
+    if isinstance(value, ImagePayload):
+        return f"<{value.mime_type}: {len(value)} bytes>"
+    if isinstance(value, (bytes, bytearray)):
+        return f"<bytes: {len(value)}>"
+    if isinstance(value, str) and len(value) > MAX_FIELD_CHARS:
+        if value.startswith(('http://', 'https://')):
+            return value[:MAX_FIELD_CHARS] + '...'
+        if ' ' not in value[:MAX_FIELD_CHARS]:
+            return f"<base64: {len(value)} chars>"
+        return value[:MAX_FIELD_CHARS] + f"... (+{len(value) - MAX_FIELD_CHARS} chars)"
+    return value
+
+
+def log_event(level: int, event: str, **fields):
+    """Write one structured event to the service log."""
+    logger = get_logger()
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields})
+
+
+def log_payload(endpoint: str, data: Dict[str, Any], request_id: Optional[str] = None):
+    """Log a redacted request body at DEBUG; redaction is skipped when DEBUG is off."""
+    logger = get_logger()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('api.payload', extra={'fields': {
+            'request_id': request_id,
+            'endpoint': endpoint,
+            'payload': redact(data),
+        }})
+
+
+def log_api_call(
+    request_id: str,
+    endpoint: str,
+    started: float,
+    status: Optional[int] = None,
+    request_bytes: Optional[int] = None,
+    response_bytes: Optional[int] = None,
+    error: Optional[BaseException] = None,
+    response_text: Optional[str] = None
+):
+    """
+    Log the outcome of one API call.
+
+    Failures are always logged at WARNING with a truncated response body;
+    successes are logged at INFO for a sampled fraction of calls (all of
+    them at DEBUG).
+
+    Args:
+        request_id: Id from new_request_id()
+        endpoint: Endpoint path
+        started: time.monotonic() when the call began
+        status: Final HTTP status, if a response was received
+        request_bytes: Size of the request body sent
+        response_bytes: Size of the response body received
+        error: Exception that ended the call, if any
+        response_text: Response body, only logged for failures
+    """
+    logger = get_logger()
+    fields = {
+        'request_id': request_id,
+        'endpoint': endpoint,
+        'status': status,
+        'request_bytes': request_bytes,
+        'response_bytes': response_bytes,
+        'latency_ms': round((time.monotonic() - started) * 1000, 1),
+    }
+    if error is not None:
+        fields['error'] = str(error)
+        if response_text:
+            fields['response'] = redact(response_text)
+        logger.warning('api.error', extra={'fields': fields})
+        return
+    if logger.isEnabledFor(logging.DEBUG) or (
+        logger.isEnabledFor(logging.INFO) and random.random() < _settings['success_sample_rate']
+    ):
+        logger.info('api.success', extra={'fields': fields})
+
+
+__all__ = [
+    'JsonLinesFormatter',
+    'configure_logging',
+    'get_logger',
+    'new_request_id',
+    'redact',
+    'log_event',
+    'log_payload',
+    'log_api_call'
+]
@@ -0,0 +1,122 @@
+"""
+Async HTTP client for Bria AI API calls.
+
+Mirrors services.http_client on top of httpx.AsyncClient so many requests can
+be awaited concurrently on one event loop. One pooled client is kept per
+running event loop, since httpx connections cannot be shared across loops.
+"""
+import asyncio
+import time
+import weakref
+from typing import Dict, Any, Optional, Union
+
+import httpx
+
+from .api_logging import new_request_id, log_payload, log_api_call
+from .image_payload import encode_request_body
+from .http_client import endpoint_url, get_timeout, build_headers, get_pool_size
+from .rate_limiter import rate_limited_async
+from .resilience import call_with_resilience_async
+from .single_flight import get_single_flight, request_key
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the pooled async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        pool_size = get_pool_size()
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            )
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the async client bound to the running event loop, if any."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def post_async(endpoint: str, api_key: str, data: Union[Dict[str, Any], bytes]) -> httpx.Response:
+    """
+    POST a JSON body to a Bria endpoint over the loop's pooled async client.
+
+    Args:
+        endpoint: Endpoint path, e.g. 'v1/product/packshot'
+        api_key: Bria AI API key
+        data: Request dict (ImagePayload values allowed) or an encoded JSON body
+
+    Returns:
+        The httpx.Response (status is not checked here)
+    """
+    connect_timeout, read_timeout = get_timeout(endpoint)
+    return await get_async_client().post(
+        endpoint_url(endpoint),
+        headers=build_headers(api_key),
+        content=data if isinstance(data, bytes) else encode_request_body(data),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+    )
+
+
+def _request_bytes(response: Optional[httpx.Response]) -> Optional[int]:
+    """Size of the body that was sent for a response, without re-serializing it."""
+    if response is None:
+        return None
+    try:
+        return len(response.request.content)
+    except httpx.RequestNotRead:
+        return None
+
+
+async def request_json_async(endpoint: str, api_key: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Async counterpart of services.http_client.request_json."""
+    async def _send() -> Dict[str, Any]:
+        request_id = new_request_id()
+        log_payload(endpoint, data, request_id)
+        started = time.monotonic()
+        response = None
+        try:
+            body = encode_request_body(data)
+            response = await call_with_resilience_async(
+                endpoint,
+                lambda: rate_limited_async(api_key, endpoint, lambda: post_async(endpoint, api_key, body))
+            )
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            if getattr(e, 'response', None) is not None:
+                response = e.response
+            log_api_call(
+                request_id, endpoint, started,
+                status=getattr(response, 'status_code', None),
+                request_bytes=_request_bytes(response),
+                response_bytes=len(response.content) if response is not None else None,
+                error=e,
+                response_text=response.text if response is not None else None
+            )
+            raise
+        log_api_call(
+            request_id, endpoint, started,
+            status=response.status_code,
+            request_bytes=_request_bytes(response),
+            response_bytes=len(response.content)
+        )
+        return result
+
+    return await get_single_flight().do_async(request_key(api_key, endpoint, data), _send)
+
+
+__all__ = [
+    'get_async_client',
+    'close_async_client',
+    'post_async',
+    'request_json_async'
+]
@@ -0,0 +1,309 @@
+"""
+Crop-to-mask generative fill.
+
+Most fills change a small patch of a large photo, yet the whole image and
+mask are uploaded and the provider regenerates every pixel. In crop mode only
+the mask's bounding box plus some surrounding context is sent. The result is
+pasted back into the full-resolution original with a feathered edge, and the
+composite is written to a local file whose path replaces the API's result URL
+in the response, the same way cached results are served.
+"""
+import asyncio
+import hashlib
+import io
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .generative_fill import generative_fill, generative_fill_async
+from .http_client import get_session, get_timeout
+from .image_payload import ImageInput, ImagePayload, as_image_payload
+from .masks import check_mask, dilate, feather, fit_mask, load_mask, unreadable_mask
+from .preprocess import EXIF_ORIENTATION_TAG, ORIENTATION_TRANSPOSE
+from .result_cache import extract_result_urls, _replace_urls
+
+CROP_TO_MASK = os.getenv('BRIA_CROP_TO_MASK', 'false').lower() == 'true'
+CROP_MARGIN = float(os.getenv('BRIA_CROP_MARGIN', '0.25'))
+CROP_MIN_EDGE = int(os.getenv('BRIA_CROP_MIN_EDGE', '512'))
+CROP_FEATHER = int(os.getenv('BRIA_CROP_FEATHER', '8'))
+COMPOSITE_DIR = os.getenv('BRIA_COMPOSITE_DIR', 'data/cache/composites')
+COMPOSITE_MAX_MB = int(os.getenv('BRIA_COMPOSITE_MAX_MB', '512'))
+
+# Above this fraction of the image a crop saves too little to be worth it
+MAX_CROP_FRACTION = 0.6
+
+
+class CropPlan:
+    """The region of an image sent to the API and what is needed to paste it back."""
+
+    def __init__(self, original: Image.Image, box: Tuple[int, int, int, int], mask: np.ndarray,
+                 image: ImagePayload, mask_payload: ImagePayload):
+        self.original = original
+        self.box = box
+        # Boolean mask of the crop, for blending the result back in
+        self.mask = mask
+        self.image = image
+        self.mask_payload = mask_payload
+
+
+def crop_box(
+    mask: np.ndarray,
+    margin: float = CROP_MARGIN,
+    min_edge: int = CROP_MIN_EDGE,
+    feather_radius: int = CROP_FEATHER
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding box (left, top, right, bottom) of a mask plus context.
+
+    The box grows by margin times its longest side (and at least enough
+    for the feathered edge to fade out inside it), then to min_edge per
+    side, clamped to the image. Returns None if the mask is empty.
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if not rows.size:
+        return None
+    height, width = mask.shape
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    left, right = int(cols[0]), int(cols[-1]) + 1
+    pad = max(round(margin * max(right - left, bottom - top)), 3 * feather_radius)
+
+    def expand(start: int, end: int, limit: int) -> Tuple[int, int]:
+        start, end = start - pad, end + pad
+        short = min_edge - (end - start)
+        if short > 0:
+            start, end = start - short // 2, end + short - short // 2
+        # Shift back inside the image before clamping, to keep the size where possible
+        if start < 0:
+            start, end = 0, end - start
+        if end > limit:
+            start, end = start - (end - limit), limit
+        return max(0, start), min(limit, end)
+
+    left, right = expand(left, right, width)
+    top, bottom = expand(top, bottom, height)
+    return left, top, right, bottom
+
+
+def encode_image(img: Image.Image, quality: int = 95) -> bytes:
+    """Encode an upright RGB image as JPEG, or as PNG when it has alpha."""
+    buffer = io.BytesIO()
+    if img.mode in ('RGBA', 'LA'):
+        img.save(buffer, format='PNG')
+    else:
+        img.convert('RGB').save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def load_upright(image: ImageInput, mask: Optional[ImageInput]) -> Tuple[Image.Image, Optional[np.ndarray]]:
+    """
+    Decode an image and its mask, both turned upright by the image's EXIF orientation.
+
+    Returns:
+        Tuple of (image in RGB or RGBA, boolean mask fitted to it or None)
+
+    Raises:
+        ValueError: If the mask cannot be read or masks nothing
+    """
+    payload = as_image_payload(image)
+    with Image.open(io.BytesIO(payload.data)) as img:
+        raw_size = img.size
+        transpose = ORIENTATION_TRANSPOSE.get(img.getexif().get(EXIF_ORIENTATION_TAG, 1))
+        original = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    if transpose is not None:
+        original = original.transpose(transpose)
+    if mask is None:
+        return original, None
+
+    try:
+        with Image.open(io.BytesIO(as_image_payload(mask).data)) as mask_img:
+            mask_img = mask_img.convert('L')
+            # Same rule as upload preprocessing: a mask on the raw grid gets the image's orientation
+            if transpose is not None and mask_img.size == raw_size:
+                mask_img = mask_img.transpose(transpose)
+            values = fit_mask(load_mask(mask_img), original.size)
+    except OSError as e:
+        raise unreadable_mask(e)
+    check_mask(values)
+    return original, values
+
+
+def plan_crop(image: ImageInput, mask: ImageInput) -> Optional[CropPlan]:
+    """
+    Work out the crop to send for an image and mask.
+
+    Both are brought upright first, so the crop carries no EXIF orientation.
+    Returns None when cropping would not save enough to be worth it.
+
+    Raises:
+        ValueError: If the mask cannot be read or masks nothing
+    """
+    original, values = load_upright(image, mask)
+    box = crop_box(values)
+    left, top, right, bottom = box
+    if (right - left) * (bottom - top) > MAX_CROP_FRACTION * original.width * original.height:
+        return None
+    mask_crop = values[top:bottom, left:right]
+    mask_buffer = io.BytesIO()
+    Image.fromarray(mask_crop).save(mask_buffer, format='PNG')
+    return CropPlan(
+        original, box, mask_crop,
+        ImagePayload(encode_image(original.crop(box)), as_image_payload(image).name),
+        ImagePayload(mask_buffer.getvalue())
+    )
+
+
+def paste_back(plan: CropPlan, result: bytes, feather_radius: int = CROP_FEATHER) -> Image.Image:
+    """
+    Blend a generated crop into the original image.
+
+    The mask is grown and feathered so the seam falls on pixels the API
+    reproduced from context rather than on the generated content.
+    """
+    left, top, right, bottom = plan.box
+    with Image.open(io.BytesIO(result)) as generated:
+        generated = generated.convert(plan.original.mode)
+        if generated.size != (right - left, bottom - top):
+            generated = generated.resize((right - left, bottom - top), Image.Resampling.LANCZOS)
+    alpha = feather(dilate(plan.mask, feather_radius), feather_radius)
+    composite = plan.original.copy()
+    composite.paste(generated, (left, top), Image.fromarray(alpha))
+    return composite
+
+
+def fetch_result(url: str) -> bytes:
+    """Download a result image, or read it if the URL is a local (cached) file."""
+    if os.path.isfile(url):
+        with open(url, 'rb') as f:
+            return f.read()
+    response = get_session().get(url, timeout=get_timeout(''))
+    response.raise_for_status()
+    return response.content
+
+
+def save_composite(img: Image.Image) -> str:
+    """Write a composited result under COMPOSITE_DIR and return its path."""
+    data = encode_image(img)
+    extension = '.png' if img.mode == 'RGBA' else '.jpg'
+    os.makedirs(COMPOSITE_DIR, exist_ok=True)
+    path = os.path.join(COMPOSITE_DIR, hashlib.sha256(data).hexdigest() + extension)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        _prune_composites(keep=path)
+    return path
+
+
+def _prune_composites(keep: str):
+    """Remove the oldest composites once the directory outgrows its cap."""
+    entries: List[Tuple[float, int, str]] = []
+    with os.scandir(COMPOSITE_DIR) as it:
+        for item in it:
+            if item.is_file() and item.path != keep:
+                stat = item.stat()
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+    total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= COMPOSITE_MAX_MB * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def composite_response(plan: CropPlan, response: Dict[str, Any]) -> Dict[str, Any]:
+    """Paste every result of a cropped request back and point the response at the composites."""
+    mapping = {}
+    for url in extract_result_urls(response):
+        mapping[url] = save_composite(paste_back(plan, fetch_result(url)))
+    composited = _replace_urls(response, mapping)
+    composited['crop_box'] = list(plan.box)
+    return composited
+
+
+def generative_fill_cropped(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: ImageInput,
+    prompt: str,
+    negative_prompt: Optional[str] = None,
+    num_results: int = 4,
+    sync: bool = True,
+    seed: Optional[int] = None,
+    content_moderation: bool = False,
+    mask_type: str = "manual",
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Generative fill that uploads only the masked region and its surroundings.
+
+    Takes the same arguments as generative_fill. The results are composited
+    locally, so the request always waits for them (sync is ignored). Falls
+    back to a regular fill when the mask covers most of the image.
+    """
+    plan = plan_crop(image_data, mask_data)
+    if plan is None:
+        return generative_fill(
+            api_key, image_data, mask_data, prompt, negative_prompt, num_results,
+            sync, seed, content_moderation, mask_type, use_cache
+        )
+    response = generative_fill(
+        api_key, plan.image, plan.mask_payload, prompt, negative_prompt, num_results,
+        True, seed, content_moderation, mask_type, use_cache
+    )
+    try:
+        return composite_response(plan, response)
+    except Exception as e:
+        raise Exception(f"Generative fill failed: could not paste the result back: {str(e)}")
+
+
+async def generative_fill_cropped_async(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: ImageInput,
+    prompt: str,
+    negative_prompt: Optional[str] = None,
+    num_results: int = 4,
+    sync: bool = True,
+    seed: Optional[int] = None,
+    content_moderation: bool = False,
+    mask_type: str = "manual",
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Async variant of generative_fill_cropped; takes the same arguments."""
+    plan = await asyncio.to_thread(plan_crop, image_data, mask_data)
+    if plan is None:
+        return await generative_fill_async(
+            api_key, image_data, mask_data, prompt, negative_prompt, num_results,
+            sync, seed, content_moderation, mask_type, use_cache
+        )
+    response = await generative_fill_async(
+        api_key, plan.image, plan.mask_payload, prompt, negative_prompt, num_results,
+        True, seed, content_moderation, mask_type, use_cache
+    )
+    try:
+        return await asyncio.to_thread(composite_response, plan, response)
+    except Exception as e:
+        raise Exception(f"Generative fill failed: could not paste the result back: {str(e)}")
+
+
+__all__ = [
+    'CROP_TO_MASK',
+    'CropPlan',
+    'crop_box',
+    'load_upright',
+    'plan_crop',
+    'paste_back',
+    'composite_response',
+    'encode_image',
+    'fetch_result',
+    'save_composite',
+    'generative_fill_cropped',
+    'generative_fill_cropped_async'
+]
@@ -1,57 +1,78 @@
-from typing import Dict, Any, Optional
-import requests
-import base64
+from typing import Dict, Any, Optional, Tuple
+from .http_client import request_json
+from .async_http_client import request_json_async
+from .result_cache import cached_call, cached_call_async
+from .image_payload import ImageInput
+from .validation import validate_request
+from .preprocess import prepare_upload
 
-def erase_foreground(
-    api_key: str,
-    image_data: bytes = None,
+def build_erase_foreground_request(
+    image_data: ImageInput = None,
     image_url: str = None,
     content_moderation: bool = False
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
-    Erase the foreground from an image and generate the area behind it.
-    
-    Args:
-        api_key: Bria AI API key
-        image_data: Image data in bytes (optional if image_url provided)
-        image_url: URL of the image (optional if image_data provided)
-        content_moderation: Whether to enable content moderation
+    Build the endpoint and request body for an erase foreground call.
+
+    Returns:
+        Tuple of (endpoint path, request data)
     """
-    url = "https://engine.prod.bria-api.com/v1/erase_foreground"
-    
-    headers = {
-        'api_token': api_key,
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
-    
+    endpoint = "v1/erase_foreground"
+
     # Prepare request data
     data = {
         'content_moderation': content_moderation
     }
-    
+
     # Add image data
     if image_url:
         data['image_url'] = image_url
     elif image_data:
-        data['file'] = base64.b64encode(image_data).decode('utf-8')
+        data['file'] = prepare_upload(image_data, endpoint)
     else:
         raise ValueError("Either image_data or image_url must be provided")
-    
+
+    validate_request(endpoint, data)
+    return endpoint, data
+
+def erase_foreground(
+    api_key: str,
+    image_data: ImageInput = None,
+    image_url: str = None,
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Erase the foreground from an image and generate the area behind it.
+
+    Args:
+        api_key: Bria AI API key
+        image_data: Image bytes or an ImagePayload (optional if image_url provided)
+        image_url: URL of the image (optional if image_data provided)
+        content_moderation: Whether to enable content moderation
+        use_cache: Reuse a locally cached result (None follows the endpoint default)
+    """
+    endpoint, data = build_erase_foreground_request(image_data, image_url, content_moderation)
+
+    try:
+        return cached_call(endpoint, data, use_cache, lambda: request_json(endpoint, api_key, data))
+    except Exception as e:
+        raise Exception(f"Erase foreground failed: {str(e)}")
+
+async def erase_foreground_async(
+    api_key: str,
+    image_data: ImageInput = None,
+    image_url: str = None,
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Async variant of erase_foreground; takes the same arguments."""
+    endpoint, data = build_erase_foreground_request(image_data, image_url, content_moderation)
+
     try:
-        print(f"Making request to: {url}")
-        print(f"Headers: {headers}")
-        print(f"Data: {data}")
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
-        
-        return response.json()
+        return await cached_call_async(endpoint, data, use_cache, lambda: request_json_async(endpoint, api_key, data))
     except Exception as e:
         raise Exception(f"Erase foreground failed: {str(e)}")
 
 # Export the function
-__all__ = ['erase_foreground'] 
\ No newline at end of file
+__all__ = ['erase_foreground', 'erase_foreground_async']
@@ -0,0 +1,35 @@
+"""
+Stable fingerprints of Bria API requests.
+
+Used to recognise identical requests for the result cache and single-flight
+coalescing: the endpoint, a digest of each uploaded file and the remaining
+parameters serialized with sorted keys.
+"""
+import hashlib
+import json
+from typing import Dict, Any
+
+from .image_payload import ImagePayload
+
+# Request fields that carry base64-encoded uploads
+FILE_FIELDS = ('file', 'mask_file', 'ref_image_file')
+
+
+def request_fingerprint(endpoint: str, data: Dict[str, Any]) -> str:
+    """Hash the endpoint, uploaded file contents and normalized parameters."""
+    digest = hashlib.sha256(endpoint.encode('utf-8'))
+    for field in FILE_FIELDS:
+        if field in data:
+            digest.update(field.encode('utf-8'))
+            value = data[field]
+            if isinstance(value, ImagePayload):
+                # Memoized on the payload, so repeat requests skip re-hashing
+                digest.update(bytes.fromhex(value.sha256))
+            else:
+                digest.update(hashlib.sha256(str(value).encode('utf-8')).digest())
+    params = {k: v for k, v in data.items() if k not in FILE_FIELDS}
+    digest.update(json.dumps(params, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    return digest.hexdigest()
+
+
+__all__ = ['FILE_FIELDS', 'request_fingerprint']
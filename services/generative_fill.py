@@ -1,11 +1,14 @@
-from typing import Dict, Any, Optional
-import requests
-import base64
+from typing import Dict, Any, Optional, Tuple
+from .http_client import request_json
+from .async_http_client import request_json_async
+from .result_cache import cached_call, cached_call_async
+from .image_payload import ImageInput
+from .validation import validate_request
+from .preprocess import prepare_image_and_mask
 
-def generative_fill(
-    api_key: str,
-    image_data: bytes,
-    mask_data: bytes,
+def build_generative_fill_request(
+    image_data: ImageInput,
+    mask_data: ImageInput,
     prompt: str,
     negative_prompt: Optional[str] = None,
     num_results: int = 4,
@@ -13,62 +16,97 @@ def generative_fill(
     seed: Optional[int] = None,
     content_moderation: bool = False,
     mask_type: str = "manual"
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
-    Generate content in a masked area of an image using a text prompt.
-    
-    Args:
-        api_key: Bria AI API key
-        image_data: Image data in bytes
-        mask_data: Mask image data in bytes
-        prompt: Description of what to generate in the masked area
-        negative_prompt: Description of what to avoid (optional)
-        num_results: Number of variations to generate (1-4)
-        sync: Whether to wait for results
-        seed: Optional seed for reproducible results
-        content_moderation: Whether to enable content moderation
-        mask_type: Type of mask ('manual' or 'automatic')
+    Build the endpoint and request body for a generative fill call.
+
+    Returns:
+        Tuple of (endpoint path, request data)
     """
-    url = "https://engine.prod.bria-api.com/v1/gen_fill"
-    
-    headers = {
-        'api_token': api_key,
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
-    
-    # Convert image and mask to base64
-    image_base64 = base64.b64encode(image_data).decode('utf-8')
-    mask_base64 = base64.b64encode(mask_data).decode('utf-8')
-    
+    endpoint = "v1/gen_fill"
+
+    # Downscale oversized uploads, keeping the mask aligned with the image
+    image_payload, mask_payload = prepare_image_and_mask(image_data, mask_data, endpoint)
+
     # Prepare request data
     data = {
-        'file': image_base64,
-        'mask_file': mask_base64,
+        'file': image_payload,
+        'mask_file': mask_payload,
         'mask_type': mask_type,
         'prompt': prompt,
         'num_results': num_results,
         'sync': sync,
         'content_moderation': content_moderation
     }
-    
+
     # Add optional parameters
     if negative_prompt:
         data['negative_prompt'] = negative_prompt
     if seed is not None:
         data['seed'] = seed
-    
+
+    validate_request(endpoint, data)
+    return endpoint, data
+
+def generative_fill(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: ImageInput,
+    prompt: str,
+    negative_prompt: Optional[str] = None,
+    num_results: int = 4,
+    sync: bool = False,
+    seed: Optional[int] = None,
+    content_moderation: bool = False,
+    mask_type: str = "manual",
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Generate content in a masked area of an image using a text prompt.
+
+    Args:
+        api_key: Bria AI API key
+        image_data: Image bytes or an ImagePayload
+        mask_data: Mask image bytes or an ImagePayload
+        prompt: Description of what to generate in the masked area
+        negative_prompt: Description of what to avoid (optional)
+        num_results: Number of variations to generate (1-4)
+        sync: Whether to wait for results
+        seed: Optional seed for reproducible results
+        content_moderation: Whether to enable content moderation
+        mask_type: Type of mask ('manual' or 'automatic')
+        use_cache: Reuse a locally cached result (None follows the endpoint default)
+    """
+    endpoint, data = build_generative_fill_request(
+        image_data, mask_data, prompt, negative_prompt, num_results,
+        sync, seed, content_moderation, mask_type
+    )
+
+    try:
+        return cached_call(endpoint, data, use_cache, lambda: request_json(endpoint, api_key, data))
+    except Exception as e:
+        raise Exception(f"Generative fill failed: {str(e)}")
+
+async def generative_fill_async(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: ImageInput,
+    prompt: str,
+    negative_prompt: Optional[str] = None,
+    num_results: int = 4,
+    sync: bool = False,
+    seed: Optional[int] = None,
+    content_moderation: bool = False,
+    mask_type: str = "manual",
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Async variant of generative_fill; takes the same arguments."""
+    endpoint, data = build_generative_fill_request(
+        image_data, mask_data, prompt, negative_prompt, num_results,
+        sync, seed, content_moderation, mask_type
+    )
+
     try:
-        print(f"Making request to: {url}")
-        print(f"Headers: {headers}")
-        print(f"Data: {data}")
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
-        
-        return response.json()
+        return await cached_call_async(endpoint, data, use_cache, lambda: request_json_async(endpoint, api_key, data))
     except Exception as e:
-        raise Exception(f"Generative fill failed: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Generative fill failed: {str(e)}")
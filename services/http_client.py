@@ -0,0 +1,244 @@
+"""
+Shared HTTP client for Bria AI API calls.
+
+Every service sends its requests through one process-wide requests.Session so
+TCP/TLS connections to the API host are pooled and kept alive between calls.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .image_payload import encode_request_body
+from .api_logging import new_request_id, log_payload, log_api_call, log_event
+from .rate_limiter import rate_limited
+from .resilience import call_with_resilience
+from .single_flight import get_single_flight, request_key
+
+BRIA_API_BASE_URL = os.getenv('BRIA_API_BASE_URL', 'https://engine.prod.bria-api.com')
+POOL_SIZE = int(os.getenv('BRIA_POOL_SIZE', '10'))
+CONNECT_TIMEOUT = float(os.getenv('BRIA_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('BRIA_READ_TIMEOUT', '60'))
+
+# Read timeouts (seconds) per endpoint path prefix; generation endpoints
+# running with sync=True can legitimately take a couple of minutes.
+ENDPOINT_READ_TIMEOUTS = {
+    'v1/prompt_enhancer': 30,
+    'v1/text-to-image/hd': 180,
+    'v1/product/lifestyle_shot_by_text': 180,
+    'v1/product/lifestyle_shot_by_image': 180,
+    'v1/gen_fill': 180,
+    'v1/erase_foreground': 120,
+    'v1/product/packshot': 90,
+    'v1/product/shadow': 90,
+}
+
+_settings = {
+    'base_url': BRIA_API_BASE_URL,
+    'pool_size': POOL_SIZE,
+    'connect_timeout': CONNECT_TIMEOUT,
+    'read_timeout': READ_TIMEOUT,
+    'endpoint_timeouts': dict(ENDPOINT_READ_TIMEOUTS),
+}
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+
+def configure_client(
+    base_url: Optional[str] = None,
+    pool_size: Optional[int] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+    endpoint_timeouts: Optional[Dict[str, float]] = None
+):
+    """
+    Override client settings and drop the current session.
+
+    Args:
+        base_url: API host, e.g. a local stub server in tests
+        pool_size: Maximum number of kept-alive connections per host
+        connect_timeout: Default connect timeout in seconds
+        read_timeout: Default read timeout in seconds
+        endpoint_timeouts: Read timeouts keyed by endpoint path prefix
+    """
+    global _session
+    with _lock:
+        if base_url is not None:
+            _settings['base_url'] = base_url.rstrip('/')
+        if pool_size is not None:
+            _settings['pool_size'] = pool_size
+        if connect_timeout is not None:
+            _settings['connect_timeout'] = connect_timeout
+        if read_timeout is not None:
+            _settings['read_timeout'] = read_timeout
+        if endpoint_timeouts:
+            _settings['endpoint_timeouts'].update(endpoint_timeouts)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_session() -> requests.Session:
+    """Get the process-wide session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=_settings['pool_size'],
+                    pool_block=False
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def endpoint_url(endpoint: str) -> str:
+    """Build the full URL for an endpoint path such as 'v1/product/packshot'."""
+    return f"{_settings['base_url']}/{endpoint.lstrip('/')}"
+
+
+def get_timeout(endpoint: str) -> Tuple[float, float]:
+    """Return the (connect, read) timeout for an endpoint."""
+    endpoint = endpoint.lstrip('/')
+    read_timeout = _settings['read_timeout']
+    best_match = ''
+    for prefix, timeout in _settings['endpoint_timeouts'].items():
+        if endpoint.startswith(prefix) and len(prefix) > len(best_match):
+            best_match = prefix
+            read_timeout = timeout
+    return (_settings['connect_timeout'], read_timeout)
+
+
+def build_headers(api_key: str) -> Dict[str, str]:
+    """Build the standard Bria API request headers."""
+    return {
+        'api_token': api_key,
+        'Accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+
+
+def post(endpoint: str, api_key: str, data: Union[Dict[str, Any], bytes]) -> requests.Response:
+    """
+    POST a JSON body to a Bria endpoint over the pooled session.
+
+    Args:
+        endpoint: Endpoint path, e.g. 'v1/product/packshot'
+        api_key: Bria AI API key
+        data: Request dict (ImagePayload values allowed) or an encoded JSON body
+
+    Returns:
+        The requests.Response (status is not checked here)
+    """
+    body = data if isinstance(data, bytes) else encode_request_body(data)
+    return get_session().post(
+        endpoint_url(endpoint),
+        headers=build_headers(api_key),
+        data=body,
+        timeout=get_timeout(endpoint)
+    )
+
+
+def _request_bytes(response: Optional[requests.Response]) -> Optional[int]:
+    """Size of the body that was sent for a response, without re-serializing it."""
+    body = getattr(getattr(response, 'request', None), 'body', None)
+    return len(body) if body is not None else None
+
+
+def request_json(endpoint: str, api_key: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    POST to a Bria endpoint and return the parsed JSON body.
+
+    Identical requests already in flight are joined instead of resent
+    (services.single_flight). Each attempt is paced by the key's rate limiter (services.rate_limiter);
+    retryable failures are retried and tracked by the endpoint's circuit
+    breaker (services.resilience); other HTTP errors are raised. Each call
+    is logged as a structured event (services.api_logging).
+    """
+    def _send() -> Dict[str, Any]:
+        request_id = new_request_id()
+        log_payload(endpoint, data, request_id)
+        started = time.monotonic()
+        response = None
+        try:
+            # Encoded once and reused by every retry attempt
+            body = encode_request_body(data)
+            response = call_with_resilience(
+                endpoint,
+                lambda: rate_limited(api_key, endpoint, lambda: post(endpoint, api_key, body))
+            )
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            if getattr(e, 'response', None) is not None:
+                response = e.response
+            log_api_call(
+                request_id, endpoint, started,
+                status=getattr(response, 'status_code', None),
+                request_bytes=_request_bytes(response),
+                response_bytes=len(response.content) if response is not None else None,
+                error=e,
+                response_text=response.text if response is not None else None
+            )
+            raise
+        log_api_call(
+            request_id, endpoint, started,
+            status=response.status_code,
+            request_bytes=_request_bytes(response),
+            response_bytes=len(response.content)
+        )
+        return result
+
+    return get_single_flight().do(request_key(api_key, endpoint, data), _send)
+
+
+def get_pool_size() -> int:
+    """Return the configured per-host connection pool size."""
+    return _settings['pool_size']
+
+
+def warm_up(connections: int = 1, background: bool = True):
+    """
+    Open connections to the API host ahead of the first real request.
+
+    Args:
+        connections: Number of pooled connections to establish
+        background: Run on daemon threads instead of blocking the caller
+    """
+    def _open_connection():
+        try:
+            get_session().head(
+                _settings['base_url'],
+                timeout=(_settings['connect_timeout'], _settings['connect_timeout'])
+            )
+        except requests.RequestException as e:
+            log_event(logging.WARNING, 'http.warm_up_failed', error=str(e))
+
+    connections = max(1, min(connections, _settings['pool_size']))
+    threads = [threading.Thread(target=_open_connection, daemon=True) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    if not background:
+        for thread in threads:
+            thread.join()
+
+
+__all__ = [
+    'configure_client',
+    'get_session',
+    'endpoint_url',
+    'get_timeout',
+    'build_headers',
+    'post',
+    'request_json',
+    'get_pool_size',
+    'warm_up'
+]
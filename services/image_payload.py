@@ -0,0 +1,139 @@
+"""
+Encode-once image uploads for Bria API requests.
+
+An ImagePayload wraps the raw bytes of an uploaded image and computes its
+base64 form, content hash, dimensions and MIME type lazily, once. Keeping the
+payload in session state means repeated edits of the same upload skip the
+re-encoding, and request bodies are assembled directly from the cached base64
+bytes instead of going through an intermediate str and a second JSON copy.
+"""
+import base64
+import hashlib
+import io
+import json
+from typing import Dict, Any, Optional, Tuple, Union
+
+from PIL import Image
+
+# Magic-number prefixes of the formats the app accepts
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+class ImagePayload:
+    """An uploaded image whose encoded forms are computed once and reused."""
+
+    def __init__(self, data: bytes, name: Optional[str] = None):
+        self.data = data
+        self.name = name
+        self._base64: Optional[bytes] = None
+        self._sha256: Optional[str] = None
+        self._size: Optional[Tuple[int, int]] = None
+        self._mime_type: Optional[str] = None
+        # Variants computed from this upload (e.g. downscaled copies), keyed by the producer
+        self.derived: Dict[Any, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return f"ImagePayload({self.mime_type}, {len(self.data)} bytes)"
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the payload: its bytes, cached base64 and derived payloads."""
+        total = len(self.data) + (len(self._base64) if self._base64 is not None else 0)
+        for value in self.derived.values():
+            for item in (value if isinstance(value, tuple) else (value,)):
+                if isinstance(item, ImagePayload) and item is not self:
+                    total += item.nbytes
+        return total
+
+    @property
+    def base64_bytes(self) -> bytes:
+        """ASCII base64 encoding of the image, as bytes."""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data)
+        return self._base64
+
+    @property
+    def base64(self) -> str:
+        """Base64 encoding of the image as a str (a copy; prefer base64_bytes)."""
+        return self.base64_bytes.decode('ascii')
+
+    @property
+    def sha256(self) -> str:
+        """Hex SHA-256 digest of the raw image bytes."""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height) read from the image header without decoding pixels."""
+        if self._size is None:
+            with Image.open(io.BytesIO(self.data)) as img:
+                self._size = img.size
+                if self._mime_type is None:
+                    self._mime_type = Image.MIME.get(img.format, 'application/octet-stream')
+        return self._size
+
+    @property
+    def mime_type(self) -> str:
+        """MIME type sniffed from the file signature."""
+        if self._mime_type is None:
+            header = bytes(self.data[:12])
+            for signature, mime_type in IMAGE_SIGNATURES:
+                if header.startswith(signature):
+                    self._mime_type = mime_type
+                    break
+            else:
+                if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+                    self._mime_type = 'image/webp'
+                else:
+                    self._mime_type = 'application/octet-stream'
+        return self._mime_type
+
+
+# Anything the service functions accept as an image upload
+ImageInput = Union[bytes, ImagePayload]
+
+
+def as_image_payload(image: Optional[ImageInput]) -> Optional[ImagePayload]:
+    """Wrap raw bytes in an ImagePayload; payloads and None pass through."""
+    if image is None or isinstance(image, ImagePayload):
+        return image
+    return ImagePayload(bytes(image))
+
+
+def encode_request_body(data: Dict[str, Any]) -> bytes:
+    """
+    Serialize a request dict to JSON bytes.
+
+    ImagePayload values are written from their cached base64 bytes, so the
+    encoded image is copied once, into the final body.
+    """
+    chunks = [b'{']
+    for index, (key, value) in enumerate(data.items()):
+        if index:
+            chunks.append(b',')
+        chunks.append(json.dumps(str(key)).encode('utf-8'))
+        chunks.append(b':')
+        if isinstance(value, ImagePayload):
+            chunks.extend((b'"', value.base64_bytes, b'"'))
+        else:
+            chunks.append(json.dumps(value, allow_nan=False).encode('utf-8'))
+    chunks.append(b'}')
+    return b''.join(chunks)
+
+
+__all__ = [
+    'ImagePayload',
+    'ImageInput',
+    'as_image_payload',
+    'encode_request_body'
+]
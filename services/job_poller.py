@@ -0,0 +1,238 @@
+"""
+Background polling of asynchronous (sync=False) Bria API jobs.
+
+With sync=False the API answers immediately with the URLs its results will
+be written to. Instead of holding a Streamlit script thread for the whole
+generation, callers register those URLs here and check back later. A single
+daemon thread probes each URL with exponential backoff until every result of
+a job is downloadable or the job times out.
+"""
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+import requests
+
+from .api_logging import log_event
+from .http_client import get_session, get_timeout
+
+POLL_INITIAL_DELAY = float(os.getenv('BRIA_POLL_INITIAL_DELAY', '2'))
+POLL_MAX_DELAY = float(os.getenv('BRIA_POLL_MAX_DELAY', '15'))
+POLL_TIMEOUT = float(os.getenv('BRIA_POLL_TIMEOUT', '600'))
+
+# Probes run one at a time, so a slow storage host must not stall the queue
+PROBE_READ_TIMEOUT = 10
+# Finished jobs are kept this long for callers to collect them
+FINISHED_JOB_TTL = 3600
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class PendingJob:
+    def __init__(self, job_id: str, urls: List[str], timeout: float, label: Optional[str] = None):
+        self.job_id = job_id
+        self.urls = list(urls)
+        self.label = label
+        self.ready_urls = set()
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.created = time.monotonic()
+        self.deadline = self.created + timeout
+        self.finished: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'label': self.label,
+            'status': self.status,
+            'urls': list(self.urls),
+            'ready': len(self.ready_urls),
+            'total': len(self.urls),
+            'elapsed': round(time.monotonic() - self.created, 1),
+            'error': self.error
+        }
+
+
+class JobPoller:
+    """Probes result URLs of registered jobs on one background thread."""
+
+    def __init__(self, initial_delay: float = POLL_INITIAL_DELAY, max_delay: float = POLL_MAX_DELAY,
+                 timeout: float = POLL_TIMEOUT):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._jobs: Dict[str, PendingJob] = {}
+        # (due time, tie-breaker, job id, url, current delay)
+        self._queue: List[Any] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'submitted': 0, 'ready': 0, 'failed': 0, 'probes': 0}
+
+    def submit(self, urls: List[str], label: Optional[str] = None) -> str:
+        """
+        Register the result URLs of a sync=False request.
+
+        Args:
+            urls: Result URLs returned by the API
+            label: Optional description shown while the job is pending
+
+        Returns:
+            Job id to pass to get()
+        """
+        job = PendingJob(uuid.uuid4().hex[:12], urls, self.timeout, label)
+        with self._condition:
+            self._jobs[job.job_id] = job
+            self.stats['submitted'] += 1
+            if not job.urls:
+                self._finish(job, FAILED, "No result URLs in API response")
+            now = time.monotonic()
+            for url in job.urls:
+                # Local files (cached results) are ready immediately
+                delay = 0 if os.path.isfile(url) else self.initial_delay
+                heapq.heappush(self._queue, (now + delay, next(self._counter), job.job_id, url, self.initial_delay))
+            self._ensure_thread()
+            self._condition.notify()
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job's current state, or None if it is unknown."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def forget(self, job_id: str):
+        """Stop tracking a job; pending probes for it are dropped."""
+        with self._condition:
+            self._jobs.pop(job_id, None)
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return sum(1 for job in self._jobs.values() if job.status == PENDING)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='bria-job-poller', daemon=True)
+            self._thread.start()
+
+    def _finish(self, job: PendingJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+        self.stats[status] += 1
+        log_event(
+            logging.INFO if status == READY else logging.WARNING,
+            'job.' + status,
+            job_id=job.job_id,
+            urls=len(job.urls),
+            elapsed_s=round(job.finished - job.created, 1),
+            error=error
+        )
+
+    def _next_probe(self):
+        """Wait for the next due probe; returns None when there is nothing left to do."""
+        with self._condition:
+            while True:
+                self._purge_finished()
+                if not self._queue:
+                    if not self._condition.wait(timeout=60) and not self._queue:
+                        return None
+                    continue
+                due, _, job_id, url, delay = self._queue[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._queue)
+                job = self._jobs.get(job_id)
+                if job is None or job.status != PENDING:
+                    continue
+                if time.monotonic() > job.deadline:
+                    self._finish(job, FAILED, "Timed out waiting for results")
+                    continue
+                return job, url, delay
+
+    def _purge_finished(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and now - job.finished > FINISHED_JOB_TTL]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            item = self._next_probe()
+            if item is None:
+                with self._condition:
+                    # Exit only if nothing was queued while we were deciding to stop
+                    if not self._queue:
+                        self._thread = None
+                        return
+                continue
+            job, url, delay = item
+            ready = probe_result_url(url)
+            with self._condition:
+                self.stats['probes'] += 1
+                if job.status != PENDING:
+                    continue
+                if ready:
+                    job.ready_urls.add(url)
+                    if len(job.ready_urls) == len(job.urls):
+                        self._finish(job, READY)
+                    continue
+                next_delay = min(self.max_delay, delay * 1.6)
+                due = time.monotonic() + next_delay * random.uniform(0.8, 1.2)
+                heapq.heappush(self._queue, (due, next(self._counter), job.job_id, url, next_delay))
+
+
+def probe_result_url(url: str) -> bool:
+    """Return True once a result URL can be downloaded."""
+    if os.path.isfile(url):
+        return True
+    try:
+        # Headers only: the body is left unread and the connection returned
+        connect_timeout, _ = get_timeout('')
+        response = get_session().get(url, stream=True, timeout=(connect_timeout, PROBE_READ_TIMEOUT))
+        response.close()
+        return response.status_code == 200
+    except requests.RequestException:
+        return False
+
+
+_poller: Optional[JobPoller] = None
+_lock = threading.Lock()
+
+
+def get_job_poller() -> JobPoller:
+    """Get the process-wide job poller, creating it on first use."""
+    global _poller
+    if _poller is None:
+        with _lock:
+            if _poller is None:
+                _poller = JobPoller()
+    return _poller
+
+
+def get_job_poller_stats() -> Dict[str, int]:
+    """Return job counters and the number of jobs still pending."""
+    poller = get_job_poller()
+    return {**poller.stats, 'pending': poller.pending_count()}
+
+
+__all__ = [
+    'PENDING',
+    'READY',
+    'FAILED',
+    'JobPoller',
+    'probe_result_url',
+    'get_job_poller',
+    'get_job_poller_stats'
+]
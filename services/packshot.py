@@ -1,64 +1,95 @@
-from typing import Dict, Any, Optional
-import requests
-import base64
+from typing import Dict, Any, Optional, Tuple
+from .http_client import request_json
+from .async_http_client import request_json_async
+from .result_cache import cached_call, cached_call_async
+from .image_payload import ImageInput
+from .validation import validate_request
+from .preprocess import prepare_upload
+
+
+def build_packshot_request(
+    image_data: ImageInput,
+    background_color: str = "#FFFFFF",
+    sku: Optional[str] = None,
+    force_rmbg: bool = False,
+    content_moderation: bool = False
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the endpoint and request body for a packshot call.
+
+    Returns:
+        Tuple of (endpoint path, request data)
+    """
+    endpoint = "v1/product/packshot"
+
+    # Downscale oversized uploads before they are encoded
+    image_payload = prepare_upload(image_data, endpoint)
+
+    # Prepare request data
+    data = {
+        'file': image_payload,
+        'background_color': background_color,
+        'force_rmbg': force_rmbg,
+        'content_moderation': content_moderation
+    }
+
+    # Add optional SKU if provided
+    if sku:
+        data['sku'] = sku
+
+    validate_request(endpoint, data)
+    return endpoint, data
 
 
 def create_packshot(
     api_key: str,
-    image_data: bytes,
+    image_data: ImageInput,
     background_color: str = "#FFFFFF",
     sku: Optional[str] = None,
     force_rmbg: bool = False,
-    content_moderation: bool = False
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     Create a professional packshot from a product image.
-    
+
     Args:
         api_key: Bria AI API key
-        image_data: Image data in bytes
+        image_data: Image bytes or an ImagePayload
         background_color: Background color in hex format or 'transparent'
         sku: Optional SKU identifier for the product
         force_rmbg: Whether to force background removal even if alpha channel exists
         content_moderation: Whether to enable content moderation
-    
+        use_cache: Reuse a locally cached result (None follows the endpoint default)
+
     Returns:
         Dict containing the API response
     """
-    url = "https://engine.prod.bria-api.com/v1/product/packshot"
-    
-    headers = {
-        'api_token': api_key,
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
-    
-    # Convert image data to base64
-    image_base64 = base64.b64encode(image_data).decode('utf-8')
-    
-    # Prepare request data
-    data = {
-        'file': image_base64,
-        'background_color': background_color,
-        'force_rmbg': force_rmbg,
-        'content_moderation': content_moderation
-    }
-    
-    # Add optional SKU if provided
-    if sku:
-        data['sku'] = sku
-    
+    endpoint, data = build_packshot_request(
+        image_data, background_color, sku, force_rmbg, content_moderation
+    )
+
+    try:
+        return cached_call(endpoint, data, use_cache, lambda: request_json(endpoint, api_key, data))
+    except Exception as e:
+        raise Exception(f"Packshot creation failed: {str(e)}")
+
+
+async def create_packshot_async(
+    api_key: str,
+    image_data: ImageInput,
+    background_color: str = "#FFFFFF",
+    sku: Optional[str] = None,
+    force_rmbg: bool = False,
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Async variant of create_packshot; takes the same arguments."""
+    endpoint, data = build_packshot_request(
+        image_data, background_color, sku, force_rmbg, content_moderation
+    )
+
     try:
-        print(f"Making request to: {url}")
-        print(f"Headers: {headers}")
-        print(f"Data keys: {list(data.keys())}")
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
-        
-        return response.json()
+        return await cached_call_async(endpoint, data, use_cache, lambda: request_json_async(endpoint, api_key, data))
     except Exception as e:
-        raise Exception(f"Packshot creation failed: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Packshot creation failed: {str(e)}")
@@ -0,0 +1,208 @@
+"""
+Pre-upload downscaling of images sent to the Bria API.
+
+Phone and DSLR photos are far larger than the resolution the editing
+endpoints work at, and base64 adds another third on the wire. Before an
+upload is encoded it is normalized to its EXIF orientation and shrunk to the
+endpoint's maximum edge. JPEGs are decoded in draft mode, so the decoder
+skips most of the pixels it would otherwise throw away. Masks get the same
+orientation and are fitted to the prepared image exactly.
+
+Each prepared variant is memoized on the source ImagePayload, so repeated
+edits of one upload pay for the resize once.
+"""
+import io
+import os
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from .image_payload import ImageInput, ImagePayload, as_image_payload
+from .masks import prepare_mask, unreadable_mask
+
+PREPROCESS_UPLOADS = os.getenv('BRIA_PREPROCESS_UPLOADS', 'true').lower() == 'true'
+UPLOAD_MAX_EDGE = int(os.getenv('BRIA_UPLOAD_MAX_EDGE', '2048'))
+JPEG_QUALITY = int(os.getenv('BRIA_UPLOAD_JPEG_QUALITY', '90'))
+
+# Longest edge (pixels) worth uploading per endpoint; anything else uses
+# UPLOAD_MAX_EDGE.
+ENDPOINT_MAX_EDGE = {
+    'v1/product/packshot': 2048,
+    'v1/product/shadow': 2048,
+    'v1/product/lifestyle_shot_by_text': 2048,
+    'v1/product/lifestyle_shot_by_image': 2048,
+    'v1/gen_fill': 1920,
+    'v1/erase_foreground': 1920,
+}
+
+# EXIF orientation value -> transpose that makes the image upright
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+EXIF_ORIENTATION_TAG = 0x0112
+
+_settings = {
+    'enabled': PREPROCESS_UPLOADS,
+    'default_max_edge': UPLOAD_MAX_EDGE,
+    'endpoint_max_edge': dict(ENDPOINT_MAX_EDGE),
+    'jpeg_quality': JPEG_QUALITY,
+}
+
+
+def configure_preprocessing(
+    enabled: Optional[bool] = None,
+    default_max_edge: Optional[int] = None,
+    endpoint_max_edge: Optional[Dict[str, int]] = None,
+    jpeg_quality: Optional[int] = None
+):
+    """Override upload preprocessing settings."""
+    if enabled is not None:
+        _settings['enabled'] = enabled
+    if default_max_edge is not None:
+        _settings['default_max_edge'] = default_max_edge
+    if endpoint_max_edge:
+        _settings['endpoint_max_edge'].update(endpoint_max_edge)
+    if jpeg_quality is not None:
+        _settings['jpeg_quality'] = jpeg_quality
+
+
+def get_max_edge(endpoint: str) -> int:
+    """Return the maximum upload edge for an endpoint."""
+    return _settings['endpoint_max_edge'].get(endpoint, _settings['default_max_edge'])
+
+
+def _target_size(size: Tuple[int, int], max_edge: int) -> Tuple[int, int]:
+    width, height = size
+    scale = min(1.0, max_edge / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(img: Image.Image) -> bytes:
+    """Re-encode as JPEG, or as PNG when the image has transparency."""
+    buffer = io.BytesIO()
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        img.save(buffer, format='PNG')
+    else:
+        img = img if img.mode in ('RGB', 'L') else img.convert('RGB')
+        img.save(buffer, format='JPEG', quality=_settings['jpeg_quality'])
+    return buffer.getvalue()
+
+
+def _prepare(payload: ImagePayload, max_edge: int) -> Tuple[ImagePayload, int]:
+    """Downscale and orient one image; returns the result and the orientation applied."""
+    with Image.open(io.BytesIO(payload.data)) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        target = _target_size(img.size, max_edge)
+        if target == img.size and orientation not in ORIENTATION_TRANSPOSE:
+            return payload, 1
+        if img.format == 'JPEG':
+            # Let the decoder scale by 1/2, 1/4 or 1/8 while still covering target
+            img.draft('RGB', target)
+        img.load()
+        # draft() may already have shrunk the image, so resize to the exact target
+        upright = img.resize(target, Image.Resampling.LANCZOS) if img.size != target else img
+        # The tag is dropped on re-encode, so the rotation is baked into the pixels
+        transpose = ORIENTATION_TRANSPOSE.get(orientation)
+        if transpose is not None:
+            upright = upright.transpose(transpose)
+        else:
+            orientation = 1
+        prepared = ImagePayload(_encode(upright), payload.name)
+    # Keep the original when recompression would not make the upload smaller
+    if len(prepared) >= len(payload) and orientation == 1:
+        return payload, 1
+    return prepared, orientation
+
+
+def prepare_upload(
+    image: Optional[ImageInput],
+    endpoint: str,
+    enabled: Optional[bool] = None
+) -> Optional[ImagePayload]:
+    """
+    Return the upload to send for an endpoint, downscaled if it is too large.
+
+    Args:
+        image: Image bytes or an ImagePayload
+        endpoint: Endpoint path, used to pick the maximum edge
+        enabled: Override the global setting (False sends the original)
+
+    Returns:
+        An ImagePayload of the prepared image (the input itself if unchanged)
+    """
+    payload = as_image_payload(image)
+    if payload is None or not (_settings['enabled'] if enabled is None else enabled):
+        return payload
+    return _prepare_cached(payload, get_max_edge(endpoint))[0]
+
+
+def _prepare_cached(payload: ImagePayload, max_edge: int) -> Tuple[ImagePayload, int]:
+    key = ('upload', max_edge)
+    if key not in payload.derived:
+        try:
+            payload.derived[key] = _prepare(payload, max_edge)
+        except (OSError, ValueError):
+            # Not an image PIL can read; let the API report it
+            payload.derived[key] = (payload, 1)
+    return payload.derived[key]
+
+
+def prepare_image_and_mask(
+    image: ImageInput,
+    mask: ImageInput,
+    endpoint: str,
+    enabled: Optional[bool] = None
+) -> Tuple[ImagePayload, ImagePayload]:
+    """
+    Prepare an image and its mask so they stay pixel-aligned.
+
+    A mask on the raw upload's pixel grid is given the image's EXIF
+    orientation. Every mask is then binarized, resized to the image that is
+    sent and encoded as a 1-bit PNG, so a mask of the wrong size never
+    reaches the API.
+
+    Raises:
+        ValueError: If the mask cannot be read or masks nothing
+    """
+    image_payload = as_image_payload(image)
+    mask_payload = as_image_payload(mask)
+    if _settings['enabled'] if enabled is None else enabled:
+        prepared, orientation = _prepare_cached(image_payload, get_max_edge(endpoint))
+    else:
+        prepared, orientation = image_payload, 1
+
+    try:
+        size = prepared.size
+    except (OSError, ValueError):
+        # Not an image PIL can read; let the API report it
+        return prepared, mask_payload
+    transpose = ORIENTATION_TRANSPOSE.get(orientation)
+    if transpose is None:
+        return prepared, prepare_mask(mask_payload, size)
+
+    key = ('upright_mask', prepared.sha256)
+    if key not in mask_payload.derived:
+        try:
+            with Image.open(io.BytesIO(mask_payload.data)) as mask_img:
+                mask_img = mask_img.convert('L')
+                # A mask already drawn upright (e.g. in an external editor) is left as is
+                if mask_img.size == image_payload.size:
+                    mask_img = mask_img.transpose(transpose)
+                mask_payload.derived[key] = prepare_mask(mask_img, size)
+        except OSError as e:
+            raise unreadable_mask(e)
+    return prepared, mask_payload.derived[key]
+
+
+__all__ = [
+    'configure_preprocessing',
+    'get_max_edge',
+    'prepare_upload',
+    'prepare_image_and_mask'
+]
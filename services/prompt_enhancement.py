@@ -1,6 +1,26 @@
-from typing import Dict, Any, Optional
-import requests
-import json
+import logging
+from typing import Dict, Any, Optional, Tuple
+from .api_logging import log_event
+from .http_client import request_json
+from .async_http_client import request_json_async
+from .validation import validate_request
+
+def build_enhance_prompt_request(prompt: str, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the endpoint and request body for a prompt enhancement call.
+
+    Returns:
+        Tuple of (endpoint path, request data)
+    """
+    endpoint = "v1/prompt_enhancer"
+
+    data = {
+        'prompt': prompt,
+        **kwargs
+    }
+
+    validate_request(endpoint, data)
+    return endpoint, data
 
 def enhance_prompt(
     api_key: str,
@@ -9,40 +29,35 @@ def enhance_prompt(
 ) -> str:
     """
     Enhance a prompt using Bria AI's prompt enhancement service.
-    
+
     Args:
         api_key: Bria AI API key
         prompt: Original prompt to enhance
         **kwargs: Additional parameters for the API
-    
+
     Returns:
         Enhanced prompt string
     """
-    url = "https://engine.prod.bria-api.com/v1/prompt_enhancer"
-    
-    headers = {
-        'api_token': api_key,
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
-    
-    data = {
-        'prompt': prompt,
-        **kwargs
-    }
-    
     try:
-        print(f"Making request to: {url}")
-        print(f"Headers: {headers}")
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
-        
-        result = response.json()
+        # A blank prompt is caught locally and returned as is, without a request
+        endpoint, data = build_enhance_prompt_request(prompt, **kwargs)
+        result = request_json(endpoint, api_key, data)
+        return result.get("prompt variations", prompt)  # Return original prompt if enhancement fails
+    except Exception as e:
+        log_event(logging.WARNING, 'prompt.enhance_failed', error=str(e))
+        return prompt  # Return original prompt on error
+
+async def enhance_prompt_async(
+    api_key: str,
+    prompt: str,
+    **kwargs
+) -> str:
+    """Async variant of enhance_prompt; takes the same arguments."""
+    try:
+        # A blank prompt is caught locally and returned as is, without a request
+        endpoint, data = build_enhance_prompt_request(prompt, **kwargs)
+        result = await request_json_async(endpoint, api_key, data)
         return result.get("prompt variations", prompt)  # Return original prompt if enhancement fails
     except Exception as e:
-        print(f"Error enhancing prompt: {str(e)}")
-        return prompt  # Return original prompt on error 
\ No newline at end of file
+        log_event(logging.WARNING, 'prompt.enhance_failed', error=str(e))
+        return prompt  # Return original prompt on error
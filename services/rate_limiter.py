@@ -0,0 +1,237 @@
+"""
+Client-side rate limiting for Bria AI API calls.
+
+Every HTTP attempt first takes a token from a per (API key, endpoint) token
+bucket, then a slot from a per API key AIMD concurrency controller. The
+controller halves the number of requests allowed in flight when the API
+answers 429 and grows it back by one slot per window of successes, so all
+sessions sharing a key converge on the highest throughput the quota allows.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
+
+RATE_LIMIT_RPS = float(os.getenv('BRIA_RATE_LIMIT_RPS', '5'))
+MAX_CONCURRENCY = int(os.getenv('BRIA_MAX_CONCURRENCY', '10'))
+INITIAL_CONCURRENCY = int(os.getenv('BRIA_INITIAL_CONCURRENCY', '4'))
+MAX_WAIT = float(os.getenv('BRIA_RATE_LIMIT_MAX_WAIT', '30'))
+
+# Requests/second budgets per endpoint path prefix; anything else uses
+# RATE_LIMIT_RPS.
+ENDPOINT_RATE_LIMITS: Dict[str, float] = {}
+
+_settings = {
+    'default_rps': RATE_LIMIT_RPS,
+    'endpoint_rps': dict(ENDPOINT_RATE_LIMITS),
+    'max_concurrency': MAX_CONCURRENCY,
+    'initial_concurrency': INITIAL_CONCURRENCY,
+    'max_wait': MAX_WAIT,
+}
+
+
+class RateLimitError(Exception):
+    """Raised when a request would wait longer than the configured maximum."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> float:
+        """
+        Take one token and return how long the caller must wait before using it.
+
+        Tokens may go negative so concurrent callers queue up in order;
+        raises RateLimitError instead of reserving past max_wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                raise RateLimitError(f"Rate limit queue is full; next slot in {wait:.1f}s")
+            self.tokens -= 1
+            return wait
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease limit on in-flight requests."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(max(minimum, min(initial, self.maximum)))
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+        self.stats = {'throttled': 0, 'decreases': 0, 'increases': 0}
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: float):
+        """Block until a slot is free or raise RateLimitError after timeout."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RateLimitError("Too many requests in flight for this API key")
+                self._condition.wait(remaining)
+            self.in_flight += 1
+
+    async def acquire_async(self, timeout: float):
+        """Async counterpart of acquire; polls so the event loop is never blocked."""
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                raise RateLimitError("Too many requests in flight for this API key")
+            await asyncio.sleep(0.05)
+
+    def release(self, throttled: bool = False, succeeded: bool = False):
+        """Free a slot and adapt the limit to the outcome of the request."""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.stats['throttled'] += 1
+                new_limit = max(self.minimum, self.limit / 2)
+                if new_limit < self.limit:
+                    self.stats['decreases'] += 1
+                self.limit = new_limit
+                self._successes = 0
+            elif succeeded:
+                # One extra slot per full window of successful requests
+                self._successes += 1
+                if self._successes >= int(self.limit) and self.limit < self.maximum:
+                    self.limit = min(self.maximum, self.limit + 1)
+                    self._successes = 0
+                    self.stats['increases'] += 1
+            self._condition.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight, **self.stats}
+
+
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_controllers: Dict[str, AIMDController] = {}
+_lock = threading.Lock()
+
+
+def _key_id(api_key: str) -> str:
+    """Short digest so API keys are never kept or reported in the clear."""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+
+
+def configure_rate_limits(
+    default_rps: Optional[float] = None,
+    endpoint_rps: Optional[Dict[str, float]] = None,
+    max_concurrency: Optional[int] = None,
+    initial_concurrency: Optional[int] = None,
+    max_wait: Optional[float] = None
+):
+    """Override limiter settings and reset all buckets and controllers."""
+    with _lock:
+        if default_rps is not None:
+            _settings['default_rps'] = default_rps
+        if endpoint_rps:
+            _settings['endpoint_rps'].update(endpoint_rps)
+        if max_concurrency is not None:
+            _settings['max_concurrency'] = max_concurrency
+        if initial_concurrency is not None:
+            _settings['initial_concurrency'] = initial_concurrency
+        if max_wait is not None:
+            _settings['max_wait'] = max_wait
+        _buckets.clear()
+        _controllers.clear()
+
+
+def _endpoint_rps(endpoint: str) -> float:
+    rate = _settings['default_rps']
+    best_match = ''
+    for prefix, prefix_rate in _settings['endpoint_rps'].items():
+        if endpoint.startswith(prefix) and len(prefix) > len(best_match):
+            best_match = prefix
+            rate = prefix_rate
+    return rate
+
+
+def get_limiters(api_key: str, endpoint: str) -> Tuple[TokenBucket, AIMDController]:
+    """Get the token bucket and concurrency controller for a key/endpoint pair."""
+    key_id = _key_id(api_key)
+    with _lock:
+        bucket = _buckets.get((key_id, endpoint))
+        if bucket is None:
+            bucket = TokenBucket(_endpoint_rps(endpoint))
+            _buckets[(key_id, endpoint)] = bucket
+        controller = _controllers.get(key_id)
+        if controller is None:
+            controller = AIMDController(
+                _settings['initial_concurrency'],
+                maximum=_settings['max_concurrency']
+            )
+            _controllers[key_id] = controller
+    return bucket, controller
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """Return the current concurrency limit and counters per (hashed) API key."""
+    with _lock:
+        controllers = dict(_controllers)
+    return {key_id: controller.snapshot() for key_id, controller in controllers.items()}
+
+
+def rate_limited(api_key: str, endpoint: str, send: Callable[[], Any]):
+    """Run one HTTP attempt under the key's rate and concurrency limits."""
+    bucket, controller = get_limiters(api_key, endpoint)
+    wait = bucket.reserve(_settings['max_wait'])
+    if wait > 0:
+        time.sleep(wait)
+    controller.acquire(_settings['max_wait'])
+    response = None
+    try:
+        response = send()
+        return response
+    finally:
+        status = getattr(response, 'status_code', None)
+        controller.release(throttled=status == 429, succeeded=status is not None and status < 400)
+
+
+async def rate_limited_async(api_key: str, endpoint: str, send: Callable[[], Awaitable[Any]]):
+    """Async counterpart of rate_limited."""
+    bucket, controller = get_limiters(api_key, endpoint)
+    wait = bucket.reserve(_settings['max_wait'])
+    if wait > 0:
+        await asyncio.sleep(wait)
+    await controller.acquire_async(_settings['max_wait'])
+    response = None
+    try:
+        response = await send()
+        return response
+    finally:
+        status = getattr(response, 'status_code', None)
+        controller.release(throttled=status == 429, succeeded=status is not None and status < 400)
+
+
+__all__ = [
+    'RateLimitError',
+    'TokenBucket',
+    'AIMDController',
+    'configure_rate_limits',
+    'get_limiters',
+    'get_rate_limit_stats',
+    'rate_limited',
+    'rate_limited_async'
+]
@@ -0,0 +1,365 @@
+"""
+Retry and circuit-breaker layer for Bria AI API calls.
+
+Throttling (429), server errors (5xx), timeouts and dropped connections are
+retried with exponential backoff and full jitter, honoring Retry-After when
+the API sends it. A request that may have reached the server without its
+response arriving (e.g. a read timeout) is only sent again to
+IDEMPOTENT_ENDPOINTS: elsewhere the API may already be generating, and
+billing for, the first attempt. Each endpoint has its own circuit breaker:
+after repeated failures it opens and calls fail fast until a cool-down has
+passed, after which a single probe request decides whether it closes again.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+import httpx
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from .api_logging import log_event
+
+MAX_ATTEMPTS = int(os.getenv('BRIA_MAX_ATTEMPTS', '3'))
+BACKOFF_BASE = float(os.getenv('BRIA_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('BRIA_BACKOFF_MAX', '10'))
+BREAKER_THRESHOLD = int(os.getenv('BRIA_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.getenv('BRIA_BREAKER_COOLDOWN', '30'))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+# Failures where the request never got to the server, safe to retry on any endpoint.
+# A requests ConnectionError only counts when no connection was opened (see _never_sent):
+# it also covers connections dropped after the body was uploaded.
+UNSENT_EXCEPTIONS = (
+    requests.exceptions.ConnectTimeout,
+    httpx.ConnectTimeout,
+    httpx.ConnectError,
+    httpx.PoolTimeout,
+)
+
+# Endpoints that only transform the upload, so repeating a request whose
+# response was lost is harmless
+IDEMPOTENT_ENDPOINTS = {
+    'v1/product/packshot',
+    'v1/product/shadow',
+    'v1/erase_foreground',
+}
+
+_settings = {
+    'max_attempts': MAX_ATTEMPTS,
+    'backoff_base': BACKOFF_BASE,
+    'backoff_max': BACKOFF_MAX,
+    'breaker_threshold': BREAKER_THRESHOLD,
+    'breaker_cooldown': BREAKER_COOLDOWN,
+    'idempotent_endpoints': set(IDEMPOTENT_ENDPOINTS),
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the endpoint's breaker is open."""
+
+
+class RetryableStatusError(Exception):
+    """Raised internally for a retryable HTTP status so it can be retried like a timeout."""
+
+    def __init__(self, response):
+        super().__init__(f"{response.status_code} response from API")
+        self.response = response
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, endpoint: str, failure_threshold: int, cooldown: float):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'retries': 0,
+            'rejected': 0,
+            'trips': 0,
+        }
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through right now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError(
+                        f"Circuit open for {self.endpoint}; retry in {remaining:.0f}s"
+                    )
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError(f"Circuit half-open for {self.endpoint}; probe in progress")
+                self._probe_in_flight = True
+            self.stats['calls'] += 1
+
+    def record_success(self):
+        with self._lock:
+            self.stats['successes'] += 1
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.stats['trips'] += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def record_neutral(self):
+        """Release a half-open probe slot after an error that says nothing about endpoint health."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_retry(self):
+        with self._lock:
+            self.stats['retries'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                **self.stats
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def configure_resilience(
+    max_attempts: Optional[int] = None,
+    backoff_base: Optional[float] = None,
+    backoff_max: Optional[float] = None,
+    breaker_threshold: Optional[int] = None,
+    breaker_cooldown: Optional[float] = None,
+    idempotent_endpoints: Optional[set] = None
+):
+    """Override retry/breaker settings and reset all breakers."""
+    for name, value in (
+        ('max_attempts', max_attempts),
+        ('backoff_base', backoff_base),
+        ('backoff_max', backoff_max),
+        ('breaker_threshold', breaker_threshold),
+        ('breaker_cooldown', breaker_cooldown),
+        ('idempotent_endpoints', idempotent_endpoints),
+    ):
+        if value is not None:
+            _settings[name] = value
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """Get the circuit breaker for an endpoint, creating it on first use."""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(endpoint)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    endpoint,
+                    _settings['breaker_threshold'],
+                    _settings['breaker_cooldown']
+                )
+                _breakers[endpoint] = breaker
+    return breaker
+
+
+def get_resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """Return breaker state and retry counters for every endpoint seen so far."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.endpoint: breaker.snapshot() for breaker in breakers}
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """Parse a Retry-After header given as seconds or an HTTP date."""
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, response=None) -> float:
+    """Delay before the given retry attempt (1-based), honoring Retry-After."""
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None:
+        return min(retry_after, _settings['backoff_max'])
+    cap = min(_settings['backoff_max'], _settings['backoff_base'] * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+
+def _check_response(response):
+    """Raise RetryableStatusError for retryable statuses; other responses pass through."""
+    if response.status_code in RETRYABLE_STATUS_CODES:
+        raise RetryableStatusError(response)
+    return response
+
+
+def _never_sent(error: Exception) -> bool:
+    """Whether a failure happened before any connection to the server was opened."""
+    if isinstance(error, UNSENT_EXCEPTIONS):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    # requests wraps urllib3's MaxRetryError, whose reason is the underlying failure
+    seen = set()
+    cause = error
+    while cause is not None and id(cause) not in seen:
+        if isinstance(cause, NewConnectionError):
+            return True
+        seen.add(id(cause))
+        reason = getattr(cause, 'reason', None)
+        arg = cause.args[0] if getattr(cause, 'args', None) else None
+        cause = next(
+            (item for item in (reason, arg, cause.__cause__) if isinstance(item, BaseException)),
+            None
+        )
+    return False
+
+
+def _may_resend(endpoint: str, error: Exception) -> bool:
+    """Whether a failed attempt may be sent again without risking a duplicate job."""
+    if isinstance(error, RetryableStatusError) or _never_sent(error):
+        return True
+    return endpoint in _settings['idempotent_endpoints']
+
+
+def _is_throttled(error: Exception) -> bool:
+    return isinstance(error, RetryableStatusError) and error.response.status_code == 429
+
+
+def _final_error(error: Exception) -> Exception:
+    """Turn an exhausted RetryableStatusError back into the client's HTTP error."""
+    if isinstance(error, RetryableStatusError):
+        try:
+            error.response.raise_for_status()
+        except Exception as http_error:
+            return http_error
+    return error
+
+
+def call_with_resilience(endpoint: str, send: Callable[[], Any]):
+    """
+    Call send() with retries and the endpoint's circuit breaker.
+
+    Args:
+        endpoint: Endpoint path used to pick the circuit breaker
+        send: Performs one HTTP attempt and returns the response
+
+    Returns:
+        The successful response; non-retryable HTTP errors are raised as-is
+    """
+    breaker = get_breaker(endpoint)
+    attempt = 1
+    while True:
+        breaker.before_call()
+        try:
+            response = _check_response(send())
+        except (RetryableStatusError,) + RETRYABLE_EXCEPTIONS as e:
+            # Throttling says the quota is exhausted, not that the endpoint is down
+            if _is_throttled(e):
+                breaker.record_neutral()
+            else:
+                breaker.record_failure()
+            if (attempt >= _settings['max_attempts'] or breaker.state == CircuitBreaker.OPEN
+                    or not _may_resend(endpoint, e)):
+                raise _final_error(e)
+            delay = backoff_delay(attempt, getattr(e, 'response', None))
+            breaker.record_retry()
+            log_event(logging.WARNING, 'api.retry', endpoint=endpoint, attempt=attempt, delay_s=round(delay, 2), error=str(e))
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            breaker.record_neutral()
+            raise
+        breaker.record_success()
+        return response
+
+
+async def call_with_resilience_async(endpoint: str, send: Callable[[], Awaitable[Any]]):
+    """Async counterpart of call_with_resilience."""
+    breaker = get_breaker(endpoint)
+    attempt = 1
+    while True:
+        breaker.before_call()
+        try:
+            response = _check_response(await send())
+        except (RetryableStatusError,) + RETRYABLE_EXCEPTIONS as e:
+            # Throttling says the quota is exhausted, not that the endpoint is down
+            if _is_throttled(e):
+                breaker.record_neutral()
+            else:
+                breaker.record_failure()
+            if (attempt >= _settings['max_attempts'] or breaker.state == CircuitBreaker.OPEN
+                    or not _may_resend(endpoint, e)):
+                raise _final_error(e)
+            delay = backoff_delay(attempt, getattr(e, 'response', None))
+            breaker.record_retry()
+            log_event(logging.WARNING, 'api.retry', endpoint=endpoint, attempt=attempt, delay_s=round(delay, 2), error=str(e))
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            breaker.record_neutral()
+            raise
+        breaker.record_success()
+        return response
+
+
+__all__ = [
+    'IDEMPOTENT_ENDPOINTS',
+    'CircuitOpenError',
+    'CircuitBreaker',
+    'configure_resilience',
+    'get_breaker',
+    'get_resilience_stats',
+    'call_with_resilience',
+    'call_with_resilience_async'
+]
@@ -0,0 +1,298 @@
+"""
+Content-addressed on-disk cache for image-editing API results.
+
+Entries are keyed on a hash of the endpoint, the uploaded image/mask bytes and
+the remaining request parameters. Each entry stores the JSON response and the
+downloaded result images, so a repeat edit is served without a paid API call
+even after the provider's result URLs have expired. The cache is a size-capped
+LRU: reads refresh an entry, writes evict the least recently used entries.
+"""
+import copy
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Awaitable, List
+from urllib.parse import urlparse
+
+from .api_logging import log_event
+from .fingerprint import request_fingerprint
+from .http_client import get_session, get_timeout
+
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', 'data/cache/results')
+RESULT_CACHE_MAX_MB = int(os.getenv('RESULT_CACHE_MAX_MB', '512'))
+
+# Endpoints that return the same result for the same input. Generative
+# endpoints are only cached when the request pins a seed or the caller
+# explicitly opts in with use_cache=True.
+DETERMINISTIC_ENDPOINTS = {
+    'v1/product/packshot',
+    'v1/product/shadow',
+    'v1/erase_foreground',
+}
+CACHEABLE_ENDPOINTS = DETERMINISTIC_ENDPOINTS | {
+    'v1/gen_fill',
+    'v1/product/lifestyle_shot_by_text',
+    'v1/product/lifestyle_shot_by_image',
+}
+
+
+def extract_result_urls(response: Dict[str, Any]) -> List[str]:
+    """Collect result image URLs from the response formats the API returns."""
+    urls = []
+    if isinstance(response.get('result_url'), str):
+        urls.append(response['result_url'])
+    result_urls = response.get('result_urls')
+    if isinstance(result_urls, list):
+        urls.extend(u for u in result_urls if isinstance(u, str))
+    elif isinstance(result_urls, str):
+        urls.append(result_urls)
+    for item in response.get('result') or []:
+        if isinstance(item, dict):
+            item_urls = item.get('urls') or item.get('url')
+            if isinstance(item_urls, list):
+                urls.extend(u for u in item_urls if isinstance(u, str))
+            elif isinstance(item_urls, str):
+                urls.append(item_urls)
+    if isinstance(response.get('url'), str):
+        urls.append(response['url'])
+    if isinstance(response.get('urls'), list):
+        urls.extend(u for u in response['urls'] if isinstance(u, str))
+    return list(dict.fromkeys(urls))
+
+
+def _replace_urls(value: Any, mapping: Dict[str, str]) -> Any:
+    """Return a copy of a JSON value with every mapped URL string replaced."""
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, list):
+        return [_replace_urls(v, mapping) for v in value]
+    if isinstance(value, dict):
+        return {k: _replace_urls(v, mapping) for k, v in value.items()}
+    return value
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        # File names of each entry, so writes and evictions never list the directory
+        self._files: Dict[str, List[str]] = {}
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order and file index from the directory, once at startup."""
+        sizes: Dict[str, int] = {}
+        files: Dict[str, List[str]] = {}
+        mtimes: Dict[str, float] = {}
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                key = item.name[:64]
+                stat = item.stat()
+                sizes[key] = sizes.get(key, 0) + stat.st_size
+                files.setdefault(key, []).append(item.name)
+                if item.name.endswith('.json'):
+                    mtimes[key] = stat.st_mtime
+        for key in sorted(mtimes, key=mtimes.get):
+            self._entries[key] = sizes[key]
+            self._files[key] = files[key]
+            self._total_bytes += sizes[key]
+
+    @staticmethod
+    def make_key(endpoint: str, data: Dict[str, Any]) -> str:
+        """Hash the endpoint, uploaded file contents and normalized parameters."""
+        return request_fingerprint(endpoint, data)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response with URLs pointing at local files, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+                os.utime(path)
+            except (OSError, json.JSONDecodeError):
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        mapping = {
+            url: os.path.join(self.cache_dir, file_name)
+            for url, file_name in entry['files'].items()
+        }
+        response = _replace_urls(entry['response'], mapping)
+        response['cached'] = True
+        return response
+
+    def put(self, key: str, response: Dict[str, Any]):
+        """Download the result images and store the entry."""
+        files = {}
+        size = 0
+        try:
+            for index, url in enumerate(extract_result_urls(response)):
+                result = get_session().get(url, timeout=get_timeout(''))
+                result.raise_for_status()
+                extension = os.path.splitext(urlparse(url).path)[1] or '.png'
+                file_name = f"{key}_{index}{extension}"
+                self._write_atomic(file_name, result.content)
+                files[url] = file_name
+                size += len(result.content)
+            if not files:
+                return
+            entry = json.dumps({'response': response, 'files': files}).encode('utf-8')
+            self._write_atomic(f"{key}.json", entry)
+            size += len(entry)
+        except Exception as e:
+            log_event(logging.WARNING, 'cache.write_failed', error=str(e))
+            return
+
+        names = list(files.values()) + [f"{key}.json"]
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+                # Files of the old entry that this one did not overwrite
+                self._delete_files(set(self._files.pop(key, [])) - set(names))
+            self._entries[key] = size
+            self._files[key] = names
+            self._total_bytes += size
+            self._evict()
+
+    def put_in_background(self, key: str, response: Dict[str, Any]):
+        """Store the entry on a daemon thread so the caller is not delayed."""
+        response = copy.deepcopy(response)
+        threading.Thread(target=self.put, args=(key, response), daemon=True).start()
+
+    def _write_atomic(self, file_name: str, content: bytes):
+        path = os.path.join(self.cache_dir, file_name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _remove(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        self._delete_files(self._files.pop(key, []))
+
+    def _delete_files(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits its cap."""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def clear(self):
+        """Remove every cached entry."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current cache size."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Get the process-wide result cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+
+def should_cache(endpoint: str, data: Dict[str, Any], use_cache: Optional[bool] = None) -> bool:
+    """
+    Decide whether a request may be served from and stored in the cache.
+
+    Args:
+        endpoint: Endpoint path
+        data: Request body
+        use_cache: None follows the endpoint policy, True/False forces it
+    """
+    if use_cache is False or endpoint not in CACHEABLE_ENDPOINTS:
+        return False
+    # Async jobs return placeholder URLs that are not ready to download
+    if data.get('sync') is False:
+        return False
+    if use_cache:
+        return True
+    return endpoint in DETERMINISTIC_ENDPOINTS or data.get('seed') is not None
+
+
+def cached_call(
+    endpoint: str,
+    data: Dict[str, Any],
+    use_cache: Optional[bool],
+    send: Callable[[], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Serve a request from the cache, or send it and cache the response."""
+    if not should_cache(endpoint, data, use_cache):
+        return send()
+    cache = get_result_cache()
+    key = cache.make_key(endpoint, data)
+    cached = cache.get(key)
+    if cached is not None:
+        log_event(logging.INFO, 'cache.hit', endpoint=endpoint)
+        return cached
+    response = send()
+    cache.put_in_background(key, response)
+    return response
+
+
+async def cached_call_async(
+    endpoint: str,
+    data: Dict[str, Any],
+    use_cache: Optional[bool],
+    send: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """Async counterpart of cached_call."""
+    if not should_cache(endpoint, data, use_cache):
+        return await send()
+    cache = get_result_cache()
+    key = cache.make_key(endpoint, data)
+    cached = cache.get(key)
+    if cached is not None:
+        log_event(logging.INFO, 'cache.hit', endpoint=endpoint)
+        return cached
+    response = await send()
+    cache.put_in_background(key, response)
+    return response
+
+
+__all__ = [
+    'ResultCache',
+    'get_result_cache',
+    'extract_result_urls',
+    'should_cache',
+    'cached_call',
+    'cached_call_async'
+]
@@ -1,10 +1,13 @@
-from typing import Dict, Any, List, Optional
-import requests
-import base64
+from typing import Dict, Any, List, Optional, Tuple
+from .http_client import request_json
+from .async_http_client import request_json_async
+from .result_cache import cached_call, cached_call_async
+from .image_payload import ImageInput
+from .validation import validate_request
+from .preprocess import prepare_upload
 
-def add_shadow(
-    api_key: str,
-    image_data: bytes = None,
+def build_shadow_request(
+    image_data: ImageInput = None,
     image_url: str = None,
     shadow_type: str = "regular",
     background_color: Optional[str] = None,
@@ -17,37 +20,15 @@ def add_shadow(
     sku: Optional[str] = None,
     force_rmbg: bool = False,
     content_moderation: bool = False
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
-    Add shadow to an image.
-    
-    Args:
-        api_key: Bria AI API key
-        image_data: Image data in bytes (optional if image_url provided)
-        image_url: URL of the image (optional if image_data provided)
-        shadow_type: Type of shadow ("regular" or "float")
-        background_color: Optional background color in hex format
-        shadow_color: Shadow color in hex format
-        shadow_offset: [x, y] offset for shadow
-        shadow_intensity: Shadow intensity (0-100)
-        shadow_blur: Shadow blur amount
-        shadow_width: Optional shadow width for float shadows
-        shadow_height: Optional shadow height for float shadows
-        sku: Optional SKU identifier
-        force_rmbg: Whether to force background removal
-        content_moderation: Whether to enable content moderation
-    
+    Build the endpoint and request body for an add shadow call.
+
     Returns:
-        Dict containing the API response
+        Tuple of (endpoint path, request data)
     """
-    url = "https://engine.prod.bria-api.com/v1/product/shadow"
-    
-    headers = {
-        'api_token': api_key,
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
-    
+    endpoint = "v1/product/shadow"
+
     # Prepare request data
     data = {
         'shadow_type': shadow_type,
@@ -57,15 +38,15 @@ def add_shadow(
         'content_moderation': content_moderation,
         'shadow_offset': shadow_offset
     }
-    
+
     # Add image data
     if image_url:
         data['image_url'] = image_url
     elif image_data:
-        data['file'] = base64.b64encode(image_data).decode('utf-8')
+        data['file'] = prepare_upload(image_data, endpoint)
     else:
         raise ValueError("Either image_data or image_url must be provided")
-    
+
     # Add optional parameters
     if background_color:
         data['background_color'] = background_color
@@ -77,18 +58,86 @@ def add_shadow(
         data['shadow_height'] = shadow_height
     if sku:
         data['sku'] = sku
-    
+
+    validate_request(endpoint, data)
+    return endpoint, data
+
+def add_shadow(
+    api_key: str,
+    image_data: ImageInput = None,
+    image_url: str = None,
+    shadow_type: str = "regular",
+    background_color: Optional[str] = None,
+    shadow_color: str = "#000000",
+    shadow_offset: List[int] = [0, 15],
+    shadow_intensity: int = 60,
+    shadow_blur: Optional[int] = None,
+    shadow_width: Optional[int] = None,
+    shadow_height: Optional[int] = 70,
+    sku: Optional[str] = None,
+    force_rmbg: bool = False,
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Add shadow to an image.
+
+    Args:
+        api_key: Bria AI API key
+        image_data: Image bytes or an ImagePayload (optional if image_url provided)
+        image_url: URL of the image (optional if image_data provided)
+        shadow_type: Type of shadow ("regular" or "float")
+        background_color: Optional background color in hex format
+        shadow_color: Shadow color in hex format
+        shadow_offset: [x, y] offset for shadow
+        shadow_intensity: Shadow intensity (0-100)
+        shadow_blur: Shadow blur amount
+        shadow_width: Optional shadow width for float shadows
+        shadow_height: Optional shadow height for float shadows
+        sku: Optional SKU identifier
+        force_rmbg: Whether to force background removal
+        content_moderation: Whether to enable content moderation
+        use_cache: Reuse a locally cached result (None follows the endpoint default)
+
+    Returns:
+        Dict containing the API response
+    """
+    endpoint, data = build_shadow_request(
+        image_data, image_url, shadow_type, background_color, shadow_color,
+        shadow_offset, shadow_intensity, shadow_blur, shadow_width,
+        shadow_height, sku, force_rmbg, content_moderation
+    )
+
+    try:
+        return cached_call(endpoint, data, use_cache, lambda: request_json(endpoint, api_key, data))
+    except Exception as e:
+        raise Exception(f"Shadow addition failed: {str(e)}")
+
+async def add_shadow_async(
+    api_key: str,
+    image_data: ImageInput = None,
+    image_url: str = None,
+    shadow_type: str = "regular",
+    background_color: Optional[str] = None,
+    shadow_color: str = "#000000",
+    shadow_offset: List[int] = [0, 15],
+    shadow_intensity: int = 60,
+    shadow_blur: Optional[int] = None,
+    shadow_width: Optional[int] = None,
+    shadow_height: Optional[int] = 70,
+    sku: Optional[str] = None,
+    force_rmbg: bool = False,
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Async variant of add_shadow; takes the same arguments."""
+    endpoint, data = build_shadow_request(
+        image_data, image_url, shadow_type, background_color, shadow_color,
+        shadow_offset, shadow_intensity, shadow_blur, shadow_width,
+        shadow_height, sku, force_rmbg, content_moderation
+    )
+
     try:
-        print(f"Making request to: {url}")
-        print(f"Headers: {headers}")
-        print(f"Data: {data}")
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        print(f"Response status: {response.status_code}")
-        print(f"Response body: {response.text}")
-        
-        return response.json()
+        return await cached_call_async(endpoint, data, use_cache, lambda: request_json_async(endpoint, api_key, data))
     except Exception as e:
-        raise Exception(f"Shadow addition failed: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Shadow addition failed: {str(e)}")
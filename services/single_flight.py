@@ -0,0 +1,126 @@
+"""
+Single-flight coalescing of identical in-flight Bria API requests.
+
+When a request with the same API key, endpoint and body is already in flight
+anywhere in the process (another Streamlit session, a rerun triggered by a
+double-click, a concurrent batch task), later callers wait for that request
+instead of sending a duplicate paid call. Sync and async callers share one
+registry of concurrent.futures.Future objects.
+
+Only a leader's result or Exception is shared. A leader that is cancelled or
+interrupted leaves the registry, and its followers start over: one of them
+becomes the new leader.
+"""
+import asyncio
+import copy
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Awaitable, Tuple
+
+from .fingerprint import request_fingerprint
+
+
+class _LeaderGone(Exception):
+    """The leader stopped without a result; its followers have to retry."""
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """Return the in-flight future for key and whether the caller must run it."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.stats['leaders'] += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result: Any = None, error: Exception = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Run fn once per key at a time; concurrent callers share its result."""
+        while True:
+            future, is_leader = self._join(key)
+            if is_leader:
+                break
+            try:
+                return copy.deepcopy(future.result())
+            except _LeaderGone:
+                continue
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_LeaderGone())
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Async counterpart of do; waits on sync or async leaders alike."""
+        while True:
+            future, is_leader = self._join(key)
+            if is_leader:
+                break
+            try:
+                # Shielded so a cancelled follower does not cancel the shared future
+                return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future)))
+            except _LeaderGone:
+                continue
+        try:
+            result = await fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_LeaderGone())
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+_single_flight = SingleFlight()
+
+
+def request_key(api_key: str, endpoint: str, data: Dict[str, Any]) -> str:
+    """Key identical requests made with the same API key."""
+    key_digest = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+    return f"{key_digest[:16]}:{request_fingerprint(endpoint, data)}"
+
+
+def get_single_flight() -> SingleFlight:
+    """Get the process-wide in-flight registry."""
+    return _single_flight
+
+
+def get_single_flight_stats() -> Dict[str, int]:
+    """Return leader/coalesced counters and the number of requests in flight."""
+    return {**_single_flight.stats, 'in_flight': _single_flight.in_flight()}
+
+
+__all__ = [
+    'SingleFlight',
+    'request_key',
+    'get_single_flight',
+    'get_single_flight_stats'
+]
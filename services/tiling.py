@@ -0,0 +1,341 @@
+"""
+Tiled generative fill and erase for images larger than the API accepts.
+
+Uploads beyond an endpoint's maximum edge are downscaled before they are
+sent, which throws away detail a print-resolution asset needs. Instead, the
+image is cut into overlapping tiles of at most that edge, only the tiles the
+mask touches are sent, concurrently, and each result is blended back over
+its overlap with a linear cross-fade. For fills the stitched result is then
+composited through the feathered mask, so pixels outside it stay original.
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .crop_fill import CROP_FEATHER, encode_image, fetch_result, load_upright, save_composite
+from .erase_foreground import erase_foreground, erase_foreground_async
+from .generative_fill import generative_fill, generative_fill_async
+from .image_payload import ImageInput, ImagePayload
+from .masks import dilate, feather
+from .preprocess import get_max_edge
+from .result_cache import extract_result_urls
+
+TILE_OVERLAP = int(os.getenv('BRIA_TILE_OVERLAP', '128'))
+TILE_WORKERS = int(os.getenv('BRIA_TILE_WORKERS', '4'))
+
+Box = Tuple[int, int, int, int]
+
+
+def _tile_starts(length: int, tile: int, overlap: int) -> List[int]:
+    """Start offsets of tiles covering length, the last one flush with the end."""
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def plan_tiles(size: Tuple[int, int], tile: int, overlap: int = TILE_OVERLAP,
+               mask: Optional[np.ndarray] = None) -> List[Box]:
+    """
+    Overlapping tiles (left, top, right, bottom) covering an image.
+
+    Args:
+        size: (width, height) of the image
+        tile: Longest tile edge, normally the endpoint's maximum input edge
+        overlap: Pixels shared by neighbouring tiles, used for blending
+        mask: Optional boolean mask; tiles it does not touch are skipped
+    """
+    width, height = size
+    overlap = min(overlap, tile // 2)
+    boxes = [
+        (left, top, min(left + tile, width), min(top + tile, height))
+        for top in _tile_starts(height, tile, overlap)
+        for left in _tile_starts(width, tile, overlap)
+    ]
+    if mask is not None:
+        boxes = [box for box in boxes if mask[box[1]:box[3], box[0]:box[2]].any()]
+    return boxes
+
+
+def _blend_alpha(box: Box, pasted: List[Box]) -> Image.Image:
+    """
+    Alpha for pasting a tile over the tiles already pasted.
+
+    Over its overlap with each earlier tile, the tile fades in across the
+    overlap's width (from a tile to its left) or height (from a tile above),
+    so the results cross-fade with weights that sum to one. Pixels no earlier
+    tile covers, such as those next to skipped tiles, are pasted as they are.
+    """
+    left, top, right, bottom = box
+    alpha = np.ones((bottom - top, right - left), dtype=np.float32)
+    for other in pasted:
+        x0, y0 = max(left, other[0]) - left, max(top, other[1]) - top
+        x1, y1 = min(right, other[2]) - left, min(bottom, other[3]) - top
+        if x0 >= x1 or y0 >= y1:
+            continue
+        if other[0] < left:
+            ramp = np.arange(1, x1 + 1, dtype=np.float32) / (x1 + 1)
+            alpha[y0:y1, :x1] = np.minimum(alpha[y0:y1, :x1], ramp[None, :])
+        if other[1] < top:
+            ramp = np.arange(1, y1 + 1, dtype=np.float32) / (y1 + 1)
+            alpha[:y1, x0:x1] = np.minimum(alpha[:y1, x0:x1], ramp[:, None])
+    return Image.fromarray((alpha * 255).round().astype(np.uint8))
+
+
+class TilePlan:
+    """An upright image cut into the tiles to send, and how to put them back together."""
+
+    def __init__(self, original: Image.Image, mask: Optional[np.ndarray], boxes: List[Box], overlap: int,
+                 name: Optional[str] = None):
+        self.original = original
+        self.mask = mask
+        self.boxes = boxes
+        self.overlap = overlap
+        self.name = name
+
+    def tile_image(self, box: Box) -> ImagePayload:
+        return ImagePayload(encode_image(self.original.crop(box)), self.name)
+
+    def tile_mask(self, box: Box) -> ImagePayload:
+        left, top, right, bottom = box
+        buffer = io.BytesIO()
+        Image.fromarray(self.mask[top:bottom, left:right]).save(buffer, format='PNG')
+        return ImagePayload(buffer.getvalue())
+
+    def stitch(self, tile_results: List[List[bytes]], feather_radius: int = CROP_FEATHER) -> Dict[str, Any]:
+        """
+        Blend the results of every tile into full-size composites.
+
+        Args:
+            tile_results: For each box, the result images the API returned for it
+
+        Returns:
+            A response in the API's format whose URLs are the local composites
+        """
+        count = min(len(results) for results in tile_results)
+        mask_alpha = None
+        if self.mask is not None:
+            mask_alpha = Image.fromarray(feather(dilate(self.mask, feather_radius), feather_radius))
+        urls = []
+        for index in range(count):
+            stitched = self.original.copy()
+            pasted: List[Box] = []
+            for box, results in zip(self.boxes, tile_results):
+                size = (box[2] - box[0], box[3] - box[1])
+                with Image.open(io.BytesIO(results[index])) as generated:
+                    generated = generated.convert(self.original.mode)
+                    if generated.size != size:
+                        generated = generated.resize(size, Image.Resampling.LANCZOS)
+                stitched.paste(generated, box[:2], _blend_alpha(box, pasted))
+                pasted.append(box)
+            if mask_alpha is not None:
+                # Only the masked area (and its feathered edge) changes
+                composite = self.original.copy()
+                composite.paste(stitched, (0, 0), mask_alpha)
+                stitched = composite
+            urls.append(save_composite(stitched))
+        return {'result': [{'urls': [url]} for url in urls], 'tiles': len(self.boxes)}
+
+
+def plan_tiled(
+    image: ImageInput,
+    mask: Optional[ImageInput],
+    endpoint: str,
+    tile: Optional[int] = None,
+    overlap: int = TILE_OVERLAP
+) -> Optional[TilePlan]:
+    """
+    Cut an image into tiles for an endpoint.
+
+    Returns None when the image fits the endpoint's maximum edge, so a
+    regular request loses nothing.
+
+    Raises:
+        ValueError: If the mask cannot be read or masks nothing
+    """
+    tile = tile or get_max_edge(endpoint)
+    original, values = load_upright(image, mask)
+    if max(original.size) <= tile:
+        return None
+    overlap = min(overlap, tile // 2)
+    boxes = plan_tiles(original.size, tile, overlap, values)
+    return TilePlan(original, values, boxes, overlap, getattr(image, 'name', None))
+
+
+def _fetch_all(response: Dict[str, Any]) -> List[bytes]:
+    urls = extract_result_urls(response)
+    if not urls:
+        raise Exception("No result URL in API response for a tile")
+    return [fetch_result(url) for url in urls]
+
+
+def _run_tiles(plan: TilePlan, send, workers: int) -> Dict[str, Any]:
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='bria-tile') as pool:
+        tile_results = list(pool.map(lambda box: _fetch_all(send(box)), plan.boxes))
+    return plan.stitch(tile_results)
+
+
+def tiled_generative_fill(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: ImageInput,
+    prompt: str,
+    negative_prompt: Optional[str] = None,
+    num_results: int = 4,
+    sync: bool = True,
+    seed: Optional[int] = None,
+    content_moderation: bool = False,
+    mask_type: str = "manual",
+    use_cache: Optional[bool] = None,
+    tile: Optional[int] = None,
+    overlap: int = TILE_OVERLAP,
+    workers: int = TILE_WORKERS
+) -> Dict[str, Any]:
+    """
+    Generative fill at full resolution, one request per tile the mask touches.
+
+    Args:
+        api_key: Bria AI API key
+        image_data: Image bytes or an ImagePayload
+        mask_data: Mask image bytes or an ImagePayload
+        prompt: Description of what to generate in the masked area
+        negative_prompt: Description of what to avoid (optional)
+        num_results: Number of variations to generate (1-4)
+        sync: Ignored; tiles are stitched locally, so the call always waits
+        seed: Optional seed; the same seed is used for every tile
+        content_moderation: Whether to enable content moderation
+        mask_type: Type of mask ('manual' or 'automatic')
+        use_cache: Reuse locally cached tile results (None follows the endpoint default)
+        tile: Tile edge (defaults to the endpoint's maximum input edge)
+        overlap: Pixels shared by neighbouring tiles
+        workers: Tiles sent at the same time
+
+    Images that fit in one tile are sent as a regular synchronous fill.
+    """
+    plan = plan_tiled(image_data, mask_data, 'v1/gen_fill', tile, overlap)
+    if plan is None:
+        return generative_fill(api_key, image_data, mask_data, prompt, negative_prompt, num_results,
+                               True, seed, content_moderation, mask_type, use_cache)
+    try:
+        return _run_tiles(plan, lambda box: generative_fill(
+            api_key, plan.tile_image(box), plan.tile_mask(box), prompt, negative_prompt,
+            num_results, True, seed, content_moderation, mask_type, use_cache
+        ), workers)
+    except Exception as e:
+        raise Exception(f"Tiled generative fill failed: {str(e)}")
+
+
+def tiled_erase_foreground(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: Optional[ImageInput] = None,
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None,
+    tile: Optional[int] = None,
+    overlap: int = TILE_OVERLAP,
+    workers: int = TILE_WORKERS
+) -> Dict[str, Any]:
+    """
+    Erase foreground at full resolution, one request per tile.
+
+    Args:
+        api_key: Bria AI API key
+        image_data: Image bytes or an ImagePayload
+        mask_data: Optional mask limiting the tiles sent and the area changed
+        content_moderation: Whether to enable content moderation
+        use_cache: Reuse locally cached tile results (None follows the endpoint default)
+        tile: Tile edge (defaults to the endpoint's maximum input edge)
+        overlap: Pixels shared by neighbouring tiles
+        workers: Tiles sent at the same time
+    """
+    plan = plan_tiled(image_data, mask_data, 'v1/erase_foreground', tile, overlap)
+    if plan is None:
+        return erase_foreground(api_key, image_data, content_moderation=content_moderation, use_cache=use_cache)
+    try:
+        return _run_tiles(plan, lambda box: erase_foreground(
+            api_key, plan.tile_image(box), content_moderation=content_moderation, use_cache=use_cache
+        ), workers)
+    except Exception as e:
+        raise Exception(f"Tiled erase foreground failed: {str(e)}")
+
+
+async def _run_tiles_async(plan: TilePlan, send, workers: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(max(1, workers))
+
+    async def run(box: Box) -> List[bytes]:
+        async with semaphore:
+            response = await send(box)
+        return await asyncio.to_thread(_fetch_all, response)
+
+    tile_results = await asyncio.gather(*(run(box) for box in plan.boxes))
+    return await asyncio.to_thread(plan.stitch, list(tile_results))
+
+
+async def tiled_generative_fill_async(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: ImageInput,
+    prompt: str,
+    negative_prompt: Optional[str] = None,
+    num_results: int = 4,
+    sync: bool = True,
+    seed: Optional[int] = None,
+    content_moderation: bool = False,
+    mask_type: str = "manual",
+    use_cache: Optional[bool] = None,
+    tile: Optional[int] = None,
+    overlap: int = TILE_OVERLAP,
+    workers: int = TILE_WORKERS
+) -> Dict[str, Any]:
+    """Async variant of tiled_generative_fill; takes the same arguments."""
+    plan = await asyncio.to_thread(plan_tiled, image_data, mask_data, 'v1/gen_fill', tile, overlap)
+    if plan is None:
+        return await generative_fill_async(api_key, image_data, mask_data, prompt, negative_prompt,
+                                           num_results, True, seed, content_moderation, mask_type, use_cache)
+    try:
+        return await _run_tiles_async(plan, lambda box: generative_fill_async(
+            api_key, plan.tile_image(box), plan.tile_mask(box), prompt, negative_prompt,
+            num_results, True, seed, content_moderation, mask_type, use_cache
+        ), workers)
+    except Exception as e:
+        raise Exception(f"Tiled generative fill failed: {str(e)}")
+
+
+async def tiled_erase_foreground_async(
+    api_key: str,
+    image_data: ImageInput,
+    mask_data: Optional[ImageInput] = None,
+    content_moderation: bool = False,
+    use_cache: Optional[bool] = None,
+    tile: Optional[int] = None,
+    overlap: int = TILE_OVERLAP,
+    workers: int = TILE_WORKERS
+) -> Dict[str, Any]:
+    """Async variant of tiled_erase_foreground; takes the same arguments."""
+    plan = await asyncio.to_thread(plan_tiled, image_data, mask_data, 'v1/erase_foreground', tile, overlap)
+    if plan is None:
+        return await erase_foreground_async(api_key, image_data, content_moderation=content_moderation, use_cache=use_cache)
+    try:
+        return await _run_tiles_async(plan, lambda box: erase_foreground_async(
+            api_key, plan.tile_image(box), content_moderation=content_moderation, use_cache=use_cache
+        ), workers)
+    except Exception as e:
+        raise Exception(f"Tiled erase foreground failed: {str(e)}")
+
+
+__all__ = [
+    'TilePlan',
+    'plan_tiles',
+    'plan_tiled',
+    'tiled_generative_fill',
+    'tiled_erase_foreground',
+    'tiled_generative_fill_async',
+    'tiled_erase_foreground_async'
+]
@@ -0,0 +1,120 @@
+"""
+Local pre-flight checks of Bria API requests.
+
+A request the API is bound to reject still costs a network round trip, and
+for asynchronous jobs a poll or two, before the problem surfaces. Every
+request body is checked here just before it is sent: uploads by their file
+signature, header dimensions and size (without decoding pixels), masks
+against the image they belong to, and required text fields for being
+blank. All problems are collected and raised together as a ValidationError,
+whose errors list says which field failed and why.
+"""
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from .fingerprint import FILE_FIELDS
+from .image_payload import ImagePayload
+
+MAX_UPLOAD_MB = float(os.getenv('BRIA_MAX_UPLOAD_MB', '12'))
+
+# Formats the API accepts for uploads
+SUPPORTED_MIME_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+# Text fields that must say something when present in a request
+REQUIRED_TEXT_FIELDS = ('prompt', 'scene_description')
+
+
+class ValidationError(ValueError):
+    """Request input the API would reject, found before anything was sent."""
+
+    def __init__(self, errors: List[Dict[str, str]], endpoint: Optional[str] = None):
+        self.errors = errors
+        self.endpoint = endpoint
+        super().__init__("; ".join(error['message'] for error in errors))
+
+
+def validation_error(field: str, code: str, message: str) -> Dict[str, str]:
+    """One structured validation error."""
+    return {'field': field, 'code': code, 'message': message}
+
+
+def image_errors(
+    payload: ImagePayload,
+    field: str = 'file',
+    max_bytes: Optional[int] = None
+) -> Tuple[List[Dict[str, str]], Optional[Tuple[int, int]]]:
+    """
+    Check an upload from its header alone.
+
+    Returns:
+        Tuple of (errors, (width, height) or None if the header is unreadable)
+    """
+    errors = []
+    max_bytes = int(MAX_UPLOAD_MB * 1024 * 1024) if max_bytes is None else max_bytes
+    if not len(payload):
+        return [validation_error(field, 'empty_file', f"{field}: the file is empty")], None
+    if payload.mime_type not in SUPPORTED_MIME_TYPES:
+        errors.append(validation_error(
+            field, 'unsupported_format',
+            f"{field}: unsupported format ({payload.mime_type}); use JPEG, PNG or WebP"
+        ))
+    if len(payload) > max_bytes:
+        errors.append(validation_error(
+            field, 'too_large',
+            f"{field}: {len(payload) / (1024 * 1024):.1f} MB is over the {max_bytes / (1024 * 1024):.0f} MB upload limit"
+        ))
+    try:
+        size = payload.size
+    except (OSError, ValueError, SyntaxError):
+        errors.append(validation_error(field, 'unreadable', f"{field}: the image header could not be read"))
+        return errors, None
+    if not size[0] or not size[1]:
+        errors.append(validation_error(field, 'zero_area', f"{field}: the image has no pixels"))
+    return errors, size
+
+
+def request_errors(data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Collect every problem with a request body that can be found locally."""
+    errors = []
+    sizes = {}
+    for field in FILE_FIELDS:
+        value = data.get(field)
+        if isinstance(value, ImagePayload):
+            field_errors, sizes[field] = image_errors(value, field)
+            errors.extend(field_errors)
+
+    mask_size, image_size = sizes.get('mask_file'), sizes.get('file')
+    if mask_size is not None and image_size is not None and mask_size != image_size:
+        errors.append(validation_error(
+            'mask_file', 'mask_size_mismatch',
+            f"mask_file: the mask is {mask_size[0]}x{mask_size[1]} but the image is {image_size[0]}x{image_size[1]}"
+        ))
+
+    for field in REQUIRED_TEXT_FIELDS:
+        if field in data and not str(data[field] or '').strip():
+            errors.append(validation_error(field, 'required', f"{field}: please describe what to generate"))
+
+    return errors
+
+
+def validate_request(endpoint: str, data: Dict[str, Any]):
+    """
+    Raise ValidationError if a request body would be rejected by the API.
+
+    Called by every request builder, so the sync, async, cached and
+    batched code paths are all covered.
+    """
+    errors = request_errors(data)
+    if errors:
+        raise ValidationError(errors, endpoint)
+
+
+__all__ = [
+    'MAX_UPLOAD_MB',
+    'SUPPORTED_MIME_TYPES',
+    'ValidationError',
+    'validation_error',
+    'image_errors',
+    'request_errors',
+    'validate_request'
+]
@@ -7,8 +7,17 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from components.database import DatabaseManager, ActivityTracker
+from components.database import DatabaseManager, ActivityTracker, MIGRATIONS, SCHEMA_VERSION
+from components.activity_writer import ActivityWriter
+from components.blob_store import BlobStore
+from PIL import Image
 import hashlib
+import io
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 
 def test_database_system():
     """Test the database system"""
@@ -78,7 +87,204 @@ def test_database_system():
     for image in images:
         print(f"     - {image['type']}: {image['prompt'][:30]}...")
     
+    # Test blob-backed image storage
+    print("\n8. Testing blob-backed image storage...")
+    blob_db = DatabaseManager("data/test_adsnap.db", blob_store=BlobStore(tempfile.mkdtemp()))
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'green').save(buffer, format='PNG')
+    for _ in range(2):
+        blob_db.save_generated_image(
+            user_id,
+            "https://example.com/result.png",
+            "generated",
+            "Blob prompt",
+            image_data=buffer.getvalue()
+        )
+    images = blob_db.get_user_images(user_id, limit=2)
+    print(f"   Stored at: {images[0]['url']}")
+    assert all(os.path.isfile(image['url']) for image in images)
+    assert images[0]['url'] == images[1]['url']
+    assert blob_db.blob_store.get_stats()['blobs'] == 1
+    assert blob_db.blob_store.digest_for_url("https://example.com/result.png") is not None
+    # Once the blob is evicted the history falls back to the URL the image came from
+    blob_db.blob_store.max_bytes = 1
+    blob_db.blob_store.put(b'another image')
+    assert [image['url'] for image in blob_db.get_user_images(user_id, limit=2)] == ["https://example.com/result.png"] * 2
+    
     print("\n✅ Database system test completed!")
 
+def test_connections_are_reused_per_thread():
+    """Each thread keeps one tuned connection for all of its queries"""
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "pool.db"))
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+    
+    other = []
+    worker = threading.Thread(target=lambda: other.append(db.get_connection()))
+    worker.start()
+    worker.join()
+    assert other[0] is not conn
+    
+    # The statistics update shares the image insert's transaction
+    db.create_user("pooluser", "pool@adsnap.studio", "hash", user_uuid="pool-uuid")
+    _, _, user_info = db.authenticate_user("pooluser", "hash")
+    db.save_generated_image(user_info['id'], "https://example.com/pool.png", "generated", "Pool prompt")
+    assert db.get_user_statistics(user_info['id'])['images_generated'] == 1
+    assert not conn.in_transaction
+    
+    db.close()
+    try:
+        conn.execute("SELECT 1")
+        assert False, "the connection was left open"
+    except sqlite3.ProgrammingError:
+        pass
+    assert db.get_connection() is not conn
+
+def test_activity_writer_batches_in_background():
+    """Activities are queued cheaply and written in batched transactions"""
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "writer.db"))
+    user_id = db.ensure_user("writeruser", "writer@adsnap.studio")
+    assert db.ensure_user("writeruser") == user_id
+    writer = ActivityWriter(db, batch_size=400, flush_ms=50)
+    start = time.perf_counter()
+    for i in range(1000):
+        writer.log(user_id, "feature_usage", f"Event {i}", {"index": i})
+    per_event = (time.perf_counter() - start) / 1000
+    print(f"   {per_event * 1e6:.1f} µs per logged event")
+    assert writer.flush(5)
+    stats = writer.get_stats()
+    print(f"   Stats: {stats}")
+    assert stats['written'] == 1000 and stats['batches'] <= 10
+    activities = db.get_user_activities(user_id, limit=1000)
+    assert len(activities) == 1000 and activities[0]['details']['index'] in range(1000)
+    writer.close()
+    assert not writer.log(user_id, "feature_usage", "After close")
+    
+    # A stalled database fills the queue; callers then give up instead of hanging
+    release = threading.Event()
+    
+    class StalledDb:
+        def __init__(self):
+            self.rows = []
+        
+        def log_activities(self, batch):
+            release.wait(5)
+            self.rows.extend(batch)
+    
+    stalled = StalledDb()
+    writer = ActivityWriter(stalled, max_queue=2, batch_size=1, flush_ms=10, put_timeout_ms=10)
+    results = [writer.log(1, "feature_usage", f"Event {i}") for i in range(5)]
+    assert results.count(False) >= 1 and writer.get_stats()['dropped'] >= 1
+    # Flushing and closing give up on the full queue instead of waiting for the database
+    start = time.monotonic()
+    assert not writer.flush(0.1)
+    writer.close(0.1)
+    print(f"   Gave up on a blocked writer after {time.monotonic() - start:.2f}s")
+    assert time.monotonic() - start < 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while len(stalled.rows) < results.count(True) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(stalled.rows) == results.count(True)
+
+def test_schema_is_migrated_once():
+    """Older databases get the history indexes; current ones skip the migrations"""
+    path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+    legacy = sqlite3.connect(path)
+    MIGRATIONS[0](legacy.cursor())
+    legacy.commit()
+    legacy.close()
+    
+    db = DatabaseManager(path)
+    conn = db.get_connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    plan = " ".join(row[-1] for row in conn.execute('''
+        EXPLAIN QUERY PLAN
+        SELECT activity_type, activity_description, details, timestamp
+        FROM activity_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 50
+    ''', (1,)))
+    print(f"   Plan: {plan}")
+    assert "idx_activity_logs_user_time" in plan and "TEMP B-TREE" not in plan
+    
+    # An up-to-date database runs no migration at all
+    conn.execute("DROP INDEX idx_activity_logs_user_time")
+    DatabaseManager(path)
+    assert "idx_activity_logs_user_time" not in [row[1] for row in conn.execute("PRAGMA index_list(activity_logs)")]
+    db.close()
+
+def test_history_pages_by_cursor():
+    """History is paged by (timestamp, id) cursors, including rows with equal timestamps"""
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "pages.db"))
+    user_id = db.ensure_user("pageuser")
+    db.log_activities([
+        (user_id, "feature_usage", f"Event {i}", {"index": i}, None, f"2024-01-0{1 + i // 10} 12:00:00", None, None)
+        for i in range(25)
+    ])
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = db.get_user_activities_page(user_id, limit=10, cursor=cursor)
+        seen.extend(activity['details']['index'] for activity in page)
+        if cursor is None:
+            break
+    print(f"   Paged: {seen}")
+    assert seen == list(range(24, -1, -1))
+    assert [activity['description'] for activity in db.iter_user_activities(user_id, page_size=7)] == [
+        f"Event {i}" for i in range(24, -1, -1)
+    ]
+    
+    for i in range(3):
+        db.save_generated_image(user_id, f"https://example.com/{i}.png", "generated", f"Prompt {i}", {"seed": i})
+    first, cursor = db.get_user_images_page(user_id, limit=2)
+    rest, end = db.get_user_images_page(user_id, limit=2, cursor=cursor)
+    assert [image['settings']['seed'] for image in first + rest] == [2, 1, 0] and end is None
+    assert dict(rest[0])['prompt'] == "Prompt 0"
+    db.close()
+
+def test_usage_rollups_follow_writes():
+    """Usage summaries come from the daily rollups and are refreshed when activity is logged"""
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "usage.db"))
+    user_id = db.ensure_user("usageuser")
+    today = datetime.now(timezone.utc)
+    stamp = today.strftime('%Y-%m-%d %H:%M:%S')
+    earlier = (today - timedelta(days=40)).strftime('%Y-%m-%d %H:%M:%S')
+    db.log_activities(
+        [(user_id, "image_generation", "Generated", None, None, stamp, i % 10 != 0, 100.0 * (i + 1)) for i in range(100)]
+        + [(user_id, "feature_usage", "Uploaded", None, None, stamp, None, None)] * 5
+        + [(user_id, "image_generation", "Generated", None, None, earlier, False, 50.0)]
+    )
+    rows = db.get_connection().execute(
+        "SELECT COUNT(*) FROM activity_daily WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+    assert rows == 3
+    
+    summary = db.get_usage_summary(user_id, days=30)
+    generation = summary['by_type']['image_generation']
+    print(f"   Summary: {generation}")
+    assert summary['events'] == 105 and generation['events'] == 100
+    assert generation['success_rate'] == 0.9 and summary['success_rate'] == 0.9
+    assert generation['avg_latency_ms'] == 5050
+    # Percentiles are read from ~19% wide buckets
+    assert 5000 * 0.8 < generation['p50_latency_ms'] < 5000 * 1.2
+    assert 9500 * 0.8 < generation['p95_latency_ms'] < 9500 * 1.2
+    assert summary['by_type']['feature_usage']['success_rate'] is None
+    assert summary['daily'] == [(stamp[:10], 105)]
+    assert db.get_usage_summary(user_id, days=30, offset_days=30)['events'] == 1
+    
+    # Cached until the user logs more
+    assert db.get_usage_summary(user_id, days=30) is summary
+    db.log_activity(user_id, "image_generation", "Generated", success=False, latency_ms=200)
+    refreshed = db.get_usage_summary(user_id, days=30)
+    assert refreshed is not summary and refreshed['by_type']['image_generation']['failures'] == 11
+    db.close()
+
 if __name__ == "__main__":
-    test_database_system()
\ No newline at end of file
+    test_database_system()
+    test_connections_are_reused_per_thread()
+    test_activity_writer_batches_in_background()
+    test_schema_is_migrated_once()
+    test_history_pages_by_cursor()
+    test_usage_rollups_follow_writes()
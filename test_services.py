@@ -0,0 +1,739 @@
+#!/usr/bin/env python3
+"""
+Test script for the AdSnap Studio service layer against a local stub API server
+"""
+
+import sys
+import os
+import io
+import asyncio
+import json
+import base64
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import generate_hd_image, erase_foreground, generative_fill, create_packshot
+from services.api_logging import configure_logging, redact
+from services.image_payload import ImagePayload, encode_request_body
+from services.preprocess import prepare_upload, prepare_image_and_mask
+from services import crop_fill, tiling
+from services.tiling import plan_tiled
+from services.crop_fill import plan_crop, composite_response
+from services.masks import (
+    load_mask, dilate, erode, feather, fit_mask, invert, union, intersection, encode_mask_png, prepare_mask,
+    PackedMask
+)
+from services.result_cache import ResultCache
+from services.job_poller import JobPoller, READY, FAILED
+from services.validation import ValidationError, validation_error, request_errors, image_errors
+from workflows.generate_ad_set import generate_ad_set, _gather_or_cancel
+from components.blob_store import BlobStore
+from components.result_downloader import ResultDownloader
+from components.session_store import SessionStore
+from components.preview_cache import PreviewCache
+from components.brush_mask import BrushMask
+from services.http_client import configure_client, ENDPOINT_READ_TIMEOUTS, READ_TIMEOUT
+from services.resilience import configure_resilience, get_resilience_stats
+from services.single_flight import SingleFlight, get_single_flight_stats
+from services.rate_limiter import configure_rate_limits, get_rate_limit_stats, TokenBucket, AIMDController
+
+
+class StubBriaHandler(BaseHTTPRequestHandler):
+    """Replies with the next scripted (status, headers) pair, then 200s; a 'drop' status hangs up."""
+    script = []
+    hits = 0
+    delay = 0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        StubBriaHandler.hits += 1
+        time.sleep(StubBriaHandler.delay)
+        status, headers = StubBriaHandler.script.pop(0) if StubBriaHandler.script else (200, {})
+        if status == 'drop':
+            self.close_connection = True
+            return
+        body = json.dumps({"result": [{"urls": ["https://example.com/image.png"]}]}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        StubBriaHandler.hits += 1
+        body = b'image-bytes:' + self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(script, delay=0):
+    """Start the stub server on a free port and point the client at it."""
+    StubBriaHandler.script = list(script)
+    StubBriaHandler.hits = 0
+    StubBriaHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubBriaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    configure_client(base_url=f"http://127.0.0.1:{server.server_port}")
+    configure_resilience(max_attempts=3, backoff_base=0.01, backoff_max=1, breaker_threshold=3, breaker_cooldown=60)
+    configure_rate_limits(default_rps=100, initial_concurrency=4, max_concurrency=8)
+    return server
+
+
+def test_retries_server_errors():
+    """503s are retried until the API recovers."""
+    server = start_stub_server([(503, {}), (503, {})])
+    try:
+        result = generate_hd_image("A red bicycle", "test-key")
+        stats = get_resilience_stats()["v1/text-to-image/hd/2.2"]
+        print(f"   Hits: {StubBriaHandler.hits}, stats: {stats}")
+        assert "result" in result
+        assert StubBriaHandler.hits == 3
+        assert stats["retries"] == 2
+        assert stats["state"] == "closed"
+    finally:
+        server.shutdown()
+
+
+def test_honors_retry_after():
+    """A 429 waits for the Retry-After interval before retrying."""
+    server = start_stub_server([(429, {'Retry-After': '0.3'})])
+    try:
+        start = time.monotonic()
+        generate_hd_image("A red bicycle", "test-key")
+        elapsed = time.monotonic() - start
+        print(f"   Elapsed: {elapsed:.2f}s")
+        assert elapsed >= 0.3
+    finally:
+        server.shutdown()
+
+
+def test_client_errors_are_not_retried():
+    """A 400 fails immediately without retries."""
+    server = start_stub_server([(400, {})])
+    try:
+        try:
+            generate_hd_image("A red bicycle", "test-key")
+            assert False, "Expected the 400 to raise"
+        except Exception as e:
+            print(f"   Result: {e}")
+        assert StubBriaHandler.hits == 1
+        assert get_resilience_stats()["v1/text-to-image/hd/2.2"]["state"] == "closed"
+    finally:
+        server.shutdown()
+
+
+def test_circuit_breaker_fails_fast():
+    """Repeated failures open the breaker and later calls skip the network."""
+    server = start_stub_server([(500, {})] * 10)
+    try:
+        try:
+            generate_hd_image("A red bicycle", "test-key")
+            assert False, "Expected the 500s to raise"
+        except Exception as e:
+            print(f"   First call: {e}")
+        hits = StubBriaHandler.hits
+        try:
+            generate_hd_image("A red bicycle", "test-key")
+            assert False, "Expected the open circuit to raise"
+        except Exception as e:
+            print(f"   Second call: {e}")
+            assert "Circuit open" in str(e)
+        stats = get_resilience_stats()["v1/text-to-image/hd/2.2"]
+        print(f"   Stats: {stats}")
+        assert StubBriaHandler.hits == hits == 3
+        assert stats["state"] == "open"
+        assert stats["trips"] == 1
+        assert stats["rejected"] == 1
+    finally:
+        server.shutdown()
+
+
+def test_token_bucket_paces_requests():
+    """The token bucket spaces requests beyond the burst at the configured rate."""
+    bucket = TokenBucket(rate=10, capacity=2)
+    waits = [bucket.reserve(max_wait=5) for _ in range(5)]
+    print(f"   Waits: {[round(w, 2) for w in waits]}")
+    assert waits[0] == waits[1] == 0
+    assert abs(waits[4] - 0.3) < 0.05
+
+
+def test_aimd_shrinks_on_throttling():
+    """429s halve the concurrency limit and successes grow it back."""
+    controller = AIMDController(initial=8, maximum=8)
+    controller.acquire(timeout=1)
+    controller.release(throttled=True)
+    assert controller.snapshot()["limit"] == 4
+    for _ in range(4):
+        controller.acquire(timeout=1)
+        controller.release(succeeded=True)
+    print(f"   Controller: {controller.snapshot()}")
+    assert controller.snapshot()["limit"] == 5
+
+
+def test_throttling_adapts_concurrency():
+    """A 429 from the API lowers the key's concurrency limit without tripping the breaker."""
+    server = start_stub_server([(429, {'Retry-After': '0'})])
+    try:
+        generate_hd_image("A red bicycle", "test-key")
+        limits = list(get_rate_limit_stats().values())
+        print(f"   Limits: {limits}")
+        assert limits[0]["throttled"] == 1
+        assert limits[0]["limit"] == 2
+        assert get_resilience_stats()["v1/text-to-image/hd/2.2"]["failures"] == 0
+    finally:
+        server.shutdown()
+
+
+def test_read_timeouts_are_not_resent_to_generation():
+    """A generation whose response timed out is not sent again; idempotent edits are."""
+    server = start_stub_server([], delay=0.3)
+    try:
+        configure_client(read_timeout=0.1, endpoint_timeouts={'v1/text-to-image/hd': 0.1, 'v1/product/packshot': 0.1})
+        try:
+            generate_hd_image("A red bicycle", "test-key")
+            assert False, "the slow generation did not time out"
+        except Exception as e:
+            assert "timed out" in str(e)
+        print(f"   Generation hits: {StubBriaHandler.hits}")
+        assert StubBriaHandler.hits == 1
+
+        StubBriaHandler.hits = 0
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 32), 'red').save(buffer, format='PNG')
+        try:
+            create_packshot("test-key", buffer.getvalue(), use_cache=False)
+        except Exception as e:
+            assert "timed out" in str(e)
+        assert StubBriaHandler.hits == 3
+    finally:
+        configure_client(endpoint_timeouts=ENDPOINT_READ_TIMEOUTS, read_timeout=READ_TIMEOUT)
+        server.shutdown()
+
+
+def test_dropped_connections_are_not_resent_to_generation():
+    """A connection dropped after the upload is only retried on idempotent endpoints."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 32), 'red').save(buffer, format='PNG')
+    image = buffer.getvalue()
+    buffer = io.BytesIO()
+    Image.new('L', (64, 32), 255).save(buffer, format='PNG')
+    mask = buffer.getvalue()
+    server = start_stub_server([('drop', {})])
+    try:
+        try:
+            generative_fill("test-key", image, mask, prompt="grass", use_cache=False)
+            assert False, "the dropped generative fill did not fail"
+        except Exception as e:
+            print(f"   Result: {e}")
+        assert StubBriaHandler.hits == 1
+
+        StubBriaHandler.script = [('drop', {})]
+        StubBriaHandler.hits = 0
+        create_packshot("test-key", image, use_cache=False)
+        assert StubBriaHandler.hits == 2
+    finally:
+        server.shutdown()
+
+
+def test_identical_requests_are_coalesced():
+    """A duplicate request made while the first is in flight shares its response."""
+    server = start_stub_server([], delay=0.3)
+    try:
+        before = get_single_flight_stats()["coalesced"]
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(generate_hd_image("A red bicycle", "test-key", seed=7)))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        print(f"   Hits: {StubBriaHandler.hits}, stats: {get_single_flight_stats()}")
+        assert StubBriaHandler.hits == 1
+        assert len(results) == 2 and results[0] == results[1]
+        assert get_single_flight_stats()["coalesced"] == before + 1
+    finally:
+        server.shutdown()
+
+
+def test_cancelled_leader_hands_over_to_a_follower():
+    """Cancelling the caller that sends a request does not fail the callers waiting on it."""
+    flight = SingleFlight()
+    calls = []
+
+    async def slow_call():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return {'result': len(calls)}
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do_async('key', slow_call))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(flight.do_async('key', slow_call))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        result = await follower
+        return leader, result
+
+    leader, result = asyncio.run(scenario())
+    print(f"   Calls: {len(calls)}, follower got {result}")
+    assert leader.cancelled()
+    assert result == {'result': 2} and flight.in_flight() == 0
+
+
+def test_structured_logging_redacts_payloads():
+    """API calls are logged as JSON lines without tokens or base64 uploads."""
+    assert redact({'api_token': 'secret', 'file': 'A' * 5000}) == {'api_token': '***', 'file': '<base64: 5000 chars>'}
+    server = start_stub_server([(400, {})])
+    log_file = os.path.join(tempfile.mkdtemp(), 'api.jsonl')
+    configure_logging(level='DEBUG', log_file=log_file, success_sample_rate=1.0)
+    try:
+        # Noise does not compress, so the upload stays about 30 KB
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (100, 100), os.urandom(30000)).save(buffer, format='PNG')
+        image = buffer.getvalue()
+        try:
+            erase_foreground("test-key", image_data=image, use_cache=False)
+        except Exception:
+            pass
+        erase_foreground("test-key", image_data=image, use_cache=False)
+        with open(log_file) as f:
+            text = f.read()
+        entries = [json.loads(line) for line in text.splitlines()]
+        print(f"   Events: {[entry['event'] for entry in entries]}")
+        assert [entry['event'] for entry in entries] == ['api.payload', 'api.error', 'api.payload', 'api.success']
+        assert entries[1]['status'] == 400 and entries[0]['request_id'] == entries[1]['request_id']
+        assert entries[3]['request_bytes'] > 40000 and entries[3]['latency_ms'] >= 0
+        assert 'test-key' not in text and len(text) < 4000
+    finally:
+        configure_logging()
+        server.shutdown()
+
+
+def test_image_payload_encodes_once():
+    """An ImagePayload memoizes its encodings and produces the same body as plain JSON."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 32), 'red').save(buffer, format='PNG')
+    payload = ImagePayload(buffer.getvalue())
+    assert payload.base64_bytes is payload.base64_bytes
+    assert payload.size == (64, 32) and payload.mime_type == 'image/png'
+    body = encode_request_body({'file': payload, 'prompt': 'café', 'shot_size': [1000, 1000]})
+    expected = {'file': base64.b64encode(buffer.getvalue()).decode('utf-8'), 'prompt': 'café', 'shot_size': [1000, 1000]}
+    assert json.loads(body) == expected
+
+
+def test_uploads_are_downscaled_with_aligned_masks():
+    """Oversized uploads are shrunk and rotated upright; masks follow the image."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    Image.new('RGB', (4000, 3000), 'blue').save(buffer, format='JPEG', exif=exif.tobytes())
+    mask = Image.new('L', (4000, 3000), 0)
+    mask.paste(255, (0, 0, 2000, 3000))
+    mask_buffer = io.BytesIO()
+    mask.save(mask_buffer, format='PNG')
+    upload = ImagePayload(buffer.getvalue())
+    image, prepared_mask = prepare_image_and_mask(upload, mask_buffer.getvalue(), 'v1/gen_fill')
+    print(f"   Image: {image.size}, mask: {prepared_mask.size}")
+    assert image.size == prepared_mask.size == (1440, 1920)
+    assert Image.open(io.BytesIO(prepared_mask.data)).getpixel((720, 0)) == 255
+    assert prepare_upload(upload, 'v1/gen_fill') is image
+    small = ImagePayload(mask_buffer.getvalue())
+    assert prepare_upload(small, 'v1/erase_foreground', enabled=False) is small
+
+
+def test_result_cache_tracks_its_size():
+    """The result cache keeps a running size and file index instead of listing its directory."""
+    server = start_stub_server([])
+    try:
+        cache_dir = tempfile.mkdtemp()
+        cache = ResultCache(cache_dir, max_bytes=10 ** 6)
+        base = f"http://127.0.0.1:{server.server_port}"
+        for index in range(3):
+            cache.put(f"{index:064x}", {'result_url': f"{base}/result-{index}.png"})
+        on_disk = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+        assert cache.stats()['bytes'] == on_disk and cache.stats()['entries'] == 3
+        assert ResultCache(cache_dir).stats()['bytes'] == on_disk
+
+        # Evicting the oldest entry deletes its files too
+        cache.max_bytes = on_disk - 1
+        cache.put(f"{1:064x}", {'result_url': f"{base}/result-1.png"})
+        assert cache.get(f"{0:064x}") is None
+        assert not any(name.startswith(f"{0:064x}") for name in os.listdir(cache_dir))
+        assert cache.get(f"{1:064x}")['cached']
+    finally:
+        server.shutdown()
+
+
+def test_job_poller_waits_for_results():
+    """Background jobs turn ready once every result exists, or fail after the timeout."""
+    poller = JobPoller(initial_delay=0.05, max_delay=0.1, timeout=5)
+    result_path = os.path.join(tempfile.mkdtemp(), 'result.png')
+    job_id = poller.submit([result_path], "Test job")
+    time.sleep(0.3)
+    assert poller.get(job_id)["status"] == "pending"
+    with open(result_path, 'wb') as f:
+        f.write(b'done')
+    deadline = time.monotonic() + 5
+    while poller.get(job_id)["status"] == "pending" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    print(f"   Job: {poller.get(job_id)}")
+    assert poller.get(job_id)["status"] == READY
+
+    poller.timeout = 0.2
+    missing_id = poller.submit([result_path + '.missing'])
+    time.sleep(0.6)
+    assert poller.get(missing_id)["status"] == FAILED
+
+
+def test_result_downloader_fetches_once():
+    """Result images are downloaded in parallel once, then served from memory or disk."""
+    server = start_stub_server([])
+    try:
+        base = f"http://127.0.0.1:{server.server_port}"
+        urls = [f"{base}/result_{index}.png" for index in range(4)]
+        blob_dir = tempfile.mkdtemp()
+        downloader = ResultDownloader(blob_store=BlobStore(blob_dir), memory_bytes=40)
+        downloader.prefetch(urls)
+        download = downloader.lazy(urls[3])
+        assert [downloader.fetch(url) for url in urls][0] == b'image-bytes:/result_0.png'
+        # Download buttons are handed the mirrored file itself, not a copy of it
+        with download() as f:
+            assert f.read() == b'image-bytes:/result_3.png'
+            assert f.name == downloader.path(urls[3]) and f.name.startswith(blob_dir)
+        assert StubBriaHandler.hits == 4
+        # A new downloader (e.g. after a restart) finds the results on disk
+        assert ResultDownloader(blob_store=BlobStore(blob_dir)).fetch(urls[0]) == b'image-bytes:/result_0.png'
+        print(f"   Stats: {downloader.stats}")
+        assert StubBriaHandler.hits == 4
+        assert downloader.stats['downloads'] == 4
+    finally:
+        server.shutdown()
+
+
+def test_blob_store_prunes_url_links():
+    """Links from result URLs go with the blobs they point at; leftovers are cleaned up."""
+    root = tempfile.mkdtemp()
+    store = BlobStore(root, max_bytes=30)
+    first = store.put(b'1' * 20)
+    store.link_url("https://example.com/first.png", first)
+    second = store.put(b'2' * 20)
+    store.link_url("https://example.com/second.png", second)
+    print(f"   Stats: {store.get_stats()}")
+    assert store.digest_for_url("https://example.com/first.png") is None
+    assert len(os.listdir(os.path.join(root, 'urls'))) == 1 and store.get_stats()['links'] == 1
+
+    # On restart, links to missing blobs and stale temporary files are removed
+    with open(os.path.join(root, 'urls', 'dangling'), 'w') as f:
+        f.write('0' * 64)
+    for name, age in (('stale.tmp', 2 * 3600), ('fresh.tmp', 0)):
+        path = os.path.join(root, 'tmp', name)
+        open(path, 'wb').close()
+        os.utime(path, (time.time() - age, time.time() - age))
+    reopened = BlobStore(root, max_bytes=30)
+    assert reopened.get_stats()['bytes'] == 20 and reopened.get_stats()['links'] == 1
+    assert 'dangling' not in os.listdir(os.path.join(root, 'urls'))
+    assert os.listdir(os.path.join(root, 'tmp')) == ['fresh.tmp']
+    assert reopened.digest_for_url("https://example.com/second.png") == second
+
+
+def test_session_store_spills_to_disk():
+    """Session images stay within their memory budget and are read back from disk."""
+    store = SessionStore(blob_store=BlobStore(tempfile.mkdtemp()), session_bytes=250, total_bytes=400)
+    first = store.put('a', b'1' * 200, 'first.png')
+    second = store.put('a', b'2' * 200, 'second.png')
+    # Only the most recent upload fits the session's budget
+    assert store.session_usage('a') == 200
+    assert store.get('a', first).data == b'1' * 200
+    assert store.stats['disk_reads'] == 1
+    store.put('b', b'3' * 150)
+    store.put('c', b'4' * 150)
+    print(f"   Stats: {store.get_stats()}")
+    assert store.get_stats()['bytes'] <= 400
+    assert store.get('a', second).data == b'2' * 200
+    assert store.drop_sessions(lambda session_id: session_id != 'c') == 1
+    assert store.get_stats()['per_session'] == {'a': 200}
+    # An upload larger than the budget stays in memory while it is the one in use
+    reads = store.stats['disk_reads']
+    large = store.put('a', b'5' * 300)
+    assert store.get('a', large).data == b'5' * 300 and store.session_usage('a') == 300
+    assert store.stats['disk_reads'] == reads
+    store.get('a', second)
+    assert store.session_usage('a') == 200
+
+
+def test_previews_are_rendered_once():
+    """Previews are downscaled once per image and small uploads are shown as is."""
+    cache = PreviewCache()
+    buffer = io.BytesIO()
+    Image.new('RGB', (3000, 2000), 'green').save(buffer, format='JPEG')
+    upload = ImagePayload(buffer.getvalue())
+    preview = cache.preview(upload, max_edge=600)
+    assert Image.open(io.BytesIO(preview)).size == (600, 400)
+    assert cache.preview(ImagePayload(buffer.getvalue()), max_edge=600) is preview
+    small = ImagePayload(cache.preview(upload, max_edge=600))
+    assert cache.preview(small, max_edge=600) is small.data
+    assert cache.decoded(upload) is cache.decoded(upload)
+    print(f"   Stats: {cache.get_stats()}")
+    assert cache.stats['previews'] == 2 and cache.stats['decodes'] == 1
+
+
+def test_mask_toolkit():
+    """Masks are binarized, fitted, grown and shrunk exactly, and empty masks are rejected."""
+    grey = np.zeros((100, 200), dtype=np.uint8)
+    grey[20:60, 50:150] = 200
+    grey[0, 0] = 100
+    mask = load_mask(grey)
+    assert mask.dtype == np.bool_ and mask.sum() == 40 * 100
+    assert dilate(mask, 3).sum() == 46 * 106
+    assert erode(mask, 3).sum() == 34 * 94
+    assert (erode(dilate(mask, 5), 5) == mask).all()
+    assert (union(mask, invert(mask)) == True).all() and not intersection(mask, invert(mask)).any()
+    assert fit_mask(mask, (400, 50)).shape == (50, 400) and fit_mask(mask, (400, 50)).sum() == 20 * 200
+    alpha = feather(mask, 6)
+    assert alpha[40, 100] == 255 and alpha[90, 10] == 0 and 0 < alpha[20, 100] < 255
+    prepared = prepare_mask(ImagePayload(encode_mask_png(mask)), (400, 200))
+    assert Image.open(io.BytesIO(prepared.data)).mode == '1' and prepared.size == (400, 200)
+    try:
+        prepare_mask(np.zeros((10, 10), dtype=np.uint8), (10, 10))
+        assert False, "an empty mask was accepted"
+    except ValueError as e:
+        print(f"   Rejected: {e}")
+
+
+def test_packed_masks_track_area_and_bounds():
+    """Packed masks take a bit per pixel, are painted in place and encode their PNG once."""
+    mask = np.zeros((100, 203), dtype=bool)
+    mask[10:20, 30:45] = True
+    packed = PackedMask.from_array(mask)
+    print(f"   {packed}: {packed.bits.nbytes} bytes instead of {mask.nbytes}")
+    assert packed.bits.nbytes == 100 * 26 and (packed.to_array() == mask).all()
+    assert packed.area == 150 and packed.bbox == (30, 10, 45, 20)
+
+    empty = PackedMask.empty((203, 100))
+    assert empty.is_empty and empty.bbox is None
+    empty.paint(195, 90, np.ones((10, 8), dtype=bool))
+    assert empty.area == 80 and empty.bbox == (195, 90, 203, 100) and empty.to_array()[95, 202]
+
+    payload = packed.payload
+    assert packed.payload is payload and (load_mask(payload) == mask).all()
+    # Already binary and sized for the image, so preparing it for upload is free
+    assert prepare_mask(packed, (203, 100)) is payload and prepare_mask(payload, (203, 100)) is payload
+    packed.paint(0, 0, np.ones((1, 1), dtype=bool))
+    assert packed.payload is not payload and packed.bbox == (0, 0, 45, 20)
+
+
+def test_crop_to_mask_pastes_back():
+    """Only the masked region plus context is sent, and the result is blended into the original."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (2000, 1500), (128, 128, 128)).save(buffer, format='JPEG')
+    mask = Image.new('L', (2000, 1500), 0)
+    mask.paste(255, (1000, 700, 1100, 800))
+    mask_buffer = io.BytesIO()
+    mask.save(mask_buffer, format='PNG')
+    plan = plan_crop(buffer.getvalue(), mask_buffer.getvalue())
+    left, top, right, bottom = plan.box
+    print(f"   Crop: {plan.box}, {len(plan.image)} of {len(buffer.getvalue())} bytes")
+    assert right - left >= 512 and bottom - top >= 512
+    assert left < 1000 and top < 700 and right > 1100 and bottom > 800
+    assert plan.image.size == (right - left, bottom - top)
+
+    # The API may answer at a lower resolution than the crop it was sent
+    result_path = os.path.join(tempfile.mkdtemp(), 'result.png')
+    Image.new('RGB', ((right - left) // 2, (bottom - top) // 2), (255, 0, 0)).save(result_path)
+    crop_fill.COMPOSITE_DIR = tempfile.mkdtemp()
+    response = composite_response(plan, {"result": [{"urls": [result_path]}]})
+    composite = Image.open(response["result"][0]["urls"][0])
+    assert composite.size == (2000, 1500)
+    red, green, _ = composite.getpixel((1050, 750))
+    assert red > 240 and green < 20
+    assert composite.getpixel((200, 200))[0] in range(120, 137)
+    # A mask covering most of the image is sent whole
+    full_mask = io.BytesIO()
+    Image.new('L', (2000, 1500), 255).save(full_mask, format='PNG')
+    assert plan_crop(buffer.getvalue(), full_mask.getvalue()) is None
+
+
+def test_tiles_are_stitched_with_overlap_blending():
+    """Large images are processed in overlapping tiles; only tiles touching the mask are sent."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (3000, 1000), (0, 0, 0)).save(buffer, format='PNG')
+    mask = Image.new('L', (3000, 1000), 0)
+    mask.paste(255, (0, 0, 1800, 1000))
+    mask_buffer = io.BytesIO()
+    mask.save(mask_buffer, format='PNG')
+    plan = plan_tiled(buffer.getvalue(), mask_buffer.getvalue(), 'v1/gen_fill', tile=1024, overlap=100)
+    print(f"   Tiles: {plan.boxes}")
+    assert plan.boxes == [(0, 0, 1024, 1000), (924, 0, 1948, 1000)]
+
+    # Each tile comes back as a flat colour, so the cross-fade is easy to read
+    result_dir = tempfile.mkdtemp()
+    colours = iter([(200, 0, 0), (0, 0, 200)])
+
+    def send(box):
+        path = os.path.join(result_dir, f"{box[0]}.png")
+        Image.new('RGB', (box[2] - box[0], box[3] - box[1]), next(colours)).save(path)
+        return {"result_url": path}
+
+    crop_fill.COMPOSITE_DIR = tempfile.mkdtemp()
+    response = tiling._run_tiles(plan, send, workers=1)
+    composite = Image.open(response["result"][0]["urls"][0])
+    assert composite.size == (3000, 1000)
+    # Composites are JPEG, so colours are compared with a small tolerance
+    close = lambda pixel, expected: all(abs(a - b) <= 4 for a, b in zip(pixel, expected))
+    assert close(composite.getpixel((500, 500)), (200, 0, 0))
+    assert close(composite.getpixel((1500, 500)), (0, 0, 200))
+    assert close(composite.getpixel((974, 500)), (100, 0, 100))
+    assert close(composite.getpixel((2500, 500)), (0, 0, 0))
+    assert plan_tiled(buffer.getvalue(), mask_buffer.getvalue(), 'v1/gen_fill', tile=4096) is None
+
+    # A tile only fades in where an earlier tile was actually pasted: with the
+    # tiles beside and below the top-left one skipped, the bottom-right tile
+    # fades over the corner they share and nowhere else
+    alpha = np.asarray(tiling._blend_alpha((924, 924, 1948, 1948), [(0, 0, 1024, 1024)]))
+    assert alpha[50, 50] < 255 and alpha[50, 500] == 255 and alpha[500, 50] == 255
+
+
+def test_brush_strokes_rasterize_incrementally():
+    """Brush clicks paint a disc in the mask and tint the preview overlay."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 100), (0, 0, 255)).save(buffer, format='PNG')
+    brush = BrushMask((2000, 1000), buffer.getvalue(), Image.Transpose.ROTATE_270)
+    # Nothing beyond the encoded preview is held until the first stroke
+    assert brush.nbytes < len(buffer.getvalue()) + brush.mask.nbytes + 200 * 100 + 64
+    brush.add_from_preview(50, 50, 5)
+    brush.add(1500, 500, 100)
+    print(f"   Strokes: {brush.strokes.tolist()}")
+    assert brush.strokes.tolist() == [[500, 500, 50], [1500, 500, 100]]
+    assert 0.7 < brush.mask.area / (np.pi * (50 ** 2 + 100 ** 2)) < 1.1
+    assert brush.mask.bbox == (450, 400, 1601, 601)
+    overlay = brush.overlay()
+    assert overlay.shape == (100, 200, 3)
+    assert tuple(overlay[50, 50]) == (127, 20, 147)
+    assert tuple(overlay[10, 100]) == (0, 0, 255)
+
+    brush.undo()
+    mask = brush.mask.to_array()
+    assert len(brush) == 1 and not mask[500, 1500] and mask[500, 500]
+    assert tuple(brush.overlay()[50, 150]) == (0, 0, 255)
+    # The mask goes back on the upload's stored grid: portrait, rotated back
+    with Image.open(io.BytesIO(brush.to_png())) as stored:
+        assert stored.mode == '1' and stored.size == (1000, 2000)
+        assert stored.transpose(Image.Transpose.ROTATE_270).getpixel((500, 500))
+    assert brush.to_png() is brush.to_png()
+    assert brush.nbytes > 200 * 100 * 3 + len(brush.to_png())
+    brush.clear()
+    assert len(brush) == 0 and brush.mask.is_empty
+
+
+def test_invalid_requests_fail_before_sending():
+    """Unreadable uploads, mismatched masks and blank prompts are rejected locally."""
+    server = start_stub_server([])
+    try:
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 32), 'red').save(buffer, format='PNG')
+        image = buffer.getvalue()
+        try:
+            generative_fill("test-key", b'GIF89a-not-really', image, prompt="grass", use_cache=False)
+            assert False, "an unsupported upload was sent"
+        except ValidationError as e:
+            print(f"   Rejected: {e.errors}")
+            assert [error['code'] for error in e.errors] == ['unsupported_format', 'unreadable']
+        try:
+            generate_ad_set("test-key", image, config={"lifestyle_shot": True, "scene_description": "  "})
+            assert False, "a blank scene description was sent"
+        except ValidationError as e:
+            assert e.errors[0]['field'] == 'scene_description'
+        assert StubBriaHandler.hits == 0
+
+        mask = ImagePayload(encode_mask_png(np.ones((10, 10), dtype=bool)))
+        errors = request_errors({'file': ImagePayload(image), 'mask_file': mask, 'prompt': ''})
+        assert [error['code'] for error in errors] == ['mask_size_mismatch', 'required']
+        assert image_errors(ImagePayload(image), max_bytes=100)[0][0]['code'] == 'too_large'
+    finally:
+        server.shutdown()
+
+
+def test_failed_ad_set_cancels_pending_requests():
+    """When one ad set request fails, the others still in flight are cancelled."""
+    cancelled = []
+
+    async def slow(name):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValidationError([validation_error('file', 'unreadable', "file: unreadable")])
+
+    async def run():
+        return await _gather_or_cancel({'packshot': slow('packshot'), 'shadow': failing(), 'lifestyle': slow('lifestyle')})
+
+    started = time.monotonic()
+    try:
+        asyncio.run(run())
+        assert False, "the failure was swallowed"
+    except ValidationError:
+        pass
+    assert sorted(cancelled) == ['lifestyle', 'packshot'] and time.monotonic() - started < 1
+
+    async def succeed(value):
+        return value
+
+    assert asyncio.run(_gather_or_cancel({'a': succeed(1), 'b': succeed(2)})) == {'a': 1, 'b': 2}
+
+
+if __name__ == "__main__":
+    print("🧪 Testing AdSnap Studio Service Layer")
+    print("=" * 50)
+    for number, test in enumerate([
+        test_retries_server_errors,
+        test_honors_retry_after,
+        test_client_errors_are_not_retried,
+        test_circuit_breaker_fails_fast,
+        test_token_bucket_paces_requests,
+        test_aimd_shrinks_on_throttling,
+        test_throttling_adapts_concurrency,
+        test_read_timeouts_are_not_resent_to_generation,
+        test_dropped_connections_are_not_resent_to_generation,
+        test_identical_requests_are_coalesced,
+        test_cancelled_leader_hands_over_to_a_follower,
+        test_structured_logging_redacts_payloads,
+        test_image_payload_encodes_once,
+        test_uploads_are_downscaled_with_aligned_masks,
+        test_result_cache_tracks_its_size,
+        test_job_poller_waits_for_results,
+        test_result_downloader_fetches_once,
+        test_blob_store_prunes_url_links,
+        test_session_store_spills_to_disk,
+        test_previews_are_rendered_once,
+        test_mask_toolkit,
+        test_packed_masks_track_area_and_bounds,
+        test_crop_to_mask_pastes_back,
+        test_tiles_are_stitched_with_overlap_blending,
+        test_brush_strokes_rasterize_incrementally,
+        test_invalid_requests_fail_before_sending,
+        test_failed_ad_set_cancels_pending_requests
+    ], start=1):
+        print(f"\n{number}. {test.__doc__}")
+        test()
+    print("\n✅ Service layer test completed!")
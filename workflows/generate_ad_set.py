@@ -1,12 +1,16 @@
+import asyncio
 from typing import Dict, Any, Optional
 from services import (
-    lifestyle_shot_by_text,
-    add_shadow,
-    create_packshot,
-    generate_hd_image
+    lifestyle_shot_by_text_async,
+    add_shadow_async,
+    create_packshot_async,
+    generate_hd_image_async
 )
+from services.async_http_client import close_async_client
+from services.image_payload import ImagePayload
+from services.validation import ValidationError, validation_error, image_errors
 
-def generate_ad_set(
+async def generate_ad_set_async(
     api_key: str,
     image: Optional[bytes] = None,
     prompt: Optional[str] = None,
@@ -14,15 +18,34 @@ def generate_ad_set(
 ) -> Dict[str, Any]:
     """
     Generate a set of product ads based on configuration.
+
+    The packshot, shadow and lifestyle requests only depend on the source
+    image, so they are sent concurrently once it is available.
     """
     if not config:
         config = {}
-    
+
+    # Encode the upload once for all of the requests below
+    if isinstance(image, bytes):
+        image = ImagePayload(image)
+
+    # Reject the whole set up front rather than after some of it was paid for
+    errors = []
+    if isinstance(image, ImagePayload):
+        # Oversized uploads are downscaled before sending, so only the file itself is checked
+        errors.extend(error for error in image_errors(image)[0] if error['code'] != 'too_large')
+    if config.get("lifestyle_shot", False) and not str(config.get("scene_description") or "").strip():
+        errors.append(validation_error(
+            'scene_description', 'required', "scene_description: describe the scene for the lifestyle shot"
+        ))
+    if errors:
+        raise ValidationError(errors)
+
     result = {}
-    
+
     # Generate HD image if prompt provided
     if prompt and not image:
-        hd_response = generate_hd_image(
+        hd_response = await generate_hd_image_async(
             api_key=api_key,
             prompt=prompt,
             num_results=config.get("num_results", 1),
@@ -31,33 +54,81 @@ def generate_ad_set(
         )
         result["hd_image"] = hd_response
         image = hd_response.get("result_url")
-    
+
+    if not image:
+        return result
+
+    tasks = {}
+
     # Create packshot if requested
-    if config.get("create_packshot", False) and image:
-        packshot_response = create_packshot(
+    if config.get("create_packshot", False):
+        tasks["packshot"] = create_packshot_async(
             api_key=api_key,
             image_data=image,
             background_color=config.get("background_color", "#FFFFFF")
         )
-        result["packshot"] = packshot_response
-    
+
     # Add shadow if requested
-    if config.get("add_shadow", False) and image:
-        shadow_response = add_shadow(
+    if config.get("add_shadow", False):
+        tasks["shadow"] = add_shadow_async(
             api_key=api_key,
             image_data=image,
             shadow_type=config.get("shadow_type", "natural")
         )
-        result["shadow"] = shadow_response
-    
+
     # Create lifestyle shot if requested
-    if config.get("lifestyle_shot", False) and image:
-        lifestyle_response = lifestyle_shot_by_text(
+    if config.get("lifestyle_shot", False):
+        tasks["lifestyle"] = lifestyle_shot_by_text_async(
             api_key=api_key,
             image_data=image,
             scene_description=config.get("scene_description", ""),
             num_results=config.get("num_results", 1)
         )
-        result["lifestyle"] = lifestyle_response
-    
-    return result 
\ No newline at end of file
+
+    result.update(await _gather_or_cancel(tasks))
+
+    return result
+
+async def _gather_or_cancel(coroutines: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the requests concurrently and return their results by name.
+
+    On the first failure the requests still in flight are cancelled, so a
+    failed ad set stops spending on results that would be thrown away, and
+    that failure is raised.
+    """
+    tasks = {name: asyncio.ensure_future(coroutine) for name, coroutine in coroutines.items()}
+    if not tasks:
+        return {}
+    try:
+        await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        pending = [task for task in tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+    for task in tasks.values():
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return {name: task.result() for name, task in tasks.items()}
+
+def generate_ad_set(
+    api_key: str,
+    image: Optional[bytes] = None,
+    prompt: Optional[str] = None,
+    config: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    """
+    Generate a set of product ads based on configuration.
+
+    Blocking wrapper around generate_ad_set_async for callers without an
+    event loop, such as a Streamlit script run.
+    """
+    async def _run():
+        try:
+            return await generate_ad_set_async(api_key, image, prompt, config)
+        finally:
+            await close_async_client()
+
+    return asyncio.run(_run())